@@ -0,0 +1,133 @@
+import datetime
+import fcntl
+import json
+import os
+import struct
+import threading
+import zlib
+
+# Append-only journal of activity records that have been accepted but not committed yet.
+# Each entry is a little-endian (payload length, CRC-32 of payload) header followed by the
+# record as UTF-8 JSON. A torn write at the end of the file (the app was killed mid-append)
+# fails the length or checksum test and ends the replay there.
+
+_HEADER = struct.Struct("<II")
+_TIMESTAMP_FIELDS = ("timestamp",)
+
+
+def _encode(record: dict) -> bytes:
+    payload = dict(record)
+    for field in _TIMESTAMP_FIELDS:
+        if isinstance(payload.get(field), datetime.datetime):
+            payload[field] = payload[field].isoformat()
+    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(data), zlib.crc32(data)) + data
+
+
+def _decode(data: bytes) -> dict:
+    record = json.loads(data.decode("utf-8"))
+    for field in _TIMESTAMP_FIELDS:
+        if record.get(field) is not None:
+            record[field] = datetime.datetime.fromisoformat(record[field])
+    return record
+
+
+def read_journal(path: str):
+    """Returns (records, valid_bytes, total_bytes) for the journal at path."""
+    if not os.path.exists(path):
+        return [], 0, 0
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, checksum = _HEADER.unpack_from(data, offset)
+        start, end = offset + _HEADER.size, offset + _HEADER.size + length
+        if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+            break
+        try:
+            records.append(_decode(data[start:end]))
+        except ValueError: # Checksum matched but the payload is not a record; treat as the end
+            break
+        offset = end
+    return records, offset, len(data)
+
+
+class JournalLocked(OSError):
+    """Another process (normally the running app) owns the journal."""
+
+
+class ActivityJournal:
+    """
+    One sequential write per record, made before the record is queued for the database.
+    write() hands the bytes to the OS, which survives the app being force-quit; pass
+    fsync=True to also survive power loss at the cost of a disk flush per record.
+
+    The journal is owned by one process at a time: opening it takes an exclusive lock
+    on the file, held until close(), and raises JournalLocked if another process has it.
+
+    append() returns the journal offset just past the record; a writer that has
+    committed every record up to an offset passes it to checkpoint(). What the file held
+    when it was opened (records not replayed yet) is kept until clear().
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            self._file.close()
+            raise JournalLocked(f"The activity journal {path} is in use by another process") from e
+        self._file.seek(0, os.SEEK_END)
+        self._kept_end = self._file.tell() # Checkpoints truncate to here, never below
+        self.appended_count = 0 # Records appended by this process
+        self.checkpoint_count = 0
+
+    def append(self, record: dict) -> int:
+        entry = _encode(record)
+        with self._lock:
+            self._file.write(entry)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.appended_count += 1
+            return self._file.tell()
+
+    def checkpoint(self, committed_offset: int, retained=()):
+        """
+        Truncates the records appended since the last checkpoint once committed_offset,
+        the end of the last record committed (or given up on), reaches the end of the
+        file, then writes back the retained records (ones that could not be committed,
+        for the next launch to replay). Returns the new end of the journal, or None if
+        records after committed_offset are still pending.
+        """
+        with self._lock:
+            end = self._file.tell()
+            if committed_offset < end or end <= self._kept_end:
+                return None
+            self._file.seek(self._kept_end)
+            self._file.truncate()
+            for record in retained:
+                self._file.write(_encode(record))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._kept_end = self._file.tell()
+            self.checkpoint_count += 1
+            return self._kept_end
+
+    def clear(self):
+        """Empties the journal (after replaying it)."""
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._kept_end = 0
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,204 @@
+import queue
+import threading
+import time
+
+# Group-commit thresholds: a batch is committed once it holds DEFAULT_BATCH_SIZE
+# records or once DEFAULT_FLUSH_INTERVAL seconds have passed since its first record.
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 5.0 # seconds
+MAX_COMMIT_ATTEMPTS = 3 # A batch that keeps failing is dropped after this many tries
+
+_STOP = object() # Sentinel telling the worker thread to exit
+
+
+class _FlushRequest:
+    # Queued by flush(); released once everything queued before it is committed (ok) or dropped
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+    def release(self, ok: bool):
+        self.ok = ok
+        self.done.set()
+
+
+class ActivityWriter:
+    """
+    Buffers activity records in memory and commits them in batches from a single
+    background thread, which owns its own connection for the writer's lifetime.
+
+    `write_batch(connection, records)` performs the actual inserts; the writer
+    only decides when to call it and commits afterwards. With a journal (see
+    activity_journal.py), every record is appended to it before it is queued, together
+    with its journal offset. After each commit the journal is emptied if the committed
+    offset reaches its end; records dropped after failed commits are written back.
+    """
+
+    def __init__(self, engine, write_batch, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, journal=None):
+        self.engine = engine
+        self.write_batch = write_batch
+        self.journal = journal
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.committed_count = 0
+        self.batch_count = 0
+        self.dropped_count = 0
+        self._journal_offset = 0 # Journal offset up to which every record is committed or retained
+        self._retained = [] # Dropped journaled records to write back at the next checkpoint
+        self._enqueue_lock = threading.Lock() # Keeps queue order the same as journal order
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="ActivityWriter", daemon=True)
+            self._thread.start()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def enqueue(self, record: dict):
+        """Queues a record for the next batch. Never touches the database."""
+        with self._enqueue_lock:
+            offset = None
+            if self.journal is not None:
+                try:
+                    offset = self.journal.append(record)
+                except (OSError, ValueError) as e: # Still queue it; only crash safety is lost
+                    print(f"ActivityWriter: could not journal activity record: {e}")
+            self._queue.put((record, offset))
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Commits everything queued so far. Returns False if the timeout expired first or
+        if records had to be dropped because their commit kept failing.
+        """
+        if not self.is_running():
+            return self._queue.empty()
+        request = _FlushRequest()
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            return False
+        return request.ok
+
+    def stop(self, timeout: float = None):
+        """Commits pending records and stops the worker thread."""
+        if not self.is_running():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        connection = self.engine.connect()
+        pending = [] # (record, journal offset or None)
+        waiters = [] # Flush requests waiting for pending to be committed
+        failed_attempts = 0
+        batch_started_at = None
+        try:
+            while True:
+                if pending:
+                    wait = max(0.0, batch_started_at + self.flush_interval - time.monotonic())
+                else:
+                    wait = None
+                try:
+                    item = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None # Time threshold reached
+
+                stopping = False
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                elif item is not None:
+                    if not pending:
+                        batch_started_at = time.monotonic()
+                    pending.append(item)
+
+                # Drain whatever else is already queued without blocking
+                while len(pending) < self.batch_size:
+                    try:
+                        extra = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if extra is _STOP:
+                        stopping = True
+                    elif isinstance(extra, _FlushRequest):
+                        waiters.append(extra)
+                    else:
+                        if not pending:
+                            batch_started_at = time.monotonic()
+                        pending.append(extra)
+
+                due = (len(pending) >= self.batch_size or item is None or waiters or stopping or
+                       (pending and time.monotonic() - batch_started_at >= self.flush_interval))
+                dropped = False
+                if pending and due:
+                    if self._commit(connection, pending):
+                        pending = []
+                        failed_attempts = 0
+                    else:
+                        failed_attempts += 1
+                        if failed_attempts >= MAX_COMMIT_ATTEMPTS:
+                            print(f"ActivityWriter: dropping {len(pending)} activity records after {failed_attempts} failed commits.")
+                            self.dropped_count += len(pending)
+                            self._retain(pending)
+                            pending = []
+                            failed_attempts = 0
+                            dropped = True
+                        else:
+                            batch_started_at = time.monotonic() # Back off for one interval before retrying
+
+                if stopping and pending:
+                    print(f"ActivityWriter: {len(pending)} activity records could not be committed before shutdown.")
+                    self.dropped_count += len(pending)
+                    pending = [] # Still in the journal, which is not checkpointed again
+                    dropped = True
+                # Waiters stay queued while a failed batch is retried
+                if dropped or not pending:
+                    for waiter in waiters:
+                        waiter.release(not dropped)
+                    waiters = []
+                if stopping:
+                    break
+        finally:
+            for waiter in waiters: # The thread died; nothing more will be committed
+                waiter.release(False)
+            connection.close()
+
+    def _retain(self, entries):
+        # Dropped records go back into the journal so the next launch can replay them
+        self._retained.extend(record for record, offset in entries if offset is not None)
+        self._advance_journal(entries)
+
+    def _advance_journal(self, entries):
+        offsets = [offset for _, offset in entries if offset is not None]
+        if offsets:
+            self._journal_offset = max(self._journal_offset, max(offsets))
+
+    def _commit(self, connection, entries) -> bool:
+        records = [record for record, _ in entries]
+        try:
+            self.write_batch(connection, records)
+            connection.commit()
+        except Exception as e: # Never let one bad batch kill the writer thread
+            connection.rollback()
+            print(f"ActivityWriter: error committing {len(records)} activity records: {e}")
+            return False
+        self.committed_count += len(records)
+        self.batch_count += 1
+        self._advance_journal(entries)
+        if self.journal is not None:
+            try:
+                end = self.journal.checkpoint(self._journal_offset, self._retained)
+            except (OSError, ValueError) as e:
+                print(f"ActivityWriter: could not checkpoint the activity journal: {e}")
+            else:
+                if end is not None:
+                    self._journal_offset = end # Offsets restart after the retained records
+                    self._retained = []
+        return True
@@ -0,0 +1,233 @@
+import contextlib
+import datetime
+import os
+import stat
+import urllib.parse
+
+from sqlalchemy import create_engine, select, insert, delete, func, case, MetaData
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import URL
+
+from src.database.models import ActivityLog, ActivitySpan, ArchivePartition
+
+# Time partitioning of the raw activity tables. Whole months older than the archive age
+# move from the hot database into .data/archive/activity_YYYY-MM.db (their activity_logs
+# and activity_spans rows, ids unchanged); everything derived from them (daily rollup,
+# goal ledger, interned strings) stays in the hot file. archive_partitions records each
+# file with the time range its spans cover, so a read attaches only the months its range
+# touches. Attached months are exposed under the usual table names through TEMP views
+# (temp shadows main for unqualified names), so existing statements run unchanged.
+#
+# A month whose newest log of a project still had an open span keeps that log hot and is
+# recorded as partial: later runs move the rest into the same file once the span has
+# closed, and the file is only compacted (made read-only) when the month is complete.
+
+ARCHIVE_DIR_NAME = "archive"
+DEFAULT_ARCHIVE_AFTER_DAYS = 90 # Raw activity older than this moves to monthly archive files
+ATTACH_LIMIT = 10 # SQLite's default SQLITE_MAX_ATTACHED; reads needing more go in groups
+
+ARCHIVED_TABLES = (ActivityLog.__table__, ActivitySpan.__table__)
+_TARGET_SCHEMA = "archive_target"
+
+
+def month_of(timestamp: datetime.datetime) -> str:
+    return timestamp.strftime("%Y-%m")
+
+
+def month_bounds(month: str):
+    """[start, end) of a "YYYY-MM" month."""
+    start = datetime.datetime.strptime(month, "%Y-%m")
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def file_name(month: str) -> str:
+    return f"activity_{month}.db"
+
+
+def horizon(connection):
+    """End of the newest archived month: raw activity before it lives in archive files. None before any archiving."""
+    month = connection.execute(select(func.max(ArchivePartition.month))).scalar()
+    return month_bounds(month)[1] if month else None
+
+
+def load_partitions(connection):
+    """Every archived month as (month, file_name, compacted, first_timestamp, last_end), newest first."""
+    return [tuple(row) for row in connection.execute(select(
+        ArchivePartition.month, ArchivePartition.file_name, ArchivePartition.compacted,
+        ArchivePartition.first_timestamp, ArchivePartition.last_end
+    ).order_by(ArchivePartition.month.desc()))]
+
+
+def select_partitions(partitions, start: datetime.datetime = None, end: datetime.datetime = None):
+    """The partitions with spans overlapping [start, end] (open-ended when None)."""
+    return [
+        partition for partition in partitions
+        if (end is None or partition[3] <= end) and (start is None or partition[4] is None or partition[4] > start)
+    ]
+
+
+def groups(partitions):
+    """Splits partitions (newest first) into groups that can be attached at once."""
+    return [partitions[i:i + ATTACH_LIMIT] for i in range(0, len(partitions), ATTACH_LIMIT)]
+
+
+def _schema(month: str) -> str:
+    return "archive_" + month.replace("-", "_")
+
+
+def _set_query_only(connection, value):
+    connection.exec_driver_sql(f"PRAGMA query_only = {int(value)}")
+
+
+@contextlib.contextmanager
+def attached(connection, partitions, archive_dir: str, include_main: bool = False, uri: bool = True):
+    """
+    Attaches the partitions (read-only) to connection and shadows activity_logs and
+    activity_spans with TEMP views over them, plus the hot tables with include_main.
+    Commit before leaving: the views are dropped and the files detached on exit. uri:
+    the connection was opened with URI filenames enabled (as the read engine is).
+    """
+    if not partitions:
+        yield connection
+        return
+    schemas = []
+    query_only = connection.exec_driver_sql("PRAGMA query_only").scalar()
+    try:
+        for month, name, compacted, *_ in partitions:
+            path = os.path.join(archive_dir, name)
+            if uri:
+                # Compacted months never change again, so SQLite can skip locking them
+                path = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro" + ("&immutable=1" if compacted else "")
+            connection.exec_driver_sql(f"ATTACH DATABASE ? AS {_schema(month)}", (path,))
+            schemas.append(_schema(month))
+        sources = (["main"] if include_main else []) + schemas
+        _set_query_only(connection, False) # TEMP views only; the read engine opens the files read-only anyway
+        for table in ARCHIVED_TABLES:
+            columns = ", ".join(column.name for column in table.columns)
+            union = " UNION ALL ".join(f"SELECT {columns} FROM {source}.{table.name}" for source in sources)
+            connection.exec_driver_sql(f"CREATE TEMP VIEW {table.name} AS {union}")
+        _set_query_only(connection, query_only)
+        yield connection
+    finally:
+        try:
+            if connection.in_transaction():
+                connection.rollback()
+            _set_query_only(connection, False)
+            for table in ARCHIVED_TABLES:
+                connection.exec_driver_sql(f"DROP VIEW IF EXISTS temp.{table.name}")
+            _set_query_only(connection, query_only)
+            for schema in schemas:
+                connection.exec_driver_sql(f"DETACH DATABASE {schema}")
+            if connection.in_transaction():
+                connection.commit()
+        except Exception:
+            # A pooled connection must never keep the views; discard it instead
+            connection.invalidate()
+            raise
+
+
+def _create_file(path: str):
+    archive_engine = create_engine(URL.create("sqlite", database=path))
+    try:
+        for table in ARCHIVED_TABLES:
+            table.create(archive_engine, checkfirst=True)
+    finally:
+        archive_engine.dispose()
+
+
+def _open_span_logs():
+    # The newest log of each project stays hot while its span is open: the project's next
+    # log closes it, and span maintenance only ever looks in the hot database
+    return select(ActivitySpan.log_id).where(ActivitySpan.end_time == None)
+
+
+def archive_month(connection, archive_dir: str, month: str) -> int:
+    """
+    Moves one month of raw activity from the hot database (connection) into its archive
+    file and records it, adding to the file of a partially archived month. The copy,
+    the delete of the hot rows and registering the partition are one transaction, so
+    readers see each row in exactly one place; the copy is idempotent, so a run cut
+    short is finished by the next one. Returns the number of logs moved.
+    """
+    start, end = month_bounds(month)
+    path = os.path.join(archive_dir, file_name(month))
+    os.makedirs(archive_dir, exist_ok=True)
+    if os.path.exists(path) and not os.stat(path).st_mode & stat.S_IWUSR:
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH) # Compacted before partial months were kept writable
+    _create_file(path)
+    target = MetaData()
+    target_logs, target_spans = (table.to_metadata(target, schema=_TARGET_SCHEMA) for table in ARCHIVED_TABLES)
+    in_month = (ActivityLog.timestamp >= start, ActivityLog.timestamp < end)
+    month_logs = select(ActivityLog.id).where(*in_month, ActivityLog.id.not_in(_open_span_logs()))
+    moved = 0
+
+    connection.exec_driver_sql(f"ATTACH DATABASE ? AS {_TARGET_SCHEMA}", (path,))
+    try:
+        log_columns = [column.name for column in ActivityLog.__table__.columns]
+        span_columns = [column.name for column in ActivitySpan.__table__.columns]
+        connection.execute(insert(target_logs).prefix_with("OR IGNORE").from_select(
+            log_columns, select(*ActivityLog.__table__.columns).where(ActivityLog.id.in_(month_logs))))
+        connection.execute(insert(target_spans).prefix_with("OR IGNORE").from_select(
+            span_columns, select(*ActivitySpan.__table__.columns).where(ActivitySpan.log_id.in_(month_logs))))
+        # One transaction from the copy to the delete: readers of a partial month, whose
+        # file is already attached, never see a row both in it and in the hot tables
+
+        first_timestamp, log_count = connection.execute(
+            select(func.min(target_logs.c.timestamp), func.count()).select_from(target_logs)).first()
+        last_end, span_count, open_spans = connection.execute(select(
+            func.max(target_spans.c.end_time), func.count(), func.sum(case((target_spans.c.end_time == None, 1), else_=0))
+        )).first()
+        if span_count < log_count:
+            open_spans = 1 # Spans still being backfilled: treat the month as reaching up to now
+        if log_count:
+            connection.execute(delete(ActivitySpan).where(ActivitySpan.log_id.in_(month_logs)))
+            moved = connection.execute(delete(ActivityLog).where(ActivityLog.id.in_(month_logs))).rowcount
+            still_hot = connection.execute(select(ActivityLog.id).where(*in_month).limit(1)).first() is not None
+            partition = {
+                "month": month, "file_name": file_name(month), "first_timestamp": first_timestamp,
+                "last_end": None if open_spans else last_end, "log_count": log_count,
+                "archived_at": datetime.datetime.now(), "compacted": False, "partial": still_hot,
+            }
+            upsert = sqlite_insert(ArchivePartition.__table__).values(**partition)
+            connection.execute(upsert.on_conflict_do_update(
+                index_elements=["month"], set_={key: upsert.excluded[key] for key in partition if key != "month"}))
+        connection.commit()
+    finally:
+        if connection.in_transaction():
+            connection.rollback()
+        connection.exec_driver_sql(f"DETACH DATABASE {_TARGET_SCHEMA}")
+    if not log_count:
+        os.remove(path) # Nothing logged that month
+    return moved
+
+
+def compact(archive_dir: str, name: str):
+    """Vacuums an archive file, drops its journal and makes it read-only."""
+    path = os.path.join(archive_dir, name)
+    archive_engine = create_engine(URL.create("sqlite", database=path))
+    try:
+        with archive_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as archive_connection:
+            archive_connection.exec_driver_sql("PRAGMA journal_mode = DELETE")
+            archive_connection.exec_driver_sql("VACUUM")
+    finally:
+        archive_engine.dispose()
+    os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+def months_to_archive(connection, cutoff: datetime.datetime):
+    """
+    Months that ended on or before cutoff with raw activity in the hot database that is
+    not archived yet: new months and the rest of partially archived ones, oldest first.
+    """
+    first = connection.execute(select(func.min(ActivityLog.timestamp)).where(ActivityLog.id.not_in(_open_span_logs()))).scalar()
+    archived = set(connection.execute(select(ArchivePartition.month).where(ArchivePartition.partial == False)).scalars())
+    months = []
+    if first is None:
+        return months
+    month = month_of(first)
+    while month_bounds(month)[1] <= cutoff:
+        if month not in archived:
+            months.append(month)
+        month = month_of(month_bounds(month)[1])
+    return months
@@ -0,0 +1,244 @@
+import datetime
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+import urllib.parse
+
+# Online snapshots of the live database through SQLite's backup API. The copy runs in
+# small page steps on its own read-only connection, sleeping between steps so the disk
+# stays available to the tracker. Under WAL the copy's read transaction never blocks
+# the writer; holding it for the whole copy pins one consistent snapshot (without it,
+# every commit from the tracker would restart the backup from the first page). The WAL
+# cannot be checkpointed past that snapshot until the copy finishes, so it grows a
+# little during long backups.
+
+BACKUP_DIR_NAME = "backups"
+STATUS_FILE = "backup_status.json" # Last known state of the job, readable from another process
+DEFAULT_PAGES_PER_STEP = 256 # 1 MiB per step with 4 KiB pages
+DEFAULT_STEP_PAUSE = 0.01 # seconds between steps
+DEFAULT_KEEP_BACKUPS = 5 # Snapshots kept; older ones are deleted after each successful backup
+DEFAULT_BACKUP_INTERVAL = 6 * 3600 # seconds between scheduled backups, None for on-demand only
+STATUS_WRITE_INTERVAL = 1.0 # seconds between progress updates of the status file
+STALE_PARTIAL_SECONDS = 3600 # A .partial file untouched this long was left by a crash; newer ones may be in progress
+
+_PARTIAL_SUFFIX = ".partial"
+
+
+class BackupCancelled(Exception):
+    pass
+
+
+class BackupJob:
+    """
+    Takes rotating snapshots of database_path into backup_dir from a background
+    thread, on a schedule (interval seconds) and whenever request() is called.
+    Snapshots are named <database>_YYYYmmdd-HHMMSS-ffffff.db (with a -N suffix if that
+    name is taken) and written under a .partial name first, so a snapshot that exists
+    is always complete. The .partial file is created exclusively, so backups started
+    at the same moment (the app and manage.py backup) never share a name. Compacted (read-only)
+    archive files from archive_dir do not change, so they are copied once into
+    backup_dir/archive/ and shared by every snapshot (copied again if one is modified later).
+    """
+
+    def __init__(self, database_path: str, backup_dir: str, archive_dir: str = None,
+                 interval: float = DEFAULT_BACKUP_INTERVAL, keep: int = DEFAULT_KEEP_BACKUPS,
+                 pages_per_step: int = DEFAULT_PAGES_PER_STEP, step_pause: float = DEFAULT_STEP_PAUSE):
+        self.database_path = database_path
+        self.backup_dir = backup_dir
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.keep = max(1, keep)
+        self.pages_per_step = max(1, pages_per_step)
+        self.step_pause = max(0.0, step_pause)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock() # One backup at a time, scheduled or not
+        self._requested = threading.Event()
+        self._stopping = False
+        self._status_written_at = 0.0
+        self.backup_count = 0
+        self.failed_count = 0
+        self._status = {
+            "state": "idle", "started_at": None, "finished_at": None, "pages_copied": 0, "page_count": 0,
+            "last_backup": None, "last_size": None, "last_seconds": None, "last_error": None,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="BackupJob", daemon=True)
+            self._thread.start()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def request(self):
+        """Asks the background thread for a backup as soon as possible (starting the thread if needed)."""
+        self._requested.set()
+        self.start()
+
+    def stop(self, timeout: float = None):
+        """Stops the thread, cancelling a backup in progress (its partial file is removed)."""
+        if not self.is_running():
+            return
+        self._stopping = True
+        self._requested.set()
+        self._thread.join(timeout)
+
+    def status(self) -> dict:
+        with self._lock:
+            status = dict(self._status)
+        status.update(running=self.is_running(), backup_count=self.backup_count, failed_count=self.failed_count,
+                      backup_dir=self.backup_dir, interval=self.interval)
+        return status
+
+    def snapshots(self):
+        """Complete snapshots in backup_dir, oldest first."""
+        prefix = self._prefix()
+        try:
+            names = os.listdir(self.backup_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.backup_dir, name) for name in names
+                      if name.startswith(prefix) and name.endswith(".db"))
+
+    def run_once(self):
+        """Takes one snapshot in the calling thread. Returns its path, or None if it failed."""
+        with self._run_lock:
+            return self._backup()
+
+    def _run(self):
+        while not self._stopping:
+            self._requested.wait(self.interval)
+            if self._stopping:
+                break
+            self._requested.clear()
+            self.run_once()
+
+    def _prefix(self) -> str:
+        return os.path.splitext(os.path.basename(self.database_path))[0] + "_"
+
+    def _update(self, write: bool = True, **values):
+        with self._lock:
+            self._status.update(values)
+            status = dict(self._status)
+        if write:
+            self._status_written_at = time.monotonic()
+            try:
+                with open(os.path.join(self.backup_dir, STATUS_FILE), "w", encoding="utf-8") as f:
+                    json.dump(status, f, default=str, indent=1)
+            except OSError as e: # The status file is informational only
+                print(f"BackupJob: could not write the backup status: {e}")
+
+    def _progress(self, status, remaining, page_count):
+        # Called by SQLite after every step; the pause is what leaves the disk to the tracker
+        if self._stopping:
+            raise BackupCancelled()
+        due = time.monotonic() - self._status_written_at >= STATUS_WRITE_INTERVAL
+        self._update(write=due, pages_copied=page_count - remaining, page_count=page_count)
+        if remaining and self.step_pause:
+            time.sleep(self.step_pause)
+
+    def _remove_stale_partials(self):
+        # Left behind by a crash; another process's backup in progress keeps its file fresh
+        for name in os.listdir(self.backup_dir):
+            path = os.path.join(self.backup_dir, name)
+            try:
+                if name.endswith(_PARTIAL_SUFFIX) and time.time() - os.path.getmtime(path) > STALE_PARTIAL_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _reserve_path(self):
+        # Creates the snapshot's .partial file exclusively and returns the snapshot path
+        stamp = self._prefix() + datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        for attempt in itertools.count():
+            path = os.path.join(self.backup_dir, stamp + (f"-{attempt}" if attempt else "") + ".db")
+            if os.path.exists(path):
+                continue
+            try:
+                os.close(os.open(path + _PARTIAL_SUFFIX, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            return path
+
+    def _backup(self):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        self._remove_stale_partials()
+        started = time.monotonic()
+        path = self._reserve_path()
+        partial = path + _PARTIAL_SUFFIX
+        self._update(state="running", started_at=datetime.datetime.now(), finished_at=None, pages_copied=0,
+                     page_count=0, last_error=None)
+        source = destination = None
+        try:
+            source = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(self.database_path))}?mode=ro",
+                                     uri=True, isolation_level=None)
+            destination = sqlite3.connect(partial, isolation_level=None)
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone() # Starts the read snapshot
+            source.backup(destination, pages=self.pages_per_step, progress=self._progress)
+            source.execute("COMMIT")
+            destination.execute("PRAGMA journal_mode = DELETE") # A single self-contained file
+            destination.close()
+            destination = None
+            os.replace(partial, path)
+            self._copy_archives()
+            self._rotate()
+        except (sqlite3.Error, OSError, BackupCancelled) as e:
+            cancelled = isinstance(e, BackupCancelled)
+            if not cancelled:
+                self.failed_count += 1
+                print(f"BackupJob: backup of {self.database_path} failed: {e}")
+            if destination is not None:
+                destination.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+            self._update(state="cancelled" if cancelled else "failed", finished_at=datetime.datetime.now(),
+                         last_error=None if cancelled else str(e))
+            return None
+        finally:
+            if source is not None:
+                source.close()
+        self.backup_count += 1
+        seconds = time.monotonic() - started
+        self._update(state="idle", finished_at=datetime.datetime.now(), last_backup=path,
+                     last_size=os.path.getsize(path), last_seconds=round(seconds, 3))
+        print(f"Backed up the database to {path} in {seconds:.1f}s.")
+        return path
+
+    def _copy_archives(self):
+        if not self.archive_dir or not os.path.isdir(self.archive_dir):
+            return
+        target_dir = os.path.join(self.backup_dir, "archive")
+        for name in os.listdir(self.archive_dir):
+            source_path = os.path.join(self.archive_dir, name)
+            target_path = os.path.join(target_dir, name)
+            source_stat = os.stat(source_path)
+            if source_stat.st_mode & stat.S_IWUSR:
+                continue # Still writable (not compacted yet, or partially archived)
+            if os.path.exists(target_path) and os.path.getmtime(target_path) >= source_stat.st_mtime:
+                continue # Already copied, and not reopened for more rows since
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.copyfile(source_path, target_path + _PARTIAL_SUFFIX)
+            os.replace(target_path + _PARTIAL_SUFFIX, target_path)
+
+    def _rotate(self):
+        for path in self.snapshots()[:-self.keep]:
+            os.remove(path)
+
+
+def read_status(backup_dir: str):
+    """The status last written by a BackupJob using backup_dir (e.g. the running app's), or None."""
+    try:
+        with open(os.path.join(backup_dir, STATUS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
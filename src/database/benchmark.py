@@ -0,0 +1,240 @@
+"""
+Times the public database_handler functions against a synthetic history and writes
+the results as JSON, optionally failing on regressions against an earlier run.
+
+    python -m src.database.benchmark --rows 1m --db /tmp/tracker_1m.db --output bench_1m.json
+    python -m src.database.benchmark --rows 1m --db /tmp/tracker_1m.db --baseline bench_1m.json
+
+The dataset is generated on first use and reused while its row count matches. Write
+benchmarks run against a scratch copy of it, so they never add rows to the dataset the
+read benchmarks (of this and later runs) measure.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import sqlalchemy
+
+from src.database import database_handler, synthetic
+from src.database.models import ActivityLog, Goal
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25 # A median more than 25% slower than the baseline is a regression
+
+
+def _time_call(function, repeat: int, before=None):
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def _dataset_facts():
+    with database_handler.engine.connect() as connection:
+        rows, first, last = connection.execute(sqlalchemy.select(
+            sqlalchemy.func.count(ActivityLog.id), sqlalchemy.func.min(ActivityLog.timestamp), sqlalchemy.func.max(ActivityLog.timestamp)
+        )).first()
+        busiest_goal, busiest_project = connection.execute(
+            sqlalchemy.select(ActivityLog.goal_id, ActivityLog.project_id).group_by(ActivityLog.goal_id, ActivityLog.project_id)
+            .order_by(sqlalchemy.func.count().desc()).limit(1)
+        ).first() or (None, None)
+    return {"rows": rows, "first": first, "last": last, "goal_id": busiest_goal, "project_id": busiest_project}
+
+
+def _ensure_dataset(rows: int, profile):
+    facts = _dataset_facts()
+    if facts["rows"] >= rows:
+        return facts
+    print(f"Generating {rows - facts['rows']} synthetic activity rows...")
+    synthetic.populate(rows - facts["rows"], profile)
+    return _dataset_facts()
+
+
+def benchmark_cases(facts):
+    """(name, function, before) for every public query function."""
+    project_id, goal_id = facts["project_id"], facts["goal_id"]
+    last_day = facts["last"].date()
+    day_start = datetime.datetime.combine(last_day, datetime.time.min)
+    week_start = day_start - datetime.timedelta(days=6)
+    month_start = day_start - datetime.timedelta(days=29)
+    day_end = day_start + datetime.timedelta(days=1)
+    year_back = max(facts["first"], day_start - datetime.timedelta(days=365)) + datetime.timedelta(hours=10)
+    uncached = lambda: database_handler.read_cache.invalidate()
+
+    cases = [
+        ("get_all_projects", lambda: database_handler.get_all_projects(), uncached),
+        ("get_all_projects (cached)", lambda: database_handler.get_all_projects(), None),
+        ("get_project_by_id", lambda: database_handler.get_project_by_id(project_id), uncached),
+        ("get_active_goal", lambda: database_handler.get_active_goal(), uncached),
+        ("get_active_goal (cached)", lambda: database_handler.get_active_goal(), None),
+        ("get_goal_by_id", lambda: database_handler.get_goal_by_id(goal_id), uncached),
+        ("get_goals_for_project", lambda: database_handler.get_goals_for_project(project_id, include_completed=True), None),
+        ("get_project_records", lambda: database_handler.get_project_records(), uncached),
+        ("get_goal_records_for_project", lambda: database_handler.get_goal_records_for_project(project_id, True), None),
+        ("get_goal_records_for_active_projects", lambda: database_handler.get_goal_records_for_active_projects(), None),
+        ("get_activity_logs_for_day", lambda: database_handler.get_activity_logs_for_day(last_day), None),
+        ("get_activity_logs_for_day (project)", lambda: database_handler.get_activity_logs_for_day(last_day, project_id), None),
+        ("get_activity_records_for_day", lambda: database_handler.get_activity_records_for_day(last_day), None),
+        ("get_activity_spans_for_day", lambda: database_handler.get_activity_spans_for_day(last_day), None),
+        ("get_activity_spans_for_range (a year back)",
+         lambda: database_handler.get_activity_spans_for_range(year_back, year_back + datetime.timedelta(hours=8)), None),
+        ("get_activity_at (a year back)", lambda: database_handler.get_activity_at(year_back), None),
+        ("get_activity_logs_for_goal", lambda: database_handler.get_activity_logs_for_goal(goal_id), None),
+        ("get_activity_logs_for_project", lambda: database_handler.get_activity_logs_for_project(project_id), None),
+        ("get_activity_logs_page", lambda: database_handler.get_activity_logs_page(project_id=project_id, limit=100), None),
+        ("iter_activity_logs_for_day", lambda: sum(1 for _ in database_handler.iter_activity_logs_for_day(last_day)), None),
+        ("get_aggregated_activity_by_app (day)",
+         lambda: database_handler.get_aggregated_activity_by_app(project_id, day_start, day_end), None),
+        ("get_aggregated_activity_by_app (7 days)",
+         lambda: database_handler.get_aggregated_activity_by_app(project_id, week_start, day_end), None),
+        ("get_aggregated_activity_by_app (partial day)",
+         lambda: database_handler.get_aggregated_activity_by_app(project_id, day_start + datetime.timedelta(hours=9), day_end), None),
+        ("get_aggregated_activity_by_project (30 days)",
+         lambda: database_handler.get_aggregated_activity_by_project(month_start, day_end), None),
+        ("search_activity (30 days)", lambda: database_handler.search_activity("document 7", month_start, day_end), None),
+        ("search_activity (all history)", lambda: database_handler.search_activity('"document 42"'), None),
+    ]
+    return cases
+
+
+def write_benchmark_cases(facts):
+    """(name, function, before) for every public write function."""
+    project_id, goal_id = facts["project_id"], facts["goal_id"]
+    cases = [
+        ("add_activity_log", lambda: database_handler.add_activity_log(goal_id, project_id, "Benchmark", "Benchmark window"), None),
+        ("enqueue_activity + flush", lambda: (database_handler.enqueue_activity(goal_id, project_id, "Benchmark", "Benchmark window"),
+                                              database_handler.flush_activity_writer()), None),
+    ]
+    return cases
+
+
+def _run_cases(cases, repeat: int, only, results):
+    for name, function, before in cases:
+        if only and not any(part in name for part in only):
+            continue
+        function() # Warm-up: fills caches and the statement cache, as in a running app
+        results[name] = _time_call(function, repeat, before)
+        print(f"{name:<48} median {results[name]['median_ms']:>10.3f} ms   p95 {results[name]['p95_ms']:>10.3f} ms")
+
+
+def _scratch_copy(database_path: str, directory: str) -> str:
+    # A consistent copy through SQLite's backup API, with the schema version and migrations of the original
+    path = os.path.join(directory, os.path.basename(database_path))
+    source = sqlite3.connect(database_path)
+    destination = sqlite3.connect(path)
+    try:
+        source.backup(destination)
+    finally:
+        destination.close()
+        source.close()
+    return path
+
+
+def run(rows: int, profile, repeat: int = DEFAULT_REPEAT, only=None):
+    """
+    Times the read benchmarks against the open database (generating the dataset if
+    needed), then reopens a scratch copy of it for the write benchmarks.
+    """
+    facts = _ensure_dataset(rows, profile)
+    results = {}
+    _run_cases(benchmark_cases(facts), repeat, only, results)
+    pragmas = dict(database_handler.sqlite_pragmas)
+    database_path = database_handler.engine.url.database
+    writes = [case for case in write_benchmark_cases(facts) if not only or any(part in case[0] for part in only)]
+    if writes:
+        database_handler.close_db()
+        scratch_dir = tempfile.mkdtemp(prefix="tracker_benchmark_")
+        try:
+            database_handler.init_db(database_path=_scratch_copy(database_path, scratch_dir))
+            _run_cases(writes, repeat, only, results)
+            database_handler.close_db()
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        database_handler.init_db(database_path=database_path)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "rows": facts["rows"],
+            "history": [facts["first"].isoformat(), facts["last"].isoformat()],
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "pragmas": pragmas,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance: float = DEFAULT_TOLERANCE):
+    """Returns [(name, baseline_ms, current_ms)] for benchmarks whose median grew by more than tolerance."""
+    regressions = []
+    for name, result in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and result["median_ms"] > previous["median_ms"] * (1 + tolerance):
+            regressions.append((name, previous["median_ms"], result["median_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Productivity Tracker database layer")
+    parser.add_argument("--db", required=True, help="Benchmark database file, generated if missing or too small")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per function")
+    parser.add_argument("--only", action="append", help="Only run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative slowdown of the median")
+    synthetic.add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    database_handler.init_db(database_path=args.db)
+    # The active goal is one of the synthetic ones, as it would be while tracking
+    with database_handler.engine.begin() as connection:
+        if connection.execute(sqlalchemy.select(Goal.id).where(Goal.is_active == True)).first() is None:
+            connection.execute(sqlalchemy.update(Goal).where(Goal.id == sqlalchemy.select(sqlalchemy.func.min(Goal.id)).scalar_subquery())
+                               .values(is_active=True))
+    report = run(args.rows, synthetic.profile_from_args(args), max(1, args.repeat), args.only)
+    database_handler.shutdown_activity_writer()
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Benchmark report written to {args.output}")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
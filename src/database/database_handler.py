@@ -1,14 +1,30 @@
 import sqlalchemy
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, func, ForeignKey, Text
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import URL
 from sqlalchemy.exc import SQLAlchemyError
 import datetime
 import os
 import time
+import urllib.parse
 import sys # Import sys
+from src.database.models import (
+    Base, Project, Goal, ActivityLog, ActivitySpan, DailyAppUsage, AppName, WindowTitle, DetailedContext, ArchivePartition
+)
+from src.database.activity_writer import ActivityWriter
+from src.database.activity_journal import ActivityJournal, JournalLocked, read_journal
+from src.database.interning import ActivityStringEncoder
+from src.database.read_cache import ReadCache
+from src.database.query_stats import QueryStats
+from src.database import rollup, spans, span_index, text_search, archive, backup, export, goal_time, sqlite_profile, fast_reads
+from src.database.migrations import add_span_interval_index, add_text_search
+from src.database.migrations.runner import run_migrations, applied_versions, wait_for_backfills
 
 # Define the database URL
 DATABASE_FILE = "productivity_tracker.db"
+JOURNAL_FILE = "activity_journal.bin" # Activity records not yet committed, replayed by the process that owns it
+SLOW_QUERY_LOG_FILE = "slow_queries.log" # JSON lines, see query_stats.py
+QUERY_STATS_FILE = "query_stats.json" # Written by dump_query_stats()
 
 # Determine PROJECT_ROOT based on whether the app is bundled by PyInstaller
 if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
@@ -19,59 +35,88 @@ else:
     PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 DATA_DIR = os.path.join(PROJECT_ROOT, ".data") 
-DATABASE_URL = f"sqlite:///{os.path.join(DATA_DIR, DATABASE_FILE)}"
-
-Base = declarative_base()
-
-class Project(Base):
-    __tablename__ = "projects"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, nullable=False, index=True)
-    created_at = Column(DateTime, default=func.now())
-    is_archived = Column(Boolean, default=False)
-    goals = relationship("Goal", back_populates="project", cascade="all, delete-orphan")
-    activity_logs = relationship("ActivityLog", back_populates="project", cascade="all, delete-orphan")
-
-class Goal(Base):
-    __tablename__ = "goals"
-    id = Column(Integer, primary_key=True, index=True)
-    text = Column(String, nullable=False)
-    created_at = Column(DateTime, default=func.now())
-    is_active = Column(Boolean, default=False, index=True) # Default to False, explicitly set one active
-    completed_at = Column(DateTime, nullable=True)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
-    project = relationship("Project", back_populates="goals")
-    activity_logs = relationship("ActivityLog", back_populates="goal", cascade="all, delete-orphan")
-    target_minutes = Column(Integer, nullable=True)  # Target time in minutes
-    time_spent_minutes = Column(Integer, default=0)  # Time spent in minutes
-    last_tracked_at = Column(DateTime, nullable=True)  # Last time tracking update
-
-class ActivityLog(Base):
-    __tablename__ = "activity_logs"
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=func.now(), index=True)
-    application_name = Column(String)
-    window_title = Column(Text) # Window titles can be long
-    detailed_context = Column(Text, nullable=True) # New column for URL/doc path
-    goal_id = Column(Integer, ForeignKey("goals.id"), nullable=False)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False) # Denormalized for easier queries
-    goal = relationship("Goal", back_populates="activity_logs")
-    project = relationship("Project", back_populates="activity_logs")
+# Built with URL.create: a path inside a URL string would be percent-decoded (breaking paths with '%')
+DATABASE_URL = URL.create("sqlite", database=os.path.join(DATA_DIR, DATABASE_FILE))
 
 engine = None
 SessionLocal = None
+read_engine = None # Separate read-only connection pool for UI/analytics queries
+ReadSessionLocal = None
+READ_POOL_SIZE = 4
+activity_writer = None # Background group-commit writer, started on first enqueue_activity()
+activity_journal = None # Crash-safety journal of the writer's queued records
+activity_journal_error = None # Why the journal could not be opened, reported once
+activity_encoder = None # Interns app names, window titles and contexts for activity_logs
+read_cache = None # Active goal, projects and goal lookups; see read_cache.py
+query_stats = None # Statement timings and the slow-query log for both engines
+sqlite_pragmas = {} # Effective PRAGMA values reported by SQLite after init_db()
+ready_indexes = set() # Migrations whose optional index (span intervals, FTS) is built; see _index_is_ready()
+backup_job = None # Online snapshots into .data/backups/; see backup.py
 
-def init_db():
-    global engine, SessionLocal
+def init_db(pragmas: dict = None, database_path: str = None):
+    """
+    Creates the engine and schema. pragmas overrides entries of the SQLite connection
+    profile (see sqlite_profile.DEFAULT_PRAGMAS); None as a value drops that PRAGMA.
+    database_path opens another database file (e.g. a benchmark dataset) instead of
+    the default; the activity journal is kept next to it.
+    """
+    global engine, SessionLocal, read_engine, ReadSessionLocal, activity_encoder, read_cache, query_stats, sqlite_pragmas
+    global DATA_DIR, DATABASE_URL
     if engine is None:
+        if database_path is not None:
+            DATA_DIR = os.path.dirname(os.path.abspath(database_path))
+            DATABASE_URL = URL.create("sqlite", database=os.path.abspath(database_path))
         os.makedirs(DATA_DIR, exist_ok=True)
-        print(f"Database will be initialized at: {DATABASE_URL}")
         engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+        print(f"Database will be initialized at: {engine.url.database}")
+        query_stats = QueryStats(slow_log_path=os.path.join(DATA_DIR, SLOW_QUERY_LOG_FILE))
+        query_stats.attach(engine, "write")
+        profile = sqlite_profile.resolve_pragmas(pragmas)
+        sqlite_profile.apply_profile(engine, profile)
+        with engine.connect() as connection:
+            sqlite_pragmas = sqlite_profile.effective_pragmas(connection, profile)
+        print(f"SQLite profile: {sqlite_profile.describe(sqlite_pragmas)}")
         Base.metadata.create_all(bind=engine)
+        with engine.connect() as connection:
+            rollup.load_span_cap(connection) # Before the backfills that build spans and the rollup
+        run_migrations(engine) # Schema changes now; long backfills continue in the background
         SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        activity_encoder = ActivityStringEncoder(engine)
+
+        # Readers get their own pooled, read-only connections. Under WAL each read session sees
+        # a consistent snapshot and never waits on (or delays) the tracker's writes.
+        database_path = engine.url.database
+        # The path is percent-quoted for SQLite's URI parser, like in backup.py and archive.py
+        read_engine = create_engine(
+            URL.create("sqlite", database=f"file:{urllib.parse.quote(database_path)}", query={"mode": "ro", "uri": "true"}),
+            connect_args={"check_same_thread": False},
+            pool_size=READ_POOL_SIZE, max_overflow=READ_POOL_SIZE
+        )
+        query_stats.attach(read_engine, "read")
+        # journal_mode cannot be changed from a read-only connection; query_only guards against stray writes
+        sqlite_profile.apply_profile(read_engine, dict(profile, query_only="ON"), skip=("journal_mode",))
+        ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+        read_cache = ReadCache(database_path)
         print("Database initialized and tables created.")
     return SessionLocal
 
+def close_db():
+    """
+    Stops the activity writer and backup job and disposes of both engines, so that
+    init_db() can open another database file (e.g. a scratch copy for benchmarks).
+    """
+    global engine, SessionLocal, read_engine, ReadSessionLocal, activity_encoder, read_cache
+    if engine is None:
+        return
+    wait_for_backfills()
+    shutdown_activity_writer()
+    shutdown_backup_job()
+    read_cache.close()
+    read_engine.dispose()
+    engine.dispose()
+    engine = SessionLocal = read_engine = ReadSessionLocal = activity_encoder = read_cache = None
+    ready_indexes.clear()
+
 def get_db():
     if SessionLocal is None:
         init_db()
@@ -81,6 +126,52 @@ def get_db():
     finally:
         db.close()
 
+def _cached(key, loader, *args):
+    if read_cache is None:
+        init_db()
+    return read_cache.get(key, lambda: loader(*args))
+
+def _invalidate_cache():
+    # Called after every commit that touches projects or goals
+    if read_cache is not None:
+        read_cache.invalidate()
+
+def get_read_db():
+    """Like get_db(), but from the read-only pool. Use for functions that never write."""
+    if ReadSessionLocal is None:
+        init_db()
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _archive_dir():
+    return os.path.join(DATA_DIR, archive.ARCHIVE_DIR_NAME)
+
+def _load_archive_partitions():
+    with read_engine.connect() as connection:
+        return archive.load_partitions(connection)
+
+def _archive_partitions(start: datetime.datetime = None, end: datetime.datetime = None):
+    """Archived months a read over [start, end] needs (see archive.py), newest first."""
+    return archive.select_partitions(_cached(("archive_partitions",), _load_archive_partitions), start, end)
+
+def _partition_reads(start: datetime.datetime = None, end: datetime.datetime = None, newest_first: bool = True):
+    """
+    Yields (connection, archived) read connections covering [start, end]: the hot
+    database, then (when the range reaches back that far) the archived months it needs,
+    attached in groups; reversed with newest_first=False. Each row is in exactly one of
+    them, so callers merge the results. Ranges after the archive touch the hot file only.
+    """
+    if read_engine is None:
+        init_db()
+    batches = [[]] + archive.groups(_archive_partitions(start, end))
+    for batch in (batches if newest_first else reversed(batches)):
+        with read_engine.connect() as connection:
+            with archive.attached(connection, batch, _archive_dir()):
+                yield connection, bool(batch)
+
 # --- Project Functions ---
 def add_project(name: str):
     if not name.strip():
@@ -97,6 +188,7 @@ def add_project(name: str):
         db.add(new_project)
         db.commit()
         db.refresh(new_project)
+        _invalidate_cache()
         print(f"Added new project: '{name}', ID: {new_project.id}")
         return new_project
     except SQLAlchemyError as e:
@@ -107,7 +199,10 @@ def add_project(name: str):
         next(db_session_gen, None)
 
 def get_project_by_id(project_id: int):
-    db_session_gen = get_db()
+    return _cached(("project", project_id), _load_project_by_id, project_id)
+
+def _load_project_by_id(project_id: int):
+    db_session_gen = get_read_db()
     db = next(db_session_gen)
     try:
         return db.query(Project).filter(Project.id == project_id).first()
@@ -115,7 +210,10 @@ def get_project_by_id(project_id: int):
         next(db_session_gen, None)
 
 def get_all_projects(include_archived: bool = False):
-    db_session_gen = get_db()
+    return list(_cached(("projects", include_archived), _load_all_projects, include_archived))
+
+def _load_all_projects(include_archived: bool):
+    db_session_gen = get_read_db()
     db = next(db_session_gen)
     try:
         query = db.query(Project)
@@ -146,11 +244,14 @@ def add_goal(goal_text: str, project_id: int, target_minutes: int = None):
             project_id=project_id,
             target_minutes=target_minutes,
             time_spent_minutes=0,
+            time_spent_seconds=0,
+            time_adjustment_seconds=0,
             last_tracked_at=None
         )
         db.add(new_goal)
         db.commit()
         db.refresh(new_goal)
+        _invalidate_cache()
         print(f"Added new goal '{goal_text}' to project '{project.name}'")
         return new_goal
     except SQLAlchemyError as e:
@@ -174,6 +275,7 @@ def set_active_goal(goal_id: int):
             goal_to_activate.is_active = True
             db.commit()
             db.refresh(goal_to_activate)
+            _invalidate_cache()
             print(f"Set goal '{goal_to_activate.text}' (ID: {goal_id}) as active.")
             return goal_to_activate
         else:
@@ -197,6 +299,7 @@ def complete_goal(goal_id: int):
             goal.is_active = False # A completed goal cannot be the active one
             db.commit()
             db.refresh(goal)
+            _invalidate_cache()
             print(f"Goal '{goal.text}' marked as completed.")
             return goal
         return None
@@ -208,7 +311,10 @@ def complete_goal(goal_id: int):
         next(db_session_gen, None)
 
 def get_active_goal():
-    db_session_gen = get_db()
+    return _cached(("active_goal",), _load_active_goal)
+
+def _load_active_goal():
+    db_session_gen = get_read_db()
     db = next(db_session_gen)
     try:
         return db.query(Goal).filter(Goal.is_active == True).order_by(Goal.created_at.desc()).first()
@@ -216,7 +322,7 @@ def get_active_goal():
         next(db_session_gen, None)
 
 def get_goals_for_project(project_id: int, include_completed: bool = False):
-    db_session_gen = get_db()
+    db_session_gen = get_read_db()
     db = next(db_session_gen)
     try:
         query = db.query(Goal).filter(Goal.project_id == project_id)
@@ -227,38 +333,62 @@ def get_goals_for_project(project_id: int, include_completed: bool = False):
         next(db_session_gen, None)
 
 def get_goal_by_id(goal_id: int):
+    return _cached(("goal", goal_id), _load_goal_by_id, goal_id)
+
+def _load_goal_by_id(goal_id: int):
+    db_session_gen = get_read_db()
+    db = next(db_session_gen)
+    try:
+        return db.query(Goal).filter(Goal.id == goal_id).first()
+    finally:
+        next(db_session_gen, None)
+
+def add_goal_time(goal_id: int, seconds: float):
+    """
+    Manually credits seconds to a goal's time ledger. Tracked activity is credited
+    automatically as its spans close (see goal_time.py); this is for corrections, which
+    are kept apart from it so rebuilding the totals from the rollup keeps them.
+    """
     db_session_gen = get_db()
     db = next(db_session_gen)
     try:
+        completed = goal_time.credit(db.connection(), {goal_id: seconds}, adjustment=True)
+        db.commit()
+        _invalidate_cache()
+        _report_completed_goals(completed)
         return db.query(Goal).filter(Goal.id == goal_id).first()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error updating goal time: {e}")
+        return None
     finally:
         next(db_session_gen, None)
 
 def update_goal_time(goal_id: int, minutes_to_add: int):
+    return add_goal_time(goal_id, minutes_to_add * 60)
+
+def reconcile_goal_times(goal_ids=None, project_id: int = None):
+    """Rebuilds goal time totals from the daily_app_usage rollup. Returns the number of goals updated."""
+    flush_activity_writer()
     db_session_gen = get_db()
     db = next(db_session_gen)
     try:
-        goal = db.query(Goal).filter(Goal.id == goal_id).first()
-        if goal:
-            goal.time_spent_minutes += minutes_to_add
-            goal.last_tracked_at = func.now()
-            
-            # Check if target time is reached
-            if goal.target_minutes and goal.time_spent_minutes >= goal.target_minutes:
-                goal.completed_at = func.now()
-                goal.is_active = False
-            
-            db.commit()
-            db.refresh(goal)
-            return goal
-        return None
+        updated = goal_time.reconcile(db.connection(), goal_ids=goal_ids, project_id=project_id)
+        db.commit()
+        _invalidate_cache()
+        print(f"Reconciled time totals of {updated} goals.")
+        return updated
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"Error updating goal time: {e}")
+        print(f"Error reconciling goal times: {e}")
         return None
     finally:
         next(db_session_gen, None)
 
+def _report_completed_goals(goal_ids):
+    for goal_id in goal_ids:
+        print(f"Goal ID {goal_id} reached its target time and was marked as completed.")
+
 # --- Activity Log Functions ---
 def add_activity_log(goal_id: int, project_id: int, app_name: str, window_title: str, detailed_context: str = None):
     if not app_name and not window_title: # Don't log empty entries
@@ -266,15 +396,23 @@ def add_activity_log(goal_id: int, project_id: int, app_name: str, window_title:
     db_session_gen = get_db()
     db = next(db_session_gen)
     try:
-        log_entry = ActivityLog(
-            goal_id=goal_id,
-            project_id=project_id,
-            application_name=app_name or "N/A",
-            window_title=window_title or "N/A",
-            detailed_context=detailed_context # Store new context
-        )
+        record = {
+            "timestamp": _utcnow(),
+            "goal_id": goal_id,
+            "project_id": project_id,
+            "application_name": app_name or "N/A",
+            "window_title": window_title or "N/A",
+            "detailed_context": detailed_context # Store new context
+        }
+        log_entry = ActivityLog(**activity_encoder.encode([record])[0])
+        deltas = rollup.apply_new_activity(db.connection(), [record])
+        completed = goal_time.credit(db.connection(), goal_time.seconds_by_goal(deltas))
         db.add(log_entry)
+        db.flush()
+        spans.apply_new_logs(db.connection(), [record]) # Needs the new row in place
         db.commit()
+        _invalidate_cache() # Goal totals changed
+        _report_completed_goals(completed)
         db.refresh(log_entry)
         # print(f"Logged activity: App: {app_name}, Window: {window_title} for goal ID {goal_id}") # Can be very verbose
         return log_entry
@@ -285,82 +423,849 @@ def add_activity_log(goal_id: int, project_id: int, app_name: str, window_title:
     finally:
         next(db_session_gen, None)
 
-def get_activity_logs_for_goal(goal_id: int, limit: int = 100):
-    db_session_gen = get_db()
-    db = next(db_session_gen)
+def _utcnow():
+    # Naive UTC, matching what func.now() (CURRENT_TIMESTAMP) stores in SQLite
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def _write_activity_batch(connection, records):
+    rows = activity_encoder.encode(records) # Strings become interned ids
+    deltas = rollup.apply_new_activity(connection, records) # Must see the table as it was before the insert
+    goal_time.credit(connection, goal_time.seconds_by_goal(deltas)) # Closed spans count towards their goals
+    connection.execute(ActivityLog.__table__.insert(), rows)
+    spans.apply_new_logs(connection, records) # Closes the spans the new logs follow
+
+def _journal_path():
+    return os.path.join(DATA_DIR, JOURNAL_FILE)
+
+def _open_activity_journal():
+    # Takes ownership of the journal; None if another process (the running app) owns it
+    global activity_journal, activity_journal_error
+    if activity_journal is None:
+        try:
+            activity_journal = ActivityJournal(_journal_path())
+        except OSError as e:
+            if str(e) != activity_journal_error:
+                if isinstance(e, JournalLocked):
+                    print(f"{e}; this process queues activity without it.")
+                else:
+                    print(f"Could not open the activity journal, queued activity is not crash-safe: {e}")
+            activity_journal_error = str(e)
+    return activity_journal
+
+def replay_activity_journal():
+    """
+    Commits journaled activity records that never reached activity_logs (the app was
+    killed with records still queued), then empties the journal. Records that were
+    committed already are recognised by (project_id, timestamp) and skipped. Called by
+    the app at startup and before a writer starts. Only the process holding the
+    journal's lock replays it, so other processes (manage.py, the benchmark) never touch
+    a running app's journal. Returns None when it was skipped or failed.
+    """
+    if engine is None:
+        init_db()
+    if activity_writer is not None or _open_activity_journal() is None:
+        return None
+    path = _journal_path()
+    records, valid_bytes, total_bytes = read_journal(path)
+    if total_bytes == 0:
+        return 0
+    if valid_bytes < total_bytes:
+        print(f"Ignoring {total_bytes - valid_bytes} bytes of a partially written activity journal entry.")
     try:
-        return db.query(ActivityLog).filter(ActivityLog.goal_id == goal_id).order_by(ActivityLog.timestamp.desc()).limit(limit).all()
-    finally:
-        next(db_session_gen, None)
+        with engine.begin() as connection:
+            missing = _unlogged_records(connection, records)
+            if missing:
+                _write_activity_batch(connection, missing)
+    except SQLAlchemyError as e:
+        print(f"Error replaying activity journal, keeping it for the next launch: {e}")
+        return None
+    activity_journal.clear() # Checkpoint: everything in it is committed now
+    print(f"Replayed {len(missing)} of {len(records)} journaled activity records.")
+    return len(missing)
 
-def get_activity_logs_for_project(project_id: int, limit: int = 200):
-    db_session_gen = get_db()
-    db = next(db_session_gen)
+def _unlogged_records(connection, records):
+    if not records:
+        return []
+    timestamps = [r["timestamp"] for r in records]
+    logged = set(connection.execute(
+        sqlalchemy.select(ActivityLog.project_id, ActivityLog.timestamp).where(
+            ActivityLog.project_id.in_({r["project_id"] for r in records}),
+            ActivityLog.timestamp >= min(timestamps),
+            ActivityLog.timestamp <= max(timestamps)
+        )
+    ).all())
+    missing = []
+    for record in records:
+        key = (record["project_id"], record["timestamp"])
+        if key not in logged:
+            logged.add(key)
+            missing.append(record)
+    return missing
+
+def get_activity_writer():
+    global activity_writer
+    if SessionLocal is None:
+        init_db()
+    if activity_writer is None:
+        # The writer's checkpoints empty the whole journal, so whatever an earlier session
+        # left in it is replayed first (a no-op after the app's startup replay)
+        replay_activity_journal()
+        activity_writer = ActivityWriter(engine, _write_activity_batch, journal=_open_activity_journal())
+    activity_writer.start()
+    return activity_writer
+
+def enqueue_activity(goal_id: int, project_id: int, app_name: str, window_title: str, detailed_context: str = None,
+                     timestamp: datetime.datetime = None):
+    """
+    Non-blocking variant of add_activity_log. The record is stamped now and committed
+    later by the background writer together with other queued records.
+    """
+    if not app_name and not window_title: # Don't log empty entries
+        return False
+    get_activity_writer().enqueue({
+        "timestamp": timestamp or _utcnow(),
+        "goal_id": goal_id,
+        "project_id": project_id,
+        "application_name": app_name or "N/A",
+        "window_title": window_title or "N/A",
+        "detailed_context": detailed_context,
+    })
+    return True
+
+def flush_activity_writer(timeout: float = 5.0):
+    """
+    Blocks until every queued activity record has been committed. Returns False if the
+    timeout expired or records could not be committed.
+    """
+    if activity_writer is None:
+        return True
+    return activity_writer.flush(timeout)
+
+def shutdown_activity_writer(timeout: float = 5.0):
+    global activity_writer, activity_journal
+    if activity_writer is not None:
+        activity_writer.stop(timeout)
+        if activity_writer.is_running():
+            return # Still committing; leave the journal open for it
+        activity_writer = None
+    if activity_journal is not None:
+        activity_journal.close()
+        activity_journal = None
+
+# --- Bulk Activity Ingestion ---
+BULK_BATCH_SIZE = 5000 # Records per transaction in bulk_insert_activity()
+
+def _validate_activity_batch(connection, records, archived_before: datetime.datetime = None):
+    """
+    Splits records into (valid, rejected) with one goal lookup for the whole batch.
+    Records before archived_before fall in archived months, which are never written again.
+    Timezone-aware timestamps are converted to naive UTC, like every stored timestamp.
+    """
+    goal_ids = {r.get("goal_id") for r in records} - {None}
+    goal_projects = dict(connection.execute(
+        sqlalchemy.select(Goal.id, Goal.project_id).where(Goal.id.in_(goal_ids))
+    ).all()) if goal_ids else {}
+    valid, rejected = [], 0
+    for record in records:
+        project_id = goal_projects.get(record.get("goal_id"))
+        timestamp = record.get("timestamp")
+        if project_id is None or not isinstance(timestamp, datetime.datetime):
+            rejected += 1
+            continue
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        if archived_before is not None and timestamp < archived_before:
+            rejected += 1
+            continue
+        if record.get("project_id") not in (None, project_id): # Goal belongs to a different project
+            rejected += 1
+            continue
+        valid.append({
+            "timestamp": timestamp,
+            "goal_id": record["goal_id"],
+            "project_id": project_id,
+            "application_name": record.get("application_name") or "N/A",
+            "window_title": record.get("window_title") or "N/A",
+            "detailed_context": record.get("detailed_context"),
+        })
+    return valid, rejected
+
+def bulk_insert_activity(records, batch_size: int = BULK_BATCH_SIZE, skip_existing: bool = False):
+    """
+    Inserts activity records from any iterable (dicts with timestamp, goal_id and the
+    string fields; project_id is taken from the goal when missing) in transactions of
+    batch_size rows, each costing one goal lookup and one executemany insert. Records
+    with an unknown goal, a mismatched project or a timestamp in an archived month are
+    rejected. With skip_existing,
+    records matching a logged (project_id, timestamp) are skipped, which makes re-running
+    an import safe. History may arrive in any order: the rollup and goal totals are
+    rebuilt once for the affected range afterwards, also when the import stops early (an
+    error reading the records is raised after that). Returns a summary with the throughput.
+    """
+    if SessionLocal is None:
+        init_db()
+    flush_activity_writer() # Keep live records ordered before the imported ones
+    batch_size = max(1, batch_size)
+    summary = {"inserted": 0, "rejected": 0, "skipped": 0, "batches": 0}
+    ranges = {} # project_id -> [first timestamp, last timestamp] of the imported records
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        archived_before = archive.horizon(connection)
+
+    def _commit_batch(batch):
+        with engine.begin() as connection:
+            valid, rejected = _validate_activity_batch(connection, batch, archived_before)
+            if skip_existing:
+                new = _unlogged_records(connection, valid)
+                summary["skipped"] += len(valid) - len(new)
+                valid = new
+            if valid:
+                connection.execute(ActivityLog.__table__.insert(), activity_encoder.encode(valid))
+        for record in valid:
+            bounds = ranges.setdefault(record["project_id"], [record["timestamp"], record["timestamp"]])
+            bounds[0] = min(bounds[0], record["timestamp"])
+            bounds[1] = max(bounds[1], record["timestamp"])
+        summary["inserted"] += len(valid)
+        summary["rejected"] += rejected
+        summary["batches"] += 1
+
+    batch = []
     try:
-        return db.query(ActivityLog).filter(ActivityLog.project_id == project_id).order_by(ActivityLog.timestamp.desc()).limit(limit).all()
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                _commit_batch(batch)
+                batch = []
+        if batch:
+            _commit_batch(batch)
+    except SQLAlchemyError as e:
+        print(f"Error in bulk activity insert after {summary['inserted']} records: {e}")
+        summary["error"] = str(e)
     finally:
-        next(db_session_gen, None)
+        inserted_seconds = time.perf_counter() - started
+        try:
+            _rebuild_imported_ranges(ranges) # Committed batches are reconciled whatever stopped the import
+        except SQLAlchemyError as e:
+            print(f"Error rebuilding the rollup after a bulk activity insert: {e}")
+            print("Run 'python -m src.database.manage rebuild-rollup' to bring the rollup and goal totals up to date.")
+            summary.setdefault("error", str(e))
+        if summary["inserted"]:
+            _invalidate_cache() # Goal totals changed
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 3)
+    summary["insert_seconds"] = round(inserted_seconds, 3)
+    summary["rows_per_second"] = round(summary["inserted"] / elapsed) if elapsed > 0 else 0
+    print(f"Bulk inserted {summary['inserted']} activity records in {summary['batches']} batches "
+          f"({summary['rows_per_second']} rows/s including the rollup rebuild); "
+          f"{summary['rejected']} rejected, {summary['skipped']} skipped.")
+    return summary
+
+def _rebuild_imported_ranges(ranges):
+    # Imported logs change the spans from the log before the first of them up to the log after
+    # the last one, so the rollup is rebuilt for those days, a week per transaction, and the
+    # activity_spans rows for those logs a batch per transaction.
+    for project_id, (first_ts, last_ts) in ranges.items():
+        with engine.connect() as connection:
+            previous = connection.execute(sqlalchemy.select(func.max(ActivityLog.timestamp)).where(
+                ActivityLog.project_id == project_id, ActivityLog.timestamp < first_ts)).scalar()
+            following = connection.execute(sqlalchemy.select(func.min(ActivityLog.timestamp)).where(
+                ActivityLog.project_id == project_id, ActivityLog.timestamp > last_ts)).scalar()
+        day = (previous or first_ts).date()
+        last_day = (following or last_ts).date()
+        while day <= last_day:
+            week_last_day = min(day + datetime.timedelta(days=6), last_day)
+            with engine.begin() as connection:
+                rollup.rebuild_daily_usage(connection, project_id=project_id, first_day=day, last_day=week_last_day)
+            day = week_last_day + datetime.timedelta(days=1)
+        with engine.connect() as connection:
+            start, stop = spans.affected_range(connection, project_id, first_ts, last_ts)
+            for _ in spans.rebuild_chain(connection, project_id, start, stop):
+                connection.commit()
+        with engine.begin() as connection:
+            goal_time.reconcile(connection, project_id=project_id)
+
+def _newest_activity_logs(condition, limit: int):
+    # The hot file usually has enough; archived months are only opened when it runs out
+    logs = []
+    reads = _partition_reads()
+    for connection, _ in reads:
+        db = ReadSessionLocal(bind=connection)
+        try:
+            logs.extend(db.query(ActivityLog).filter(condition).order_by(ActivityLog.timestamp.desc())
+                        .limit(limit - len(logs)).all())
+        finally:
+            db.close()
+        if len(logs) >= limit:
+            reads.close()
+            break
+    return logs
+
+def get_activity_logs_for_goal(goal_id: int, limit: int = 100):
+    return _newest_activity_logs(ActivityLog.goal_id == goal_id, limit)
+
+def get_activity_logs_for_project(project_id: int, limit: int = 200):
+    return _newest_activity_logs(ActivityLog.project_id == project_id, limit)
+
+def _index_is_ready(migration, exists):
+    # An index only answers queries once its backfill has completed, which may happen on
+    # the migration thread after startup; until then callers take the unindexed path
+    if migration.NAME not in ready_indexes and engine is not None:
+        try:
+            with engine.connect() as connection:
+                if migration.VERSION in applied_versions(connection) and exists(connection):
+                    ready_indexes.add(migration.NAME)
+                connection.commit()
+        except SQLAlchemyError as e:
+            print(f"Error checking the {migration.NAME} index: {e}")
+    return migration.NAME in ready_indexes
+
+def _span_index_is_ready():
+    return _index_is_ready(add_span_interval_index, span_index.exists)
+
+def _span_filters(start_date: datetime.datetime, end_date: datetime.datetime, project_id: int = None,
+                  archived: bool = False):
+    """
+    Filters for activity_spans queries over a range, through the interval index when it
+    is ready. archived: the query also reads archived months, which the index does not cover.
+    """
+    if not archived and _span_index_is_ready():
+        return span_index.overlap_filter(start_date, end_date, project_id) # Also matches the project exactly
+    return (ActivitySpan.project_id == project_id,) if project_id is not None else ()
+
+def _is_day_aligned(start_date: datetime.datetime, end_date: datetime.datetime):
+    # Whole-day ranges can be answered from the daily_app_usage rollup
+    return start_date.time() == datetime.time.min and end_date.time() == datetime.time.min
 
 def get_aggregated_activity_by_app(project_id: int, start_date: datetime.datetime, end_date: datetime.datetime):
-    db_session_gen = get_db()
+    db_session_gen = get_read_db()
     db = next(db_session_gen)
     try:
-        logs = db.query(ActivityLog).filter(
-            ActivityLog.project_id == project_id,
-            ActivityLog.timestamp >= start_date,
-            ActivityLog.timestamp < end_date
-        ).order_by(ActivityLog.timestamp.asc()).all()
-
-        if not logs:
-            return {}
-
-        app_durations = {}
-        for i in range(len(logs)):
-            current_log = logs[i]
-            # Determine the end time for the current_log's duration
-            if i < len(logs) - 1:
-                next_log_timestamp = logs[i+1].timestamp
-            else:
-                # For the last log in the period, its duration extends to end_date
-                next_log_timestamp = end_date
-            
-            # Ensure duration is not negative if timestamps are unusual (e.g. next_log_timestamp is before current_log.timestamp)
-            # Though order_by should prevent this for logs from DB.
-            # Also, cap duration at end_date, so if next_log is past end_date, only count till end_date.
-            effective_end_timestamp = min(next_log_timestamp, end_date)
-            duration = (effective_end_timestamp - current_log.timestamp).total_seconds()
-
-            if duration > 0: # Only add if duration is positive
-                app_name = current_log.application_name
-                app_durations[app_name] = app_durations.get(app_name, 0) + duration
-        
-        return app_durations
+        if _is_day_aligned(start_date, end_date):
+            rows = rollup.query_app_usage(db.connection(), start_date.date(), end_date.date(), project_ids=[project_id])
+            return {app_name: duration for _, app_name, duration in rows}
+        totals = {}
+        for connection, archived in _partition_reads(start_date, end_date):
+            query = spans.app_seconds_query(start_date, end_date, _span_filters(start_date, end_date, project_id, archived))
+            for app_name, duration in connection.execute(query):
+                totals[app_name] = totals.get(app_name, 0) + duration
+        return totals
     except SQLAlchemyError as e:
         print(f"Error aggregating activity by app: {e}")
         return {}
     finally:
         next(db_session_gen, None)
 
-def get_activity_logs_for_day(target_date: datetime.date, project_id: int = None):
-    db_session_gen = get_db()
+def get_aggregated_activity_by_project(start_date: datetime.datetime, end_date: datetime.datetime,
+                                      project_ids=None, include_archived: bool = False):
+    """
+    Aggregates app durations for several projects (all of them when project_ids is None)
+    in a single range scan. Returns {"by_project": {project_id: {app: seconds}},
+    "by_app": {app: seconds}}, where by_app sums across the selected projects.
+    """
+    db_session_gen = get_read_db()
     db = next(db_session_gen)
     try:
-        start_datetime = datetime.datetime.combine(target_date, datetime.time.min)
-        end_datetime = datetime.datetime.combine(target_date, datetime.time.max)
+        filters = []
+        if project_ids is not None:
+            filters.append(ActivitySpan.project_id.in_(list(project_ids)))
+        if not include_archived:
+            active_projects = sqlalchemy.select(Project.id).where(Project.is_archived == False)
+            filters.append(ActivitySpan.project_id.in_(active_projects))
 
-        query = db.query(ActivityLog).filter(
-            ActivityLog.timestamp >= start_datetime,
-            ActivityLog.timestamp <= end_datetime
-        )
-        if project_id:
-            query = query.filter(ActivityLog.project_id == project_id)
-        
-        return query.order_by(ActivityLog.timestamp.asc()).all()
+        if _is_day_aligned(start_date, end_date):
+            rows = rollup.query_app_usage(db.connection(), start_date.date(), end_date.date(),
+                                          project_ids=project_ids, include_archived=include_archived)
+        else:
+            rows = []
+            for connection, archived in _partition_reads(start_date, end_date):
+                query = spans.app_seconds_query(start_date, end_date, filters + list(_span_filters(start_date, end_date, archived=archived)),
+                                                by_project=True)
+                rows.extend(connection.execute(query).all())
+
+        by_project = {}
+        by_app = {}
+        for project_id, app_name, duration in rows:
+            project_totals = by_project.setdefault(project_id, {})
+            project_totals[app_name] = project_totals.get(app_name, 0) + duration
+            by_app[app_name] = by_app.get(app_name, 0) + duration
+        return {"by_project": by_project, "by_app": by_app}
+    except SQLAlchemyError as e:
+        print(f"Error aggregating activity by project: {e}")
+        return {"by_project": {}, "by_app": {}}
+    finally:
+        next(db_session_gen, None)
+
+def rebuild_daily_usage(project_id: int = None, first_day: datetime.date = None, last_day: datetime.date = None):
+    """
+    Recomputes the daily_app_usage rollup from the raw activity log (all history by
+    default). Days in archived months keep their rollup rows, which are all that is
+    left of them in the hot database.
+    """
+    flush_activity_writer()
+    if engine is None:
+        init_db()
+    try:
+        with engine.connect() as connection:
+            boundary = [] # The newest archived month, for spans reaching from it into first_day
+            archived_before = archive.horizon(connection)
+            if archived_before is not None and (first_day is None or first_day < archived_before.date()):
+                first_day = archived_before.date()
+                print(f"Keeping the rollup of archived days before {first_day}.")
+                boundary = _archive_partitions()[:1]
+            if last_day is not None and first_day is not None and last_day < first_day:
+                return 0
+            # The hot table plus that month, so the rebuild sees the last archived log of each project
+            with archive.attached(connection, boundary, _archive_dir(), include_main=True, uri=False):
+                rows_read = rollup.rebuild_daily_usage(connection, project_id=project_id, first_day=first_day, last_day=last_day)
+                goal_time.reconcile(connection, project_id=project_id) # Goal totals are derived from the rollup
+                connection.commit()
+        _invalidate_cache()
+        print(f"Rebuilt daily usage rollup from {rows_read} activity logs.")
+        return rows_read
+    except SQLAlchemyError as e:
+        print(f"Error rebuilding daily usage rollup: {e}")
+        return None
+
+def rebuild_activity_spans(project_id: int = None):
+    """Rewrites activity_spans from the activity log, committing after every batch. Returns the spans written."""
+    flush_activity_writer()
+    if engine is None:
+        init_db()
+    written = 0
+    try:
+        with engine.connect() as connection:
+            for count in spans.rebuild_all(connection, project_id=project_id):
+                connection.commit()
+                written += count
+        print(f"Rebuilt {written} activity spans.")
+        return written
+    except SQLAlchemyError as e:
+        print(f"Error rebuilding activity spans after {written} spans: {e}")
+        return None
+
+def archive_old_activity(older_than_days: int = archive.DEFAULT_ARCHIVE_AFTER_DAYS, compact: bool = True):
+    """
+    Moves raw activity of whole months older than older_than_days out of the hot
+    database into monthly files under .data/archive/, which reads attach when their
+    range needs them (see archive.py). With compact, new archive files are vacuumed and
+    made read-only. Returns {month: logs moved}.
+    """
+    flush_activity_writer()
+    if engine is None:
+        init_db()
+    wait_for_backfills() # Spans and strings of the moved rows must be complete
+    cutoff = _utcnow() - datetime.timedelta(days=older_than_days)
+    moved = {}
+    try:
+        with engine.connect() as connection:
+            for month in archive.months_to_archive(connection, cutoff):
+                count = archive.archive_month(connection, _archive_dir(), month)
+                if count:
+                    moved[month] = count
+                    print(f"Archived {count} activity logs from {month}.")
+        _invalidate_cache()
+        if compact:
+            compact_archives()
+        if not moved:
+            print(f"No activity older than {older_than_days} days left to archive.")
+        return moved
+    except (SQLAlchemyError, OSError) as e:
+        print(f"Error archiving activity after {len(moved)} months: {e}")
+        return None
+
+def compact_archives():
+    """
+    Vacuums archive files that are not compacted yet and makes them read-only, leaving
+    partially archived months writable for the rest of their rows. Returns the months compacted.
+    """
+    if engine is None:
+        init_db()
+    compacted = []
+    try:
+        with engine.connect() as connection:
+            pending = connection.execute(sqlalchemy.select(ArchivePartition.month, ArchivePartition.file_name)
+                                         .where(ArchivePartition.compacted == False, ArchivePartition.partial == False)).all()
+            for month, name in pending:
+                archive.compact(_archive_dir(), name)
+                connection.execute(sqlalchemy.update(ArchivePartition).where(ArchivePartition.month == month)
+                                   .values(compacted=True))
+                connection.commit()
+                compacted.append(month)
+        _invalidate_cache()
+        if compacted:
+            print(f"Compacted {len(compacted)} archive files.")
+        return compacted
+    except (SQLAlchemyError, OSError) as e:
+        print(f"Error compacting archive files: {e}")
+        return None
+
+def get_archive_partitions():
+    """Archived months as dicts with month, file_name, log_count, first_timestamp, last_end, archived_at, compacted and partial."""
+    if engine is None:
+        init_db()
+    with engine.connect() as connection:
+        rows = connection.execute(sqlalchemy.select(ArchivePartition).order_by(ArchivePartition.month)).mappings().all()
+    return [dict(row) for row in rows]
+
+# --- Backups ---
+def _backup_dir():
+    return os.path.join(DATA_DIR, backup.BACKUP_DIR_NAME)
+
+def get_backup_job():
+    global backup_job
+    if engine is None:
+        init_db()
+    if backup_job is None:
+        backup_job = backup.BackupJob(engine.url.database, _backup_dir(), archive_dir=_archive_dir())
+    return backup_job
+
+def start_backup_job(interval: float = backup.DEFAULT_BACKUP_INTERVAL):
+    """Starts taking scheduled snapshots every interval seconds (None: only when requested)."""
+    job = get_backup_job()
+    job.interval = interval
+    job.start()
+    return job
+
+def request_backup():
+    """Queues a snapshot on the background backup thread; poll get_backup_status() for progress."""
+    get_backup_job().request()
+
+def backup_database(keep: int = None, pages_per_step: int = None):
+    """Takes a snapshot now, in the calling thread. Returns its path, or None if it failed."""
+    job = get_backup_job()
+    if keep is not None:
+        job.keep = max(1, keep)
+    if pages_per_step is not None:
+        job.pages_per_step = max(1, pages_per_step)
+    flush_activity_writer() # Include what the tracker has queued so far
+    return job.run_once()
+
+def get_backup_status():
+    """
+    State of this process's backup job (state, pages_copied/page_count of the current
+    backup, last_backup, last_error, ...) plus the snapshots on disk.
+    """
+    job = get_backup_job()
+    return dict(job.status(), snapshots=job.snapshots())
+
+def shutdown_backup_job(timeout: float = 5.0):
+    global backup_job
+    if backup_job is not None:
+        backup_job.stop(timeout)
+        backup_job = None
+
+def vacuum_database():
+    """Rewrites the database file to return free pages (e.g. after re-encoding strings) to the OS."""
+    if engine is None:
+        init_db()
+    flush_activity_writer()
+    size_before = os.path.getsize(engine.url.database)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("VACUUM")
+    size_after = os.path.getsize(engine.url.database)
+    print(f"Vacuumed database: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+    return size_before, size_after
+
+# --- Query Instrumentation ---
+def get_query_stats(top: int = 20, order_by: str = "total_ms"):
+    """Statement groups with latency histograms, row counts and callers; see query_stats.QueryStats.summary()."""
+    return query_stats.summary(top=top, order_by=order_by) if query_stats else []
+
+def get_slow_queries():
+    """Recent statements over the slow-query threshold, with their EXPLAIN QUERY PLAN."""
+    return query_stats.slow_queries() if query_stats else []
+
+def dump_query_stats(path: str = None):
+    """Writes the collected statistics as JSON (default .data/query_stats.json) and returns the path."""
+    if query_stats is None:
+        return None
+    try:
+        path = query_stats.dump(path or os.path.join(DATA_DIR, QUERY_STATS_FILE))
+        print(f"Query statistics written to {path}")
+        return path
+    except OSError as e:
+        print(f"Error writing query statistics: {e}")
+        return None
+
+def get_activity_logs_for_day(target_date: datetime.date, project_id: int = None):
+    start_datetime = datetime.datetime.combine(target_date, datetime.time.min)
+    end_datetime = datetime.datetime.combine(target_date, datetime.time.max)
+    logs = []
+    try:
+        for connection, _ in _partition_reads(start_datetime, end_datetime):
+            db = ReadSessionLocal(bind=connection)
+            try:
+                query = db.query(ActivityLog).filter(
+                    ActivityLog.timestamp >= start_datetime,
+                    ActivityLog.timestamp <= end_datetime
+                )
+                if project_id:
+                    query = query.filter(ActivityLog.project_id == project_id)
+                logs.extend(query.order_by(ActivityLog.timestamp.asc()).all())
+            finally:
+                db.close()
+        return sorted(logs, key=lambda log: (log.timestamp, log.id))
     except SQLAlchemyError as e:
         print(f"Error fetching activity logs for day {target_date}: {e}")
         return []
+
+# --- Lightweight Record Reads ---
+# Core-level variants of the hot read functions returning named tuples (see fast_reads.py).
+# Use these where only a few attributes are read; the ORM functions remain for writes.
+def _load_records(reader, *args, **kwargs):
+    # Raises on database errors, so a cached read never stores a failure
+    if read_engine is None:
+        init_db()
+    with read_engine.connect() as connection:
+        return reader(connection, *args, **kwargs)
+
+def _read_records(description: str, reader, *args, **kwargs):
+    try:
+        return _load_records(reader, *args, **kwargs)
+    except SQLAlchemyError as e:
+        print(f"Error fetching {description}: {e}")
+        return []
+
+def _read_partitioned_records(description: str, start: datetime.datetime, end: datetime.datetime, reader, sort_key):
+    """
+    Like _read_records over the hot file and the archived months [start, end] needs.
+    reader(connection, archived) returns records; they are merged in sort_key order.
+    """
+    try:
+        records = []
+        for connection, archived in _partition_reads(start, end):
+            records.extend(reader(connection, archived))
+        return sorted(records, key=sort_key)
+    except SQLAlchemyError as e:
+        print(f"Error fetching {description}: {e}")
+        return []
+
+def get_project_records(include_archived: bool = False):
+    try:
+        return list(_cached(("project_records", include_archived), _load_records, fast_reads.project_records, include_archived))
+    except SQLAlchemyError as e: # Not cached: e.g. "database is locked" must not stick until the next write
+        print(f"Error fetching project records: {e}")
+        return []
+
+def get_goal_records_for_project(project_id: int, include_completed: bool = False):
+    return _read_records("goal records", fast_reads.goal_records_for_project, project_id, include_completed)
+
+def get_goal_records_for_active_projects():
+    """Goals of every non-archived project in one query, newest first."""
+    return _read_records("goal records", fast_reads.goal_records_for_active_projects)
+
+def get_activity_spans_for_range(start: datetime.datetime, end: datetime.datetime, project_id: int = None):
+    """Span records overlapping [start, end), clipped to it; open spans run until end."""
+    return _read_partitioned_records(
+        "activity spans", start, end,
+        lambda connection, archived: fast_reads.span_records_for_range(
+            connection, start, end, project_id, indexed=not archived and _span_index_is_ready()),
+        lambda span: (span.start_time, span.log_id))
+
+def get_activity_spans_for_day(target_date: datetime.date, project_id: int = None):
+    """Span records overlapping the day, clipped to it; the open span ends now (or at midnight for past days)."""
+    start_of_day = datetime.datetime.combine(target_date, datetime.time.min)
+    end_of_day = start_of_day + datetime.timedelta(days=1)
+    return get_activity_spans_for_range(start_of_day, min(end_of_day, max(_utcnow(), start_of_day)), project_id)
+
+def get_activity_at(moment: datetime.datetime, project_id: int = None):
+    """
+    What was being done at moment: the span in progress then for each project (or just
+    project_id), unclipped, with its full start and end (None while still open). An open
+    span counts only until its capped end (see rollup.capped_end).
+    """
+    return _read_partitioned_records(
+        f"activity at {moment}", moment, moment,
+        lambda connection, archived: fast_reads.span_records_at(
+            connection, moment, project_id, indexed=not archived and _span_index_is_ready()),
+        lambda span: (span.project_id, span.start_time))
+
+def get_activity_records_for_day(target_date: datetime.date, project_id: int = None):
+    start_datetime = datetime.datetime.combine(target_date, datetime.time.min)
+    end_datetime = start_datetime + datetime.timedelta(days=1)
+    return _read_partitioned_records(
+        f"activity records for day {target_date}", start_datetime, end_datetime,
+        lambda connection, archived: fast_reads.activity_records_for_range(connection, start_datetime, end_datetime, project_id),
+        lambda record: (record.timestamp, record.id))
+
+def search_activity(query: str, start: datetime.datetime = None, end: datetime.datetime = None, project_id: int = None):
+    """
+    Time spent on activity whose window title or detailed context matches query, e.g.
+    'ABC-123' or '"quarterly report" draft*' (every term must match; * for a prefix).
+    Returns {"query", "spans", "total_seconds", "by_app", "by_goal", "by_day"}: the
+    matching spans clipped to [start, end) (default: all history up to now) and their
+    seconds per app name, goal id and UTC day.
+    """
+    now = _utcnow()
+    end = end or now
+    try:
+        results = [
+            text_search.search(connection, query, start, end, now, project_id,
+                               indexed=_index_is_ready(add_text_search, text_search.exists),
+                               spans_indexed=not archived and _span_index_is_ready())
+            for connection, archived in _partition_reads(start, end)
+        ]
+        return text_search.merge(query, results)
+    except SQLAlchemyError as e:
+        print(f"Error searching activity for '{query}': {e}")
+        return text_search.merge(query, [])
+
+# --- Streaming / Paginated Activity Log Retrieval ---
+STREAM_CHUNK_SIZE = 1000 # Rows hydrated per round trip by the iter_* generators
+
+def _activity_log_filters(goal_id: int = None, project_id: int = None,
+                          start: datetime.datetime = None, end: datetime.datetime = None):
+    filters = []
+    if goal_id is not None:
+        filters.append(ActivityLog.goal_id == goal_id)
+    if project_id is not None:
+        filters.append(ActivityLog.project_id == project_id)
+    if start is not None:
+        filters.append(ActivityLog.timestamp >= start)
+    if end is not None:
+        filters.append(ActivityLog.timestamp < end)
+    return filters
+
+def _iter_activity_logs(filters, newest_first: bool, chunk_size: int,
+                        start: datetime.datetime = None, end: datetime.datetime = None):
+    # The read session stays open while the caller iterates and is closed when the
+    # generator is exhausted or discarded, so only chunk_size rows are alive at a time.
+    # Archived months [start, end] reaches are read after (or, oldest first, before) the hot file.
+    if newest_first:
+        order = (ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+    else:
+        order = (ActivityLog.timestamp.asc(), ActivityLog.id.asc())
+    reads = _partition_reads(start, end, newest_first)
+    try:
+        for connection, _ in reads:
+            db = ReadSessionLocal(bind=connection)
+            try:
+                for log in db.query(ActivityLog).filter(*filters).order_by(*order).yield_per(chunk_size):
+                    yield log
+            finally:
+                db.close()
     finally:
-        next(db_session_gen, None)
+        reads.close()
+
+def iter_activity_logs_for_goal(goal_id: int, newest_first: bool = True, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Streams every log of a goal without materializing the full list."""
+    return _iter_activity_logs(_activity_log_filters(goal_id=goal_id), newest_first, chunk_size)
+
+def iter_activity_logs_for_project(project_id: int, newest_first: bool = True, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Streams every log of a project without materializing the full list."""
+    return _iter_activity_logs(_activity_log_filters(project_id=project_id), newest_first, chunk_size)
+
+def iter_activity_logs_for_day(target_date: datetime.date, project_id: int = None, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Streaming counterpart of get_activity_logs_for_day, oldest first."""
+    start_datetime = datetime.datetime.combine(target_date, datetime.time.min)
+    end_datetime = start_datetime + datetime.timedelta(days=1)
+    return _iter_activity_logs(_activity_log_filters(project_id=project_id, start=start_datetime, end=end_datetime),
+                               False, chunk_size, start_datetime, end_datetime)
+
+def get_activity_logs_page(goal_id: int = None, project_id: int = None, start: datetime.datetime = None,
+                           end: datetime.datetime = None, after: tuple = None, limit: int = 100,
+                           newest_first: bool = True):
+    """
+    Keyset pagination over activity logs. `after` is the cursor returned with the previous
+    page, a (timestamp, id) tuple; pass None for the first page. Returns (logs, next_cursor),
+    with next_cursor None once there are no more rows. Each page is an index range seek,
+    so late pages cost the same as the first (no OFFSET scan).
+    """
+    try:
+        filters = _activity_log_filters(goal_id, project_id, start, end)
+        key = sqlalchemy.tuple_(ActivityLog.timestamp, ActivityLog.id)
+        first, last = start, end # Bounds of the archived months worth opening
+        if after is not None:
+            cursor = sqlalchemy.tuple_(sqlalchemy.literal(after[0], sqlalchemy.DateTime), sqlalchemy.literal(after[1]))
+            filters.append(key < cursor if newest_first else key > cursor)
+            if newest_first:
+                last = after[0] if last is None else min(last, after[0])
+            else:
+                first = after[0] if first is None else max(first, after[0])
+        if newest_first:
+            order = (ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+        else:
+            order = (ActivityLog.timestamp.asc(), ActivityLog.id.asc())
+        # Fetch one extra row to know whether another page exists. Partitions are read in
+        # page order and never overlap in time, so the first ones that fill the page suffice.
+        logs = []
+        reads = _partition_reads(first, last, newest_first)
+        for connection, _ in reads:
+            db = ReadSessionLocal(bind=connection)
+            try:
+                logs.extend(db.query(ActivityLog).filter(*filters).order_by(*order).limit(limit + 1 - len(logs)).all())
+            finally:
+                db.close()
+            if len(logs) > limit:
+                reads.close()
+                break
+        next_cursor = None
+        if len(logs) > limit:
+            logs = logs[:limit]
+            next_cursor = (logs[-1].timestamp, logs[-1].id)
+        return logs, next_cursor
+    except SQLAlchemyError as e:
+        print(f"Error fetching activity log page: {e}")
+        return [], None
+
+# --- Export ---
+def _export_connections(table: str, start: datetime.datetime, end: datetime.datetime):
+    if table == "activity":
+        for connection, _ in _partition_reads(start, end, newest_first=False):
+            yield connection
+    else:
+        with read_engine.connect() as connection:
+            yield connection
+
+def export_activity(path: str, fmt: str = "csv", table: str = "activity", start: datetime.datetime = None,
+                    end: datetime.datetime = None, project_id: int = None, goal_id: int = None,
+                    chunk_size: int = export.EXPORT_CHUNK_SIZE):
+    """
+    Streams activity logs (or the goals or projects table) matching the filters into
+    path as csv, jsonl, columnar or parquet (see export.py), chunk_size rows at a time,
+    so memory use does not grow with the history exported. Activity is written oldest
+    first, including archived months. The file only appears once it is complete.
+    Returns {path, rows, chunks, seconds}, or None on error.
+    """
+    if read_engine is None:
+        init_db()
+    if table not in export.EXPORT_TABLES:
+        print(f"Unknown export table '{table}'. Use one of: {', '.join(export.EXPORT_TABLES)}.")
+        return None
+    flush_activity_writer() # Include what the tracker has queued so far
+    if table == "activity":
+        columns = export.ACTIVITY_COLUMNS
+        query = export.activity_query(_activity_log_filters(goal_id, project_id, start, end))
+    elif table == "goals":
+        columns, query = export.GOAL_COLUMNS, export.goals_query(project_id, goal_id)
+    else:
+        columns, query = export.PROJECT_COLUMNS, export.projects_query(project_id)
+    started = time.perf_counter()
+    partial = path + ".partial"
+    rows = chunks = 0
+    try:
+        writer, close = export.open_writer(fmt, partial, [(name, column_type) for name, column_type, _ in columns])
+        try:
+            for connection in _export_connections(table, start, end):
+                for chunk in export.fetch_chunks(connection.execute(query), chunk_size):
+                    writer.write(chunk)
+                    rows += len(chunk)
+                    chunks += 1
+        finally:
+            close()
+        os.replace(partial, path)
+    except ImportError:
+        print("Parquet export needs pyarrow (pip install pyarrow); the columnar format needs nothing extra.")
+        return None
+    except (SQLAlchemyError, OSError, ValueError) as e:
+        print(f"Error exporting {table} after {rows} rows: {e}")
+        if os.path.exists(partial):
+            os.remove(partial)
+        return None
+    seconds = time.perf_counter() - started
+    print(f"Exported {rows} {table} rows in {chunks} chunks to {path} in {seconds:.1f}s.")
+    return {"path": path, "rows": rows, "chunks": chunks, "seconds": round(seconds, 3)}
 
 # Example usage (for testing this module directly)
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+import csv
+import datetime
+import json
+import struct
+import zlib
+
+from sqlalchemy import select, func, literal_column
+
+from src.database.models import Project, Goal, ActivityLog, ActivitySpan, AppName, WindowTitle, DetailedContext
+
+# Streaming export of activity history for analysis outside the app. Rows are fetched
+# from a single ordered query chunk_size at a time (SQLite steps the cursor on demand)
+# and written out before the next chunk is read, so memory stays flat however much
+# history is exported. Activity rows are denormalized: each carries its span end,
+# duration, project name and goal text.
+#
+# Formats: csv, jsonl, columnar (built in, below) and parquet (needs pyarrow).
+#
+# The columnar format is a sequence of independently readable chunks after an 8-byte
+# magic: each is a little-endian (payload length, CRC-32 of payload) header and a
+# zlib-compressed JSON payload {"rows": n, "columns": {name: column}}. A column is
+# {"type": ..., "encoding": ..., ...}: strings are dictionary-encoded ("dictionary"
+# plus "codes"), timestamps are microseconds since the epoch (delta-encoded when the
+# chunk has no NULLs), everything else is stored plain. read_columnar() decodes it.
+
+EXPORT_FORMATS = ("csv", "jsonl", "columnar", "parquet")
+EXPORT_TABLES = ("activity", "goals", "projects")
+EXPORT_CHUNK_SIZE = 5000 # Rows fetched and written at a time
+COLUMNAR_MAGIC = b"PTCOLS1\n"
+
+_HEADER = struct.Struct("<II")
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# A log's span starts at the log; its end is a per-log lookup rather than a join, which
+# SQLite could not push into the UNION ALL views over attached archive months
+_span_end = select(ActivitySpan.end_time).where(ActivitySpan.log_id == ActivityLog.id).scalar_subquery()
+
+# (name, type, expression) of the exported columns of each table
+ACTIVITY_COLUMNS = (
+    ("id", "int", ActivityLog.id),
+    ("timestamp", "timestamp", ActivityLog.timestamp),
+    ("end_time", "timestamp", _span_end),
+    # Rounded to ms like spans.app_seconds_query; julianday() arithmetic carries float noise
+    ("duration_seconds", "float",
+     func.round((func.julianday(_span_end) - func.julianday(ActivityLog.timestamp)) * literal_column("86400.0"), 3)),
+    ("project_id", "int", ActivityLog.project_id),
+    ("project_name", "str", Project.name),
+    ("goal_id", "int", ActivityLog.goal_id),
+    ("goal_text", "str", Goal.text),
+    ("application_name", "str", AppName.value),
+    ("window_title", "str", WindowTitle.value),
+    ("detailed_context", "str", DetailedContext.value),
+)
+GOAL_COLUMNS = (
+    ("id", "int", Goal.id),
+    ("project_id", "int", Goal.project_id),
+    ("text", "str", Goal.text),
+    ("created_at", "timestamp", Goal.created_at),
+    ("completed_at", "timestamp", Goal.completed_at),
+    ("is_active", "bool", Goal.is_active),
+    ("target_minutes", "int", Goal.target_minutes),
+    ("time_spent_seconds", "float", Goal.time_spent_seconds),
+)
+PROJECT_COLUMNS = (
+    ("id", "int", Project.id),
+    ("name", "str", Project.name),
+    ("created_at", "timestamp", Project.created_at),
+    ("is_archived", "bool", Project.is_archived),
+)
+
+
+def activity_query(filters):
+    """Export rows of the activity logs matching filters, oldest first."""
+    return select(*(expression.label(name) for name, _, expression in ACTIVITY_COLUMNS)).select_from(
+        ActivityLog
+    ).outerjoin(AppName, AppName.id == ActivityLog.app_name_id
+    ).outerjoin(WindowTitle, WindowTitle.id == ActivityLog.window_title_id
+    ).outerjoin(DetailedContext, DetailedContext.id == ActivityLog.detailed_context_id
+    ).outerjoin(Project, Project.id == ActivityLog.project_id
+    ).outerjoin(Goal, Goal.id == ActivityLog.goal_id
+    ).where(*filters).order_by(ActivityLog.timestamp, ActivityLog.id)
+
+
+def goals_query(project_id: int = None, goal_id: int = None):
+    query = select(*(expression.label(name) for name, _, expression in GOAL_COLUMNS)).order_by(Goal.id)
+    if project_id is not None:
+        query = query.where(Goal.project_id == project_id)
+    if goal_id is not None:
+        query = query.where(Goal.id == goal_id)
+    return query
+
+
+def projects_query(project_id: int = None):
+    query = select(*(expression.label(name) for name, _, expression in PROJECT_COLUMNS)).order_by(Project.id)
+    if project_id is not None:
+        query = query.where(Project.id == project_id)
+    return query
+
+
+def fetch_chunks(result, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yields the rows of a result chunk_size at a time."""
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def _plain(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+class CsvWriter:
+    def __init__(self, f, columns):
+        self._writer = csv.writer(f)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self._writer.writerows([_plain(value) for value in row] for row in rows)
+
+
+class JsonlWriter:
+    def __init__(self, f, columns):
+        self._f = f
+        self._names = [name for name, _ in columns]
+
+    def write(self, rows):
+        self._f.write("".join(
+            json.dumps(dict(zip(self._names, map(_plain, row))), ensure_ascii=False) + "\n" for row in rows))
+
+
+def _encode_column(column_type: str, values):
+    if column_type == "str":
+        dictionary, codes = {}, []
+        for value in values:
+            codes.append(None if value is None else dictionary.setdefault(value, len(dictionary)))
+        return {"type": column_type, "encoding": "dict", "dictionary": list(dictionary), "codes": codes}
+    if column_type == "timestamp":
+        values = [None if value is None else (value - _EPOCH) // _MICROSECOND for value in values]
+        if values and None not in values:
+            deltas = [values[0]] + [b - a for a, b in zip(values, values[1:])]
+            return {"type": column_type, "encoding": "delta", "values": deltas}
+    return {"type": column_type, "encoding": "plain", "values": list(values)}
+
+
+def _decode_column(column):
+    if column["encoding"] == "dict":
+        dictionary = column["dictionary"]
+        return [None if code is None else dictionary[code] for code in column["codes"]]
+    values = column["values"]
+    if column["encoding"] == "delta":
+        total, decoded = 0, []
+        for delta in values:
+            total += delta
+            decoded.append(total)
+        values = decoded
+    if column["type"] == "timestamp":
+        return [None if value is None else _EPOCH + value * _MICROSECOND for value in values]
+    return values
+
+
+class ColumnarWriter:
+    def __init__(self, f, columns):
+        self._f = f
+        self._columns = columns
+        f.write(COLUMNAR_MAGIC)
+
+    def write(self, rows):
+        payload = {"rows": len(rows), "columns": {
+            name: _encode_column(column_type, [row[i] for row in rows])
+            for i, (name, column_type) in enumerate(self._columns)
+        }}
+        data = zlib.compress(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        self._f.write(_HEADER.pack(len(data), zlib.crc32(data)) + data)
+
+
+def read_columnar(path: str):
+    """Yields each chunk of a columnar export as {column name: list of values}."""
+    with open(path, "rb") as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar activity export")
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                break
+            length, checksum = _HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) != length or zlib.crc32(data) != checksum:
+                raise ValueError(f"{path} is truncated or corrupt")
+            payload = json.loads(zlib.decompress(data).decode("utf-8"))
+            yield {name: _decode_column(column) for name, column in payload["columns"].items()}
+
+
+class ParquetWriter:
+    # One Parquet row group per chunk
+    _TYPES = {"int": "int64", "float": "float64", "str": "string", "bool": "bool_"}
+
+    def __init__(self, path, columns):
+        import pyarrow
+        import pyarrow.parquet
+        self._pyarrow = pyarrow
+        self._names = [name for name, _ in columns]
+        self._schema = pyarrow.schema([
+            (name, pyarrow.timestamp("us") if column_type == "timestamp" else getattr(pyarrow, self._TYPES[column_type])())
+            for name, column_type in columns
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        arrays = [[row[i] for row in rows] for i in range(len(self._names))]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(
+            [self._pyarrow.array(values, type=field.type) for values, field in zip(arrays, self._schema)],
+            schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(fmt: str, path: str, columns):
+    """
+    Opens path and returns (writer, close). columns: (name, type) pairs. Raises
+    ValueError for an unknown format and ImportError for parquet without pyarrow.
+    """
+    if fmt == "parquet":
+        writer = ParquetWriter(path, columns)
+        return writer, writer.close
+    if fmt == "columnar":
+        f = open(path, "wb")
+        return ColumnarWriter(f, columns), f.close
+    if fmt in ("csv", "jsonl"):
+        f = open(path, "w", newline="", encoding="utf-8")
+        return (CsvWriter if fmt == "csv" else JsonlWriter)(f, columns), f.close
+    raise ValueError(f"Unknown export format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}.")
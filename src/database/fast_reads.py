@@ -0,0 +1,171 @@
+import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, bindparam, func, or_
+
+from src.database.models import Project, Goal, ActivityLog, ActivitySpan, AppName, WindowTitle
+from src.database import span_index, spans
+
+# Core-level read path for hot UI queries. Rows come back as plain named tuples instead of
+# ORM instances (no identity map, no attribute instrumentation), and every statement is
+# built once at import time with bind parameters, so SQLAlchemy's compiled-statement
+# cache serves each execution after the first. Attribute names match the ORM models, so
+# callers that only read a few attributes can switch without other changes.
+
+
+class ProjectRecord(NamedTuple):
+    id: int
+    name: str
+    is_archived: bool
+
+
+class GoalRecord(NamedTuple):
+    id: int
+    text: str
+    project_id: int
+    created_at: datetime.datetime
+    completed_at: Optional[datetime.datetime]
+    is_active: bool
+    target_minutes: Optional[int]
+    time_spent_minutes: Optional[int]
+    time_spent_seconds: Optional[float]
+
+
+class ActivityRecord(NamedTuple):
+    id: int
+    timestamp: datetime.datetime
+    application_name: str
+    window_title: str
+    goal_id: int
+    project_id: int
+
+
+class SpanRecord(NamedTuple):
+    log_id: int
+    start_time: datetime.datetime
+    end_time: datetime.datetime
+    application_name: str
+    window_title: str
+    goal_id: int
+    project_id: int
+
+
+_PROJECT_COLUMNS = (Project.id, Project.name, Project.is_archived)
+_GOAL_COLUMNS = (Goal.id, Goal.text, Goal.project_id, Goal.created_at, Goal.completed_at, Goal.is_active,
+                 Goal.target_minutes, Goal.time_spent_minutes, Goal.time_spent_seconds)
+
+_projects_stmt = select(*_PROJECT_COLUMNS).order_by(Project.name)
+_active_projects_stmt = select(*_PROJECT_COLUMNS).where(Project.is_archived == False).order_by(Project.name)
+
+_goals_for_project_stmt = select(*_GOAL_COLUMNS).where(
+    Goal.project_id == bindparam("project_id")
+).order_by(Goal.created_at.desc())
+_open_goals_for_project_stmt = _goals_for_project_stmt.where(Goal.completed_at == None)
+
+# Goals of every non-archived project, for views that list across projects
+_goals_of_active_projects_stmt = select(*_GOAL_COLUMNS).join(Project, Project.id == Goal.project_id).where(
+    Project.is_archived == False
+).order_by(Goal.created_at.desc())
+
+_activity_day_columns = (
+    ActivityLog.id, ActivityLog.timestamp, AppName.value, WindowTitle.value, ActivityLog.goal_id, ActivityLog.project_id
+)
+_activity_for_range_stmt = select(*_activity_day_columns).select_from(ActivityLog).outerjoin(
+    AppName, AppName.id == ActivityLog.app_name_id
+).outerjoin(
+    WindowTitle, WindowTitle.id == ActivityLog.window_title_id
+).where(
+    ActivityLog.timestamp >= bindparam("start", type_=ActivityLog.timestamp.type),
+    ActivityLog.timestamp < bindparam("end", type_=ActivityLog.timestamp.type)
+).order_by(ActivityLog.timestamp, ActivityLog.id)
+_project_activity_for_range_stmt = _activity_for_range_stmt.where(ActivityLog.project_id == bindparam("project_id"))
+
+
+def project_records(connection, include_archived: bool = False):
+    stmt = _projects_stmt if include_archived else _active_projects_stmt
+    return [ProjectRecord(*row) for row in connection.execute(stmt)]
+
+
+def goal_records_for_project(connection, project_id: int, include_completed: bool = False):
+    stmt = _goals_for_project_stmt if include_completed else _open_goals_for_project_stmt
+    return [GoalRecord(*row) for row in connection.execute(stmt, {"project_id": project_id})]
+
+
+def goal_records_for_active_projects(connection):
+    return [GoalRecord(*row) for row in connection.execute(_goals_of_active_projects_stmt)]
+
+
+def activity_records_for_range(connection, start: datetime.datetime, end: datetime.datetime, project_id: int = None):
+    if project_id is None:
+        result = connection.execute(_activity_for_range_stmt, {"start": start, "end": end})
+    else:
+        result = connection.execute(_project_activity_for_range_stmt, {"start": start, "end": end, "project_id": project_id})
+    return [ActivityRecord(*row) for row in result]
+
+
+# Spans overlapping [start, end), clipped to it; open spans run until end (at most rollup.MAX_SPAN_SECONDS)
+_span_start = bindparam("start", type_=ActivitySpan.start_time.type)
+_span_end = bindparam("end", type_=ActivitySpan.start_time.type)
+_span_columns = (ActivitySpan.log_id, ActivitySpan.start_time, ActivitySpan.end_time,
+                 AppName.value, WindowTitle.value, ActivitySpan.goal_id, ActivitySpan.project_id)
+
+
+def _span_select(*columns):
+    return select(*columns).select_from(ActivitySpan).outerjoin(
+        AppName, AppName.id == ActivitySpan.app_name_id
+    ).outerjoin(
+        WindowTitle, WindowTitle.id == ActivitySpan.window_title_id
+    )
+
+
+def _with_variants(stmt):
+    """(all projects, one project, all through the interval index, one through the index) variants of stmt."""
+    candidates = span_index.candidates(bindparam("start_seconds"), bindparam("end_seconds"))
+    project_candidates = span_index.candidates(bindparam("start_seconds"), bindparam("end_seconds"), bindparam("project_id"))
+    by_project = ActivitySpan.project_id == bindparam("project_id")
+    # The index matches the project exactly (ids are exact as R*Tree floats); repeating the
+    # equality would let the planner pick the project's B-tree over the index candidates
+    return (stmt, stmt.where(by_project), stmt.where(ActivitySpan.log_id.in_(candidates)),
+            stmt.where(ActivitySpan.log_id.in_(project_candidates)))
+
+
+_spans_for_range_stmts = _with_variants(_span_select(
+    ActivitySpan.log_id,
+    func.max(ActivitySpan.start_time, _span_start),
+    func.min(spans.open_span_end(_span_end), _span_end),
+    *_span_columns[3:]
+).where(
+    ActivitySpan.start_time < _span_end,
+    or_(ActivitySpan.end_time > _span_start, ActivitySpan.end_time == None)
+).order_by(ActivitySpan.start_time, ActivitySpan.log_id))
+
+# Spans in progress at a moment, unclipped; an open span only until its capped end (a
+# default one microsecond past the moment leaves the cap to decide)
+_span_moment = bindparam("at", type_=ActivitySpan.start_time.type)
+_span_after_moment = bindparam("after", type_=ActivitySpan.start_time.type)
+_spans_at_stmts = _with_variants(_span_select(*_span_columns).where(
+    ActivitySpan.start_time <= _span_moment,
+    or_(ActivitySpan.end_time > _span_moment, ActivitySpan.end_time == None),
+    spans.open_span_end(_span_after_moment) > _span_moment
+).order_by(ActivitySpan.project_id, ActivitySpan.start_time))
+
+
+def _execute_span_stmt(connection, stmts, params, start, end, project_id, indexed):
+    # indexed: the interval index is complete (see database_handler), so candidates come from it
+    variant = (2 if indexed else 0) + (project_id is not None)
+    if indexed:
+        params.update(start_seconds=span_index.epoch_seconds(start), end_seconds=span_index.epoch_seconds(end))
+    if project_id is not None:
+        params["project_id"] = project_id
+    return [SpanRecord(*row) for row in connection.execute(stmts[variant], params)]
+
+
+def span_records_for_range(connection, start: datetime.datetime, end: datetime.datetime, project_id: int = None,
+                           indexed: bool = False):
+    return _execute_span_stmt(connection, _spans_for_range_stmts, {"start": start, "end": end},
+                              start, end, project_id, indexed)
+
+
+def span_records_at(connection, moment: datetime.datetime, project_id: int = None, indexed: bool = False):
+    params = {"at": moment, "after": moment + datetime.timedelta(microseconds=1)}
+    return _execute_span_stmt(connection, _spans_at_stmts, params, moment, moment, project_id, indexed)
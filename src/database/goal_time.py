@@ -0,0 +1,97 @@
+from sqlalchemy import select, update, func, case, cast, and_, bindparam, Integer, Float
+
+from src.database.models import Goal, DailyAppUsage
+from src.database.rollup import IDLE_APP_NAME
+
+# Goal time ledger. goals.time_spent_seconds holds the closed activity spans credited to
+# each goal (the same spans as the daily_app_usage rollup, see rollup.py, so each counts
+# for at most MAX_SPAN_SECONDS, see rollup.capped_end()), updated with an atomic increment in the transaction that
+# writes the activity rows. Idle spans are not credited. time_spent_minutes is kept as the
+# whole minutes of it for older readers.
+#
+# time_adjustment_seconds holds the part of the total that no activity log accounts for:
+# manual corrections (add_goal_time) and the minutes counted before the ledger existed.
+# reconcile() adds it to the rollup sum, so rebuilding the totals never loses it.
+
+_goals = Goal.__table__
+
+_new_seconds = _goals.c.time_spent_seconds + bindparam("seconds", type_=Float)
+_target_reached = and_(
+    _goals.c.target_minutes > 0,
+    _goals.c.completed_at == None,
+    _new_seconds >= _goals.c.target_minutes * 60
+)
+
+# Increment and target check in one statement; every expression sees the row as it was before the update
+_credit_stmt = update(_goals).where(_goals.c.id == bindparam("goal_id")).values(
+    time_spent_seconds=_new_seconds,
+    time_spent_minutes=cast(_new_seconds / 60, Integer),
+    last_tracked_at=func.now(),
+    completed_at=case((_target_reached, func.now()), else_=_goals.c.completed_at),
+    is_active=case((_target_reached, False), else_=_goals.c.is_active),
+).returning(_goals.c.id, _goals.c.time_spent_seconds, _goals.c.target_minutes, _goals.c.completed_at)
+# RETURNING only sees the updated row, so whether the goal was completed already is read first
+_completed_at_stmt = select(_goals.c.completed_at).where(_goals.c.id == bindparam("goal_id"))
+_adjust_stmt = _credit_stmt.values(
+    time_adjustment_seconds=func.coalesce(_goals.c.time_adjustment_seconds, 0.0) + bindparam("seconds", type_=Float))
+
+
+def seconds_by_goal(deltas):
+    """Sums rollup deltas keyed (day, project_id, goal_id, application_name) per goal, leaving out idle time."""
+    totals = {}
+    for (_, _, goal_id, app_name), seconds in deltas.items():
+        if app_name == IDLE_APP_NAME:
+            continue
+        totals[goal_id] = totals.get(goal_id, 0) + seconds
+    return totals
+
+
+def credit(connection, seconds_by_goal_id, adjustment: bool = False):
+    """
+    Adds seconds to each goal's ledger; with adjustment they are manual corrections,
+    which reconcile() keeps. Goals that reach their target are completed and deactivated
+    by the same statement. Returns the ids of goals this completed (not those that
+    were completed already).
+    """
+    completed = []
+    for goal_id, seconds in seconds_by_goal_id.items():
+        if not seconds:
+            continue
+        completed_before = connection.execute(_completed_at_stmt, {"goal_id": goal_id}).scalar()
+        row = connection.execute(_adjust_stmt if adjustment else _credit_stmt, {"goal_id": goal_id, "seconds": seconds}).first()
+        if row is None:
+            continue
+        _, total, target_minutes, completed_at = row
+        if (completed_before is None and completed_at is not None and target_minutes and target_minutes > 0
+                and total - seconds < target_minutes * 60 <= total):
+            completed.append(goal_id)
+    return completed
+
+
+def reconcile(connection, goal_ids=None, project_id: int = None, keep_excess: bool = False):
+    """
+    Rebuilds time_spent_seconds from the daily_app_usage rollup plus the goal's
+    time_adjustment_seconds, for the given goals, the goals of one project, or every
+    goal. Goals without any rollup rows keep their current total. With keep_excess, the
+    part of a current total that neither accounts for is first added to the adjustment,
+    so totals counted before the ledger existed are never lowered. Returns the number
+    of goals updated.
+    """
+    rollup_seconds = func.coalesce(select(func.sum(DailyAppUsage.total_seconds)).where(
+        DailyAppUsage.goal_id == _goals.c.id, DailyAppUsage.application_name != IDLE_APP_NAME
+    ).scalar_subquery(), 0.0)
+    adjustment = func.coalesce(_goals.c.time_adjustment_seconds, 0.0)
+    filters = [select(DailyAppUsage.goal_id).where(DailyAppUsage.goal_id == _goals.c.id).exists()]
+    if goal_ids is not None:
+        filters.append(_goals.c.id.in_(list(goal_ids)))
+    if project_id is not None:
+        filters.append(_goals.c.project_id == project_id)
+    if keep_excess:
+        connection.execute(update(_goals).where(*filters).values(
+            time_adjustment_seconds=func.max(adjustment, func.coalesce(_goals.c.time_spent_seconds, 0.0) - rollup_seconds)))
+    total = rollup_seconds + adjustment
+    stmt = update(_goals).where(*filters).values(
+        time_spent_seconds=total,
+        time_spent_minutes=cast(total / 60, Integer),
+    )
+    return connection.execute(stmt).rowcount
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.database.models import AppName, WindowTitle, DetailedContext
+
+DEFAULT_CACHE_SIZE = 20000 # Distinct strings remembered per table
+_LOOKUP_CHUNK = 500 # Keeps IN (...) lists under SQLite's bound-parameter limit
+
+# Record field -> (interned string table, id column on activity_logs)
+ACTIVITY_STRING_FIELDS = {
+    "application_name": (AppName.__table__, "app_name_id"),
+    "window_title": (WindowTitle.__table__, "window_title_id"),
+    "detailed_context": (DetailedContext.__table__, "detailed_context_id"),
+}
+
+
+class StringInterner:
+    """Maps strings to their ids in one interned string table, with an in-process LRU cache."""
+
+    def __init__(self, table, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.table = table
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, values):
+        """Returns {value: id} for the values already cached."""
+        found = {}
+        with self._lock:
+            for value in values:
+                string_id = self._cache.get(value)
+                if string_id is None:
+                    self.misses += 1
+                    continue
+                self._cache.move_to_end(value)
+                found[value] = string_id
+                self.hits += 1
+        return found
+
+    def remember(self, mapping):
+        with self._lock:
+            for value, string_id in mapping.items():
+                self._cache[value] = string_id
+                self._cache.move_to_end(value)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def intern(self, connection, values):
+        """Inserts any values the table does not have yet and returns {value: id}. Does not cache."""
+        values = list(values)
+        if not values:
+            return {}
+        insert = sqlite_insert(self.table).on_conflict_do_nothing(index_elements=["value"])
+        connection.execute(insert, [{"value": value} for value in values])
+        mapping = {}
+        for start in range(0, len(values), _LOOKUP_CHUNK):
+            chunk = values[start:start + _LOOKUP_CHUNK]
+            rows = connection.execute(select(self.table.c.value, self.table.c.id).where(self.table.c.value.in_(chunk)))
+            mapping.update((value, string_id) for value, string_id in rows)
+        return mapping
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class ActivityStringEncoder:
+    """
+    Replaces the string fields of activity records with interned ids. Strings missing
+    from the cache are interned in their own short transaction and only cached once it
+    has committed, so a cached id always refers to a row that exists.
+    """
+
+    def __init__(self, engine, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.engine = engine
+        self.interners = {field: StringInterner(table, cache_size) for field, (table, _) in ACTIVITY_STRING_FIELDS.items()}
+
+    def encode(self, records):
+        values = {field: {r.get(field) for r in records} - {None} for field in ACTIVITY_STRING_FIELDS}
+        ids = {field: self.interners[field].lookup(values[field]) for field in ACTIVITY_STRING_FIELDS}
+        missing = {field: values[field] - ids[field].keys() for field in ACTIVITY_STRING_FIELDS}
+        if any(missing.values()):
+            created = {}
+            with self.engine.begin() as connection:
+                for field, field_values in missing.items():
+                    created[field] = self.interners[field].intern(connection, field_values)
+            for field, mapping in created.items():
+                self.interners[field].remember(mapping)
+                ids[field].update(mapping)
+
+        encoded = []
+        for record in records:
+            row = {key: value for key, value in record.items() if key not in ACTIVITY_STRING_FIELDS}
+            for field, (_, id_column) in ACTIVITY_STRING_FIELDS.items():
+                value = record.get(field)
+                row[id_column] = ids[field][value] if value is not None else None
+            encoded.append(row)
+        return encoded
+
+    def stats(self):
+        return {field: {"hits": i.hits, "misses": i.misses, "cached": len(i._cache)} for field, i in self.interners.items()}
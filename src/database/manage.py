@@ -0,0 +1,235 @@
+"""
+Maintenance commands for the tracker database.
+
+Run from the project root, e.g.:
+    python -m src.database.manage rebuild-rollup --since 2024-01-01
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database import database_handler
+
+
+def _parse_day(value: str) -> datetime.date:
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date '{value}'. Please use YYYY-MM-DD.")
+
+
+def _read_activity_file(path: str):
+    """
+    Yields activity records from a .jsonl or .csv file with ISO timestamps: naive ones
+    are UTC, ones with an offset are converted (see bulk_insert_activity()).
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            record = dict(row)
+            record["timestamp"] = datetime.datetime.fromisoformat(record["timestamp"]) if record.get("timestamp") else None
+            for key in ("goal_id", "project_id"):
+                record[key] = int(record[key]) if record.get(key) not in (None, "") else None
+            yield record
+
+
+def cmd_import_activity(args):
+    database_handler.init_db()
+    summary = database_handler.bulk_insert_activity(_read_activity_file(args.path), batch_size=args.batch_size,
+                                                    skip_existing=args.skip_existing)
+    return 1 if "error" in summary else 0
+
+
+def cmd_rebuild_rollup(args):
+    database_handler.init_db()
+    rows_read = database_handler.rebuild_daily_usage(project_id=args.project_id, first_day=args.since, last_day=args.until)
+    return 0 if rows_read is not None else 1
+
+
+def cmd_rebuild_spans(args):
+    database_handler.init_db()
+    written = database_handler.rebuild_activity_spans(project_id=args.project_id)
+    return 0 if written is not None else 1
+
+
+def cmd_reconcile_goal_time(args):
+    database_handler.init_db()
+    updated = database_handler.reconcile_goal_times(project_id=args.project_id)
+    return 0 if updated is not None else 1
+
+
+def cmd_query_stats(args):
+    path = args.file or os.path.join(database_handler.DATA_DIR, database_handler.QUERY_STATS_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read query statistics from {path}: {e}")
+        print("The app writes them on exit; call database_handler.dump_query_stats() to write them from a running session.")
+        return 1
+    statements = sorted(data["statements"], key=lambda entry: entry[args.order_by], reverse=True)[:args.top]
+    print(f"Query statistics from {data['since']} to {data['dumped_at']} (slow-query threshold {data['slow_query_ms']} ms)")
+    print(f"{'count':>8} {'total ms':>11} {'mean ms':>9} {'max ms':>9} {'rows':>8}  statement / callers")
+    for entry in statements:
+        print(f"{entry['count']:>8} {entry['total_ms']:>11.1f} {entry['mean_ms']:>9.3f} {entry['max_ms']:>9.1f} {entry['rows']:>8}  {entry['statement'][:100]}")
+        print(f"{'':>50}{', '.join(f'{caller} x{count}' for caller, count in entry['callers'].items())}")
+    if data["slow_queries"]:
+        print(f"\n{len(data['slow_queries'])} slow queries:")
+        for entry in data["slow_queries"][-args.top:]:
+            print(f"{entry['at']} {entry['elapsed_ms']:>9.1f} ms {entry['caller']}: {entry['statement'][:100]}")
+            for line in entry["plan"] or ():
+                print(f"{'':>24}{'FULL SCAN ' if line in entry['full_scans'] else ''}{line}")
+    return 0
+
+
+def cmd_search(args):
+    database_handler.init_db()
+    start = datetime.datetime.combine(args.since, datetime.time.min) if args.since else None
+    end = datetime.datetime.combine(args.until + datetime.timedelta(days=1), datetime.time.min) if args.until else None
+    result = database_handler.search_activity(args.query, start, end, project_id=args.project_id)
+    print(f"{len(result['spans'])} matching spans, {result['total_seconds'] / 3600:.2f} h in total")
+    for title, totals in (("By app", result["by_app"]), ("By goal", result["by_goal"]), ("By day", result["by_day"])):
+        print(f"\n{title}:")
+        for key, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"{seconds / 3600:>9.2f} h  {key}")
+    return 0
+
+
+def cmd_archive(args):
+    database_handler.init_db()
+    if not args.list:
+        moved = database_handler.archive_old_activity(older_than_days=args.older_than_days, compact=not args.no_compact)
+        if moved is None:
+            return 1
+    for partition in database_handler.get_archive_partitions():
+        print(f"{partition['month']}  {partition['log_count']:>9} logs  {partition['file_name']}"
+              f"{'  (compacted, read-only)' if partition['compacted'] else ''}"
+              f"{'  (partial, some logs still hot)' if partition['partial'] else ''}")
+    return 0
+
+
+def cmd_backup(args):
+    database_handler.init_db()
+    if args.status:
+        # A running app writes its backup job's state next to the snapshots
+        status = database_handler.backup.read_status(database_handler._backup_dir())
+        if status is None:
+            print("No backup has been run yet.")
+        else:
+            for key, value in status.items():
+                print(f"{key:>14}: {value}")
+        for path in database_handler.get_backup_job().snapshots():
+            print(f"{os.path.getsize(path) / 2**20:>10.1f} MiB  {path}")
+        return 0
+    path = database_handler.backup_database(keep=args.keep, pages_per_step=args.pages_per_step)
+    return 0 if path else 1
+
+
+_EXPORT_EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet", ".cols": "columnar"}
+
+
+def cmd_export(args):
+    fmt = args.format or _EXPORT_EXTENSIONS.get(os.path.splitext(args.path)[1].lower())
+    if fmt is None:
+        print(f"Cannot tell the format from '{args.path}'; pass --format.")
+        return 1
+    database_handler.init_db()
+    start = datetime.datetime.combine(args.since, datetime.time.min) if args.since else None
+    end = datetime.datetime.combine(args.until + datetime.timedelta(days=1), datetime.time.min) if args.until else None
+    summary = database_handler.export_activity(args.path, fmt, table=args.table, start=start, end=end,
+                                               project_id=args.project_id, goal_id=args.goal_id, chunk_size=args.chunk_size)
+    return 0 if summary else 1
+
+
+def cmd_vacuum(args):
+    database_handler.init_db()
+    database_handler.vacuum_database()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Productivity Tracker database maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    importer = subparsers.add_parser("import-activity", help="Bulk load activity history from a .jsonl or .csv file")
+    importer.add_argument("path", help="File with timestamp, goal_id, project_id, application_name, window_title, detailed_context")
+    importer.add_argument("--batch-size", type=int, default=database_handler.BULK_BATCH_SIZE, help="Records per transaction")
+    importer.add_argument("--skip-existing", action="store_true", help="Skip records already logged (same project and timestamp)")
+    importer.set_defaults(func=cmd_import_activity)
+
+    rebuild = subparsers.add_parser("rebuild-rollup", help="Recompute the daily_app_usage rollup from the activity log")
+    rebuild.add_argument("--project-id", type=int, default=None, help="Only rebuild this project")
+    rebuild.add_argument("--since", type=_parse_day, default=None, help="First day to rebuild (YYYY-MM-DD)")
+    rebuild.add_argument("--until", type=_parse_day, default=None, help="Last day to rebuild, inclusive (YYYY-MM-DD)")
+    rebuild.set_defaults(func=cmd_rebuild_rollup)
+
+    rebuild_spans = subparsers.add_parser("rebuild-spans", help="Recompute activity_spans from the activity log")
+    rebuild_spans.add_argument("--project-id", type=int, default=None, help="Only rebuild this project")
+    rebuild_spans.set_defaults(func=cmd_rebuild_spans)
+
+    reconcile = subparsers.add_parser("reconcile-goal-time", help="Recompute goal time totals from the daily_app_usage rollup")
+    reconcile.add_argument("--project-id", type=int, default=None, help="Only reconcile goals of this project")
+    reconcile.set_defaults(func=cmd_reconcile_goal_time)
+
+    stats = subparsers.add_parser("query-stats", help="Show the statement timings and slow queries the app recorded")
+    stats.add_argument("--file", default=None, help="Statistics file (default: .data/query_stats.json)")
+    stats.add_argument("--top", type=int, default=20, help="Number of statements to show")
+    stats.add_argument("--order-by", choices=["total_ms", "count", "mean_ms", "max_ms", "rows"], default="total_ms")
+    stats.set_defaults(func=cmd_query_stats)
+
+    search = subparsers.add_parser("search", help="Time spent on activity whose window title or context matches a search")
+    search.add_argument("query", help="Words or \"quoted phrases\" that must all match; end a word with * for a prefix")
+    search.add_argument("--since", type=_parse_day, default=None, help="First day to include (YYYY-MM-DD)")
+    search.add_argument("--until", type=_parse_day, default=None, help="Last day to include, inclusive (YYYY-MM-DD)")
+    search.add_argument("--project-id", type=int, default=None, help="Only search this project")
+    search.add_argument("--top", type=int, default=20, help="Rows to show per breakdown")
+    search.set_defaults(func=cmd_search)
+
+    archive = subparsers.add_parser("archive", help="Move raw activity of old months into monthly files under .data/archive/")
+    archive.add_argument("--older-than-days", type=int, default=database_handler.archive.DEFAULT_ARCHIVE_AFTER_DAYS,
+                         help="Archive whole months that ended at least this many days ago")
+    archive.add_argument("--no-compact", action="store_true", help="Leave new archive files writable and unvacuumed")
+    archive.add_argument("--list", action="store_true", help="Only list the archived months")
+    archive.set_defaults(func=cmd_archive)
+
+    backup_parser = subparsers.add_parser("backup", help="Snapshot the live database into .data/backups/ (safe while the app runs)")
+    backup_parser.add_argument("--keep", type=int, default=None,
+                               help=f"Snapshots to keep (default {database_handler.backup.DEFAULT_KEEP_BACKUPS})")
+    backup_parser.add_argument("--pages-per-step", type=int, default=None, help="Database pages copied per backup step")
+    backup_parser.add_argument("--status", action="store_true", help="Show the last backup's status and the snapshots kept")
+    backup_parser.set_defaults(func=cmd_backup)
+
+    exporter = subparsers.add_parser("export", help="Stream activity history (or goals/projects) to a file for analysis")
+    exporter.add_argument("path", help="Output file; .csv, .jsonl, .parquet or .cols (columnar) unless --format is given")
+    exporter.add_argument("--format", choices=database_handler.export.EXPORT_FORMATS, default=None)
+    exporter.add_argument("--table", choices=database_handler.export.EXPORT_TABLES, default="activity")
+    exporter.add_argument("--since", type=_parse_day, default=None, help="First day to export (YYYY-MM-DD)")
+    exporter.add_argument("--until", type=_parse_day, default=None, help="Last day to export, inclusive (YYYY-MM-DD)")
+    exporter.add_argument("--project-id", type=int, default=None, help="Only export this project")
+    exporter.add_argument("--goal-id", type=int, default=None, help="Only export this goal")
+    exporter.add_argument("--chunk-size", type=int, default=database_handler.export.EXPORT_CHUNK_SIZE,
+                          help="Rows fetched and written at a time")
+    exporter.set_defaults(func=cmd_export)
+
+    vacuum = subparsers.add_parser("vacuum", help="Compact the database file and return free space to the OS")
+    vacuum.set_defaults(func=cmd_vacuum)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
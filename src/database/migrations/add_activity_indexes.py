@@ -0,0 +1,21 @@
+from sqlalchemy.sql import text
+
+VERSION = 2
+NAME = "add_activity_indexes"
+
+# Hot queries filter on project or goal plus a timestamp range. The same indexes are
+# declared on the models, so fresh databases already have them and IF NOT EXISTS is a no-op.
+INDEXES = [
+    ("ix_activity_logs_project_timestamp", "activity_logs", "project_id, timestamp"),
+    ("ix_activity_logs_goal_timestamp", "activity_logs", "goal_id, timestamp"),
+    ("ix_goals_project_created", "goals", "project_id, created_at"),
+]
+
+def upgrade(connection):
+    for name, table, columns in INDEXES:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    connection.execute(text("ANALYZE"))
+
+def downgrade(connection):
+    for name, _, _ in INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
@@ -0,0 +1,16 @@
+from sqlalchemy.sql import text
+
+from src.database.migrations.helpers import table_columns
+from src.database import goal_time
+
+VERSION = 11
+NAME = "add_goal_time_adjustments"
+
+def upgrade(connection):
+    """
+    Adds goals.time_adjustment_seconds (manual corrections, kept when totals are rebuilt)
+    and records in it the part of each total that the rollup does not account for.
+    """
+    if "time_adjustment_seconds" not in table_columns(connection, "goals"):
+        connection.execute(text("ALTER TABLE goals ADD COLUMN time_adjustment_seconds REAL DEFAULT 0"))
+    goal_time.reconcile(connection, keep_excess=True)
@@ -0,0 +1,26 @@
+from sqlalchemy.sql import text
+
+from src.database.migrations.helpers import table_columns
+from src.database import goal_time
+
+VERSION = 5
+NAME = "add_goal_time_ledger"
+BACKFILL = True # upgrade() adds the ledger column, backfill() rebuilds it from the rollup
+
+def upgrade(connection):
+    if "time_spent_seconds" not in table_columns(connection, "goals"):
+        connection.execute(text("ALTER TABLE goals ADD COLUMN time_spent_seconds REAL"))
+    # Start from the old per-minute totals until the backfill has run; only touches unseeded rows
+    connection.execute(text(
+        "UPDATE goals SET time_spent_seconds = COALESCE(time_spent_minutes, 0) * 60 WHERE time_spent_seconds IS NULL"
+    ))
+
+def backfill(connection):
+    """
+    Recomputes goal totals from daily_app_usage, which the earlier backfills have filled
+    by now. Minutes counted before the ledger that the activity logs do not cover are
+    kept as the goal's adjustment, so no total is lowered.
+    """
+    updated = goal_time.reconcile(connection, keep_excess=True)
+    print(f"Goal time ledger rebuilt for {updated} goals.")
+    yield updated
@@ -0,0 +1,22 @@
+from sqlalchemy import select, update
+from sqlalchemy.sql import text
+
+from src.database.models import ActivityLog, ArchivePartition
+from src.database.archive import month_bounds
+from src.database.migrations.helpers import table_columns
+
+VERSION = 10
+NAME = "add_partial_archive_months"
+
+def upgrade(connection):
+    """
+    Adds archive_partitions.partial and sets it for months archived while one of their
+    logs still had an open span: that log stayed hot, and the next archive run moves it.
+    """
+    if "partial" not in table_columns(connection, "archive_partitions"):
+        connection.execute(text("ALTER TABLE archive_partitions ADD COLUMN partial BOOLEAN DEFAULT 0"))
+    for month in connection.execute(select(ArchivePartition.month)).scalars().all():
+        start, end = month_bounds(month)
+        if connection.execute(select(ActivityLog.id).where(
+                ActivityLog.timestamp >= start, ActivityLog.timestamp < end).limit(1)).first() is not None:
+            connection.execute(update(ArchivePartition).where(ArchivePartition.month == month).values(partial=True))
@@ -0,0 +1,14 @@
+from src.database import span_index
+
+VERSION = 7
+NAME = "add_span_interval_index"
+BACKFILL = True # Range queries only use the index once this is recorded
+
+def upgrade(connection):
+    # Idempotent; from here on the triggers index every span that is written
+    span_index.create(connection)
+
+def backfill(connection):
+    """Indexes the spans that existed before the triggers, INTERVAL_BATCH_SIZE per batch."""
+    if span_index.exists(connection):
+        yield from span_index.rebuild(connection)
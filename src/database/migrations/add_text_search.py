@@ -0,0 +1,25 @@
+from sqlalchemy.sql import text
+
+from src.database import text_search
+
+VERSION = 8
+NAME = "add_text_search"
+BACKFILL = True # Searches only use the FTS index once this is recorded
+
+# Searches go from matching string ids to their logs. Declared on the model as well, so
+# fresh databases already have them.
+INDEXES = [
+    ("ix_activity_logs_window_title_timestamp", "activity_logs", "window_title_id, timestamp"),
+    ("ix_activity_logs_context_timestamp", "activity_logs", "detailed_context_id, timestamp"),
+]
+
+def upgrade(connection):
+    # Idempotent; from here on the triggers index every newly interned string
+    for name, table, columns in INDEXES:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    text_search.create(connection)
+
+def backfill(connection):
+    """Indexes the strings interned before the triggers existed, one table per batch."""
+    if text_search.exists(connection):
+        yield from text_search.rebuild(connection)
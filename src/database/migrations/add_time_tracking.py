@@ -1,26 +1,30 @@
-from sqlalchemy import create_engine, Column, Integer, DateTime
 from sqlalchemy.sql import text
-from src.database.database_handler import Base, DATABASE_URL
+from src.database.migrations.helpers import table_columns
 
-def upgrade():
-    engine = create_engine(DATABASE_URL)
-    
-    # Add new columns one at a time
-    with engine.connect() as conn:
-        conn.execute(text("ALTER TABLE goals ADD COLUMN target_minutes INTEGER"))
-        conn.execute(text("ALTER TABLE goals ADD COLUMN time_spent_minutes INTEGER DEFAULT 0"))
-        conn.execute(text("ALTER TABLE goals ADD COLUMN last_tracked_at TIMESTAMP"))
-        conn.commit()
+VERSION = 1
+NAME = "add_time_tracking"
 
-def downgrade():
-    engine = create_engine(DATABASE_URL)
-    
+# (column, DDL) pairs added to goals; databases created after this change already have them
+GOAL_COLUMNS = [
+    ("target_minutes", "INTEGER"),
+    ("time_spent_minutes", "INTEGER DEFAULT 0"),
+    ("last_tracked_at", "TIMESTAMP"),
+]
+
+def upgrade(connection):
+    existing = table_columns(connection, "goals")
+    # Add new columns one at a time, skipping any that are already there
+    for column, ddl in GOAL_COLUMNS:
+        if column not in existing:
+            connection.execute(text(f"ALTER TABLE goals ADD COLUMN {column} {ddl}"))
+
+def downgrade(connection):
+    existing = table_columns(connection, "goals")
     # Remove columns one at a time
-    with engine.connect() as conn:
-        conn.execute(text("ALTER TABLE goals DROP COLUMN target_minutes"))
-        conn.execute(text("ALTER TABLE goals DROP COLUMN time_spent_minutes"))
-        conn.execute(text("ALTER TABLE goals DROP COLUMN last_tracked_at"))
-        conn.commit()
+    for column, _ in reversed(GOAL_COLUMNS):
+        if column in existing:
+            connection.execute(text(f"ALTER TABLE goals DROP COLUMN {column}"))
 
 if __name__ == "__main__":
-    upgrade() 
\ No newline at end of file
+    from src.database.database_handler import init_db
+    init_db() # Applies every pending migration, including this one
@@ -0,0 +1,27 @@
+import datetime
+
+from sqlalchemy import select, func
+
+from src.database.models import ActivityLog
+from src.database import rollup
+from src.database.migrations.helpers import needs_string_encoding
+
+VERSION = 3
+NAME = "backfill_daily_usage"
+BACKFILL = True # Runs in bounded batches after the schema migrations, see runner.py
+
+DAYS_PER_BATCH = 7
+
+def backfill(connection):
+    """Fills daily_app_usage for history logged before the rollup existed, a week per batch."""
+    if needs_string_encoding(connection):
+        return # App names are not resolvable yet; intern_activity_strings rebuilds the rollup once they are
+    first, last = connection.execute(select(func.min(ActivityLog.timestamp), func.max(ActivityLog.timestamp))).first()
+    if first is None:
+        return
+    day = first.date()
+    while day <= last.date():
+        batch_last_day = min(day + datetime.timedelta(days=DAYS_PER_BATCH - 1), last.date())
+        rollup.rebuild_daily_usage(connection, first_day=day, last_day=batch_last_day)
+        yield batch_last_day
+        day = batch_last_day + datetime.timedelta(days=1)
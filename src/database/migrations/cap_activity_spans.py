@@ -0,0 +1,21 @@
+import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.database.models import DatabaseSetting
+from src.database import rollup
+
+VERSION = 9
+NAME = "cap_activity_spans"
+
+def upgrade(connection):
+    """
+    Records the moment spans start being capped at rollup.MAX_SPAN_SECONDS: from here on
+    the tracker re-logs an unchanged window every heartbeat. Logs written before that
+    were only logged when the window changed, so their spans, the rollup and the goal
+    totals built from them are left as they are (see rollup.capped_end()).
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    connection.execute(sqlite_insert(DatabaseSetting.__table__).values(
+        key=rollup.SPAN_CAP_SETTING, value=now.strftime(rollup.SPAN_CAP_FORMAT)).on_conflict_do_nothing())
+    rollup.load_span_cap(connection)
@@ -0,0 +1,12 @@
+from src.database import spans
+
+VERSION = 6
+NAME = "convert_activity_spans"
+BACKFILL = True # The table comes from create_all(); backfill() derives spans for existing logs
+
+def backfill(connection):
+    """
+    Writes a span for every existing activity log, SPAN_BATCH_SIZE logs per batch. Runs
+    after intern_activity_strings, so the interned id columns are filled in by then.
+    """
+    yield from spans.rebuild_all(connection)
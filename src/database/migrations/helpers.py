@@ -0,0 +1,21 @@
+from sqlalchemy.sql import text
+
+
+def table_columns(connection, table: str):
+    """Returns the set of column names currently present on a table."""
+    return {row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def table_exists(connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = :name"), {"name": table}
+    ).first() is not None
+
+
+def needs_string_encoding(connection) -> bool:
+    """True while activity rows still carry their strings inline instead of interned ids."""
+    if "application_name" not in table_columns(connection, "activity_logs"):
+        return False # Created after interning; the legacy columns never existed
+    return connection.execute(text(
+        "SELECT 1 FROM activity_logs WHERE app_name_id IS NULL AND application_name IS NOT NULL LIMIT 1"
+    )).first() is not None
@@ -0,0 +1,52 @@
+from sqlalchemy.sql import text
+
+from src.database.migrations.helpers import table_columns, needs_string_encoding
+from src.database.migrations import backfill_daily_usage
+
+VERSION = 4
+NAME = "intern_activity_strings"
+BACKFILL = True # upgrade() adds the id columns at startup, backfill() re-encodes old rows in batches
+
+ROWS_PER_BATCH = 10000
+
+# Legacy string column on activity_logs -> (interned string table, new id column)
+ENCODED_COLUMNS = [
+    ("application_name", "app_names", "app_name_id"),
+    ("window_title", "window_titles", "window_title_id"),
+    ("detailed_context", "detailed_contexts", "detailed_context_id"),
+]
+
+def upgrade(connection):
+    existing = table_columns(connection, "activity_logs")
+    for _, table, id_column in ENCODED_COLUMNS:
+        if id_column not in existing:
+            connection.execute(text(f"ALTER TABLE activity_logs ADD COLUMN {id_column} INTEGER REFERENCES {table}(id)"))
+
+def backfill(connection):
+    """
+    Moves inline strings into the interned tables, ROWS_PER_BATCH rows at a time, and
+    clears the legacy columns (run VACUUM afterwards to return the space to the OS).
+    The daily rollup is rebuilt afterwards since it could not resolve names before.
+    """
+    if not needs_string_encoding(connection):
+        return
+    first_id, last_id = connection.execute(text("SELECT MIN(id), MAX(id) FROM activity_logs WHERE app_name_id IS NULL")).first()
+    low = first_id
+    while low is not None and low <= last_id:
+        bounds = {"low": low, "high": low + ROWS_PER_BATCH}
+        for column, table, _ in ENCODED_COLUMNS:
+            connection.execute(text(
+                f"INSERT OR IGNORE INTO {table} (value) SELECT DISTINCT {column} FROM activity_logs "
+                f"WHERE id >= :low AND id < :high AND {column} IS NOT NULL"
+            ), bounds)
+        assignments = ", ".join(
+            f"{id_column} = (SELECT id FROM {table} WHERE value = activity_logs.{column}), {column} = NULL"
+            for column, table, id_column in ENCODED_COLUMNS
+        )
+        connection.execute(text(
+            f"UPDATE activity_logs SET {assignments} WHERE id >= :low AND id < :high AND app_name_id IS NULL"
+        ), bounds)
+        yield bounds["high"]
+        low = bounds["high"]
+
+    yield from backfill_daily_usage.backfill(connection)
@@ -0,0 +1,140 @@
+import datetime
+import threading
+import time
+
+from sqlalchemy.sql import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.database.migrations import (
+    add_time_tracking, add_activity_indexes, backfill_daily_usage, intern_activity_strings, add_goal_time_ledger,
+    convert_activity_spans, add_span_interval_index, add_text_search, cap_activity_spans,
+    add_partial_archive_months, add_goal_time_adjustments
+)
+
+# Every migration module defines VERSION, NAME and upgrade(connection), applied in one
+# transaction at startup, and/or, with BACKFILL = True, a backfill(connection) generator
+# that yields after each bounded batch. A backfill migration's upgrade() runs on every
+# launch until its backfill completes, so it must be idempotent. Append new migrations
+# here with the next VERSION.
+MIGRATIONS = [
+    add_time_tracking,
+    add_activity_indexes,
+    backfill_daily_usage,
+    intern_activity_strings,
+    add_goal_time_ledger,
+    convert_activity_spans,
+    add_span_interval_index,
+    add_text_search,
+    cap_activity_spans,
+    add_partial_archive_months,
+    add_goal_time_adjustments,
+]
+
+BACKFILL_PAUSE = 0.05 # Seconds to sleep between backfill batches so other writers get the lock
+
+_backfill_thread = None
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _record(connection, migration):
+    connection.execute(
+        text("INSERT OR REPLACE INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": migration.VERSION, "name": migration.NAME, "applied_at": datetime.datetime.now()}
+    )
+
+
+def applied_versions(connection):
+    _ensure_version_table(connection)
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def get_schema_version(engine) -> int:
+    """Highest version such that it and every migration before it have been applied."""
+    with engine.connect() as connection:
+        applied = applied_versions(connection)
+        connection.commit()
+    version = 0
+    for migration in sorted(MIGRATIONS, key=lambda m: m.VERSION):
+        if migration.VERSION not in applied:
+            break
+        version = migration.VERSION
+    return version
+
+
+def _run_backfill(engine, migration):
+    print(f"Running backfill migration {migration.VERSION} ({migration.NAME})...")
+    started = time.monotonic()
+    batches = 0
+    try:
+        with engine.connect() as connection:
+            for _ in migration.backfill(connection):
+                connection.commit() # Release the write lock after every batch
+                batches += 1
+                time.sleep(BACKFILL_PAUSE)
+            _record(connection, migration)
+            connection.commit()
+        print(f"Backfill migration {migration.VERSION} ({migration.NAME}) finished: {batches} batches in {time.monotonic() - started:.1f}s.")
+        return True
+    except SQLAlchemyError as e:
+        # Batches are idempotent, so the backfill simply starts over on the next launch
+        print(f"Error in backfill migration {migration.VERSION} ({migration.NAME}): {e}")
+        return False
+
+
+def _run_backfills(engine, backfills):
+    for migration in backfills:
+        if not _run_backfill(engine, migration):
+            break
+
+
+def run_migrations(engine, background_backfills: bool = True):
+    """
+    Applies pending schema migrations in version order, then runs pending backfills.
+    Backfills run on a background thread by default so startup is not held up by them.
+    """
+    global _backfill_thread
+    pending_backfills = []
+    with engine.connect() as connection:
+        applied = applied_versions(connection)
+        connection.commit()
+        for migration in sorted(MIGRATIONS, key=lambda m: m.VERSION):
+            if migration.VERSION in applied:
+                continue
+            is_backfill = getattr(migration, "BACKFILL", False)
+            try:
+                if hasattr(migration, "upgrade"):
+                    migration.upgrade(connection)
+                if not is_backfill:
+                    _record(connection, migration)
+                connection.commit()
+            except SQLAlchemyError:
+                connection.rollback()
+                raise
+            if is_backfill:
+                pending_backfills.append(migration) # Recorded once the backfill completes
+            else:
+                print(f"Applied migration {migration.VERSION} ({migration.NAME}).")
+
+    if not pending_backfills:
+        return None
+    if not background_backfills:
+        _run_backfills(engine, pending_backfills)
+        return None
+    _backfill_thread = threading.Thread(target=_run_backfills, args=(engine, pending_backfills),
+                                        name="MigrationBackfill", daemon=True)
+    _backfill_thread.start()
+    return _backfill_thread
+
+
+def wait_for_backfills(timeout: float = None) -> bool:
+    """Blocks until background backfills finish. Returns False if they are still running."""
+    if _backfill_thread is None:
+        return True
+    _backfill_thread.join(timeout)
+    return not _backfill_thread.is_alive()
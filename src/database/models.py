@@ -0,0 +1,126 @@
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, Boolean, func, ForeignKey, Text, Index, select
+from sqlalchemy.orm import declarative_base, relationship, column_property
+
+Base = declarative_base()
+
+class Project(Base):
+    __tablename__ = "projects"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now())
+    is_archived = Column(Boolean, default=False)
+    goals = relationship("Goal", back_populates="project", cascade="all, delete-orphan")
+    activity_logs = relationship("ActivityLog", back_populates="project", cascade="all, delete-orphan")
+
+class Goal(Base):
+    __tablename__ = "goals"
+    id = Column(Integer, primary_key=True, index=True)
+    text = Column(String, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    is_active = Column(Boolean, default=False, index=True) # Default to False, explicitly set one active
+    completed_at = Column(DateTime, nullable=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    project = relationship("Project", back_populates="goals")
+    activity_logs = relationship("ActivityLog", back_populates="goal", cascade="all, delete-orphan")
+    target_minutes = Column(Integer, nullable=True)  # Target time in minutes
+    time_spent_minutes = Column(Integer, default=0)  # Whole minutes of time_spent_seconds
+    time_spent_seconds = Column(Float, default=0)  # Goal time ledger, see src/database/goal_time.py
+    time_adjustment_seconds = Column(Float, default=0)  # Manual corrections and pre-ledger time, kept by reconciling
+    last_tracked_at = Column(DateTime, nullable=True)  # Last time tracking update
+    __table_args__ = (
+        Index("ix_goals_project_created", "project_id", "created_at"),
+    )
+
+# Interned string tables: each distinct app name, window title and URL/doc path is stored
+# once and activity rows reference it by id. See src/database/interning.py.
+class AppName(Base):
+    __tablename__ = "app_names"
+    id = Column(Integer, primary_key=True)
+    value = Column(String, unique=True, nullable=False)
+
+class WindowTitle(Base):
+    __tablename__ = "window_titles"
+    id = Column(Integer, primary_key=True)
+    value = Column(Text, unique=True, nullable=False) # Window titles can be long
+
+class DetailedContext(Base):
+    __tablename__ = "detailed_contexts"
+    id = Column(Integer, primary_key=True)
+    value = Column(Text, unique=True, nullable=False)
+
+def _interned_value(string_table, id_column):
+    # Read-only string attribute resolved with a primary key lookup, so reads still see plain strings
+    return column_property(
+        select(string_table.value).where(string_table.id == id_column).correlate_except(string_table).scalar_subquery()
+    )
+
+class ActivityLog(Base):
+    __tablename__ = "activity_logs"
+    id = Column(Integer, primary_key=True, index=True)
+    timestamp = Column(DateTime, default=func.now(), index=True)
+    app_name_id = Column(Integer, ForeignKey("app_names.id"))
+    window_title_id = Column(Integer, ForeignKey("window_titles.id"))
+    detailed_context_id = Column(Integer, ForeignKey("detailed_contexts.id"), nullable=True) # URL/doc path
+    application_name = _interned_value(AppName, app_name_id)
+    window_title = _interned_value(WindowTitle, window_title_id)
+    detailed_context = _interned_value(DetailedContext, detailed_context_id)
+    goal_id = Column(Integer, ForeignKey("goals.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False) # Denormalized for easier queries
+    goal = relationship("Goal", back_populates="activity_logs")
+    project = relationship("Project", back_populates="activity_logs")
+    # Composite indexes for the project/goal + time range queries (see migrations/add_activity_indexes.py)
+    __table_args__ = (
+        Index("ix_activity_logs_project_timestamp", "project_id", "timestamp"),
+        Index("ix_activity_logs_goal_timestamp", "goal_id", "timestamp"),
+        Index("ix_activity_logs_window_title_timestamp", "window_title_id", "timestamp"),
+        Index("ix_activity_logs_context_timestamp", "detailed_context_id", "timestamp"),
+    )
+
+class ActivitySpan(Base):
+    # Explicit [start_time, end_time) interval of each activity log: it lasts until the next
+    # log of the same project. end_time is NULL for the newest (still open) span of a project.
+    # Maintained in the transaction that writes the logs; see src/database/spans.py.
+    __tablename__ = "activity_spans"
+    log_id = Column(Integer, ForeignKey("activity_logs.id"), primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    goal_id = Column(Integer, ForeignKey("goals.id"), nullable=False)
+    app_name_id = Column(Integer, ForeignKey("app_names.id"))
+    window_title_id = Column(Integer, ForeignKey("window_titles.id"))
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=True)
+    application_name = _interned_value(AppName, app_name_id)
+    window_title = _interned_value(WindowTitle, window_title_id)
+    # Range queries look for spans ending after the range start (recent ranges touch few rows)
+    __table_args__ = (
+        Index("ix_activity_spans_project_end", "project_id", "end_time"),
+        Index("ix_activity_spans_end", "end_time"),
+    )
+
+class DailyAppUsage(Base):
+    # Rollup of closed activity spans: seconds per (day, project, goal, app).
+    # Maintained incrementally as logs are written; see src/database/rollup.py.
+    __tablename__ = "daily_app_usage"
+    day = Column(Date, primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    goal_id = Column(Integer, ForeignKey("goals.id"), primary_key=True)
+    application_name = Column(String, primary_key=True)
+    total_seconds = Column(Float, nullable=False, default=0)
+
+class ArchivePartition(Base):
+    # A month of raw activity (activity_logs and activity_spans rows) moved out of the hot
+    # database into its own file under .data/archive/; see src/database/archive.py.
+    __tablename__ = "archive_partitions"
+    month = Column(String, primary_key=True) # "YYYY-MM"
+    file_name = Column(String, nullable=False) # Relative to the archive directory
+    first_timestamp = Column(DateTime, nullable=True) # Earliest span start in the file
+    last_end = Column(DateTime, nullable=True) # Latest span end; NULL when a span in it is still open
+    log_count = Column(Integer, nullable=False, default=0)
+    archived_at = Column(DateTime, nullable=False)
+    compacted = Column(Boolean, default=False) # Vacuumed and made read-only
+    partial = Column(Boolean, default=False) # Logs of the month are still hot (their span was open); archived on a later run
+
+class DatabaseSetting(Base):
+    # Values recorded by migrations for the code reading the data, e.g. rollup.SPAN_CAP_SETTING
+    __tablename__ = "database_settings"
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
@@ -0,0 +1,193 @@
+import collections
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+# Per-statement timing collected from engine events. Statements are grouped by their SQL
+# text (with IN (?, ?, ...) lists collapsed), and each group keeps a latency histogram,
+# row counts and the database functions that issued it. Statements slower than the
+# threshold also go to the slow-query log together with their EXPLAIN QUERY PLAN.
+
+SLOW_QUERY_ENV_VAR = "TRACKER_SLOW_QUERY_MS"
+DEFAULT_SLOW_QUERY_MS = 100.0
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000) # Upper bounds; one more bucket above
+SLOW_LOG_SIZE = 200 # Slow statements kept in memory
+
+_IN_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+_THIS_MODULE = __name__
+_HANDLER_MODULE = "src.database.database_handler"
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+
+def normalize(statement: str) -> str:
+    return _IN_LIST.sub("?, ...", _WHITESPACE.sub(" ", statement).strip())
+
+
+def _caller():
+    # Outermost public database_handler function that led to the statement, e.g.
+    # "database_handler.get_active_goal"; else the innermost function of this package
+    caller = innermost = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        name = frame.f_code.co_name
+        if module == _HANDLER_MODULE and not name.startswith("_"):
+            caller = name
+        elif innermost is None and module.startswith("src.") and module != _THIS_MODULE:
+            innermost = f"{module.rsplit('.', 1)[-1]}.{name}"
+        frame = frame.f_back
+    if caller is not None:
+        return f"database_handler.{caller}"
+    return innermost or "unknown"
+
+
+class _StatementStats:
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "histogram", "callers", "engines")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.callers = collections.Counter()
+        self.engines = set()
+
+
+class QueryStats:
+    """
+    Collects statement statistics for any number of engines. SQLite only reports row
+    counts for writes, so rows counts affected rows; reads are counted as statements.
+    """
+
+    def __init__(self, slow_query_ms: float = None, slow_log_path: str = None):
+        if slow_query_ms is None:
+            slow_query_ms = float(os.environ.get(SLOW_QUERY_ENV_VAR, DEFAULT_SLOW_QUERY_MS))
+        self.slow_query_ms = slow_query_ms # None or <= 0 disables the slow-query log
+        self.slow_log_path = slow_log_path # Slow statements are also appended here as JSON lines
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = collections.deque(maxlen=SLOW_LOG_SIZE)
+        self.started_at = datetime.datetime.now()
+
+    def attach(self, engine, name: str):
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed_ms = (time.perf_counter() - conn.info["query_stats_started"].pop()) * 1000
+            self._record(name, cursor, statement, parameters, executemany, elapsed_ms)
+
+        @event.listens_for(engine, "handle_error")
+        def _error(exception_context):
+            started = exception_context.connection.info.get("query_stats_started") if exception_context.connection else None
+            if started:
+                started.pop() # The statement failed; keep the start times paired
+
+    def _record(self, engine_name, cursor, statement, parameters, executemany, elapsed_ms):
+        key = normalize(statement)
+        caller = _caller()
+        rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        bucket = len(HISTOGRAM_BOUNDS_MS)
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                bucket = index
+                break
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = _StatementStats()
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += rows
+            stats.histogram[bucket] += 1
+            stats.callers[caller] += 1
+            stats.engines.add(engine_name)
+        if self.slow_query_ms and self.slow_query_ms > 0 and elapsed_ms >= self.slow_query_ms:
+            self._log_slow(engine_name, cursor, statement, parameters, executemany, elapsed_ms, caller)
+
+    def _log_slow(self, engine_name, cursor, statement, parameters, executemany, elapsed_ms, caller):
+        plan = None
+        if not executemany and statement.lstrip().upper().startswith(_EXPLAINABLE):
+            explain = cursor.connection.cursor()
+            try:
+                explain.execute("EXPLAIN QUERY PLAN " + statement, parameters or ())
+                plan = [row[-1] for row in explain.fetchall()]
+            except Exception as e: # The plan is best effort; never fail the query being measured
+                plan = [f"EXPLAIN QUERY PLAN failed: {e}"]
+            finally:
+                explain.close()
+        entry = {
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "engine": engine_name,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "caller": caller,
+            "statement": normalize(statement),
+            "parameters": repr(parameters)[:200],
+            "plan": plan,
+            "full_scans": [line for line in plan or () if line.startswith("SCAN") and "USING" not in line],
+        }
+        with self._lock:
+            self._slow.append(entry)
+            if self.slow_log_path:
+                try:
+                    with open(self.slow_log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    print(f"Could not write the slow-query log: {e}")
+        print(f"Slow query ({elapsed_ms:.1f} ms) from {caller}: {entry['statement'][:120]}")
+        if entry["full_scans"]:
+            print(f"  Full table scan: {'; '.join(entry['full_scans'])}")
+
+    def summary(self, top: int = 20, order_by: str = "total_ms"):
+        """Statement groups sorted by total_ms, count, max_ms or mean_ms, largest first."""
+        report = []
+        with self._lock:
+            for key, stats in self._statements.items():
+                report.append({
+                    "statement": key,
+                    "count": stats.count,
+                    "total_ms": round(stats.total_ms, 3),
+                    "mean_ms": round(stats.total_ms / stats.count, 3),
+                    "max_ms": round(stats.max_ms, 3),
+                    "rows": stats.rows,
+                    "histogram": dict(zip([f"<={b}ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"],
+                                          stats.histogram)),
+                    "callers": dict(stats.callers.most_common()),
+                    "engines": sorted(stats.engines),
+                })
+        report.sort(key=lambda entry: entry[order_by], reverse=True)
+        return report[:top] if top else report
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self.started_at = datetime.datetime.now()
+
+    def dump(self, path: str):
+        """Writes the full summary and the in-memory slow log to path as JSON."""
+        data = {
+            "since": self.started_at.isoformat(timespec="seconds"),
+            "dumped_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "slow_query_ms": self.slow_query_ms,
+            "statements": self.summary(top=None),
+            "slow_queries": self.slow_queries(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        return path
@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+import urllib.parse
+
+_MISSING = object()
+
+
+class ReadCache:
+    """
+    In-process cache for small, hot lookups (active goal, projects, goals by id).
+
+    Write functions in this process call invalidate() after they commit. Commits from
+    anywhere else (the background activity writer, migrations, another copy of the app)
+    are noticed through PRAGMA data_version, which SQLite bumps on a connection whenever
+    another connection has committed to the file. A dedicated connection that never
+    writes is kept open just to poll it, which costs no more than reading a header.
+    """
+
+    def __init__(self, database_path: str):
+        self._watch = sqlite3.connect(f"file:{urllib.parse.quote(database_path)}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0 # Bumped on every invalidation so in-flight loads are not cached
+        self._data_version = self._read_data_version()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _read_data_version(self):
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def get(self, key, loader):
+        """
+        Returns the cached value for key, calling loader() to fill it on a miss. Cached
+        values are shared; don't mutate them. Exceptions from loader() propagate and
+        nothing is cached, so loaders raise on failure instead of returning a fallback.
+        """
+        with self._lock:
+            data_version = self._read_data_version()
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._clear()
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "entries": len(self._entries)}
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            self._watch.close()
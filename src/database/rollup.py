@@ -0,0 +1,247 @@
+import datetime
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.database.models import ActivityLog, DailyAppUsage, Project, DatabaseSetting
+from src.database.sqlite_profile import begin_immediate
+
+# A log lasts from its timestamp until the next log of the same project (ordered by
+# timestamp, then id), but for at most MAX_SPAN_SECONDS. The daily_app_usage rollup holds
+# those closed spans split at midnight; the newest log of each project is still open and
+# is added at query time.
+#
+# The cap is what keeps gaps out of the totals: while the app runs the tracker re-logs
+# an unchanged window every heartbeat (see src/tracker/coalescer.py), so a longer span
+# means nothing was tracked for part of it (the app was closed or crashed, the machine
+# slept). At shutdown and when the user goes idle the tracker logs IDLE_APP_NAME, which
+# closes the span before it; idle spans are kept for reports but never credited to goals.
+#
+# Logs written before heartbeats existed were only logged when the window changed, so the
+# cap only applies to spans starting at or after span_cap_since (recorded by the
+# cap_activity_spans migration when the database is upgraded). Older spans count in full,
+# up to span_cap_since at most: the tracker that wrote them was not running after it.
+
+REBUILD_BATCH_SIZE = 5000 # Rows streamed per fetch and rollup keys buffered per upsert
+MAX_SPAN_SECONDS = 15 * 60 # Longest stretch a single log is counted for
+IDLE_APP_NAME = "Idle" # Logged by the tracker when tracking stops or the user is away
+SPAN_CAP_SETTING = "span_cap_since" # database_settings key holding the cutover (naive UTC)
+SPAN_CAP_FORMAT = "%Y-%m-%d %H:%M:%S.%f" # As SQLAlchemy stores DateTime in SQLite, so SQL can compare it
+
+span_cap_since = None # Loaded by load_span_cap(); None caps nothing
+
+_LOG_COLUMNS = (ActivityLog.timestamp, ActivityLog.id, ActivityLog.goal_id, ActivityLog.application_name.label("application_name"))
+
+
+def split_by_day(start: datetime.datetime, end: datetime.datetime):
+    """Yields (day, seconds) for the part of [start, end) that falls on each calendar day."""
+    while start < end:
+        next_midnight = datetime.datetime.combine(start.date() + datetime.timedelta(days=1), datetime.time.min)
+        piece_end = min(end, next_midnight)
+        yield start.date(), (piece_end - start).total_seconds()
+        start = piece_end
+
+
+def load_span_cap(connection):
+    """Reads span_cap_since from the database. Returns it."""
+    global span_cap_since
+    value = connection.execute(select(DatabaseSetting.value).where(DatabaseSetting.key == SPAN_CAP_SETTING)).scalar()
+    span_cap_since = datetime.datetime.fromisoformat(value) if value else None
+    return span_cap_since
+
+
+def capped_end(start: datetime.datetime, end: datetime.datetime):
+    """
+    Where a span from start counts until: end (the next log, or where an open span is
+    counted until) capped at MAX_SPAN_SECONDS, or at span_cap_since for older spans.
+    """
+    if span_cap_since is None:
+        return end
+    if start < span_cap_since:
+        return min(end, span_cap_since)
+    return min(end, start + datetime.timedelta(seconds=MAX_SPAN_SECONDS))
+
+
+def _add_span(deltas, project_id, point, end_timestamp, sign=1, first_day=None, last_day=None):
+    # point is (timestamp, order, tiebreak, goal_id, application_name)
+    timestamp, _, _, goal_id, app_name = point
+    for day, seconds in split_by_day(timestamp, capped_end(timestamp, end_timestamp)):
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+        key = (day, project_id, goal_id, app_name)
+        deltas[key] = deltas.get(key, 0) + sign * seconds
+
+
+def _upsert(connection, deltas):
+    rows = [
+        {"day": day, "project_id": project_id, "goal_id": goal_id, "application_name": app_name, "total_seconds": seconds}
+        for (day, project_id, goal_id, app_name), seconds in deltas.items() if seconds
+    ]
+    if not rows:
+        return
+    stmt = sqlite_insert(DailyAppUsage.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "project_id", "goal_id", "application_name"],
+        set_={"total_seconds": DailyAppUsage.__table__.c.total_seconds + stmt.excluded.total_seconds}
+    )
+    connection.execute(stmt, rows)
+
+
+def _existing_point(row):
+    # Existing rows sort before new rows with the same timestamp, since new rows get larger ids
+    return (row.timestamp, 0, row.id, row.goal_id, row.application_name)
+
+
+def apply_new_activity(connection, records):
+    """
+    Updates the rollup for activity records that are about to be inserted. Must run
+    before the insert, on the same connection/transaction. Records are dicts with
+    timestamp, project_id, goal_id and application_name keys, in any order. Returns
+    the applied deltas as {(day, project_id, goal_id, application_name): seconds}.
+    """
+    # The deltas come from the neighbouring logs read below; a log committed by another
+    # writer (an import, archive) between these reads and the upsert would corrupt the rollup
+    begin_immediate(connection)
+    by_project = {}
+    for record in records:
+        by_project.setdefault(record["project_id"], []).append(record)
+
+    deltas = {}
+    for project_id, project_records in by_project.items():
+        new_points = sorted(
+            (r["timestamp"], 1, seq, r["goal_id"], r["application_name"]) for seq, r in enumerate(project_records)
+        )
+        first_ts, last_ts = new_points[0][0], new_points[-1][0]
+        base = select(*_LOG_COLUMNS).where(ActivityLog.project_id == project_id)
+
+        previous = connection.execute(
+            base.where(ActivityLog.timestamp < first_ts)
+            .order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(1)
+        ).first()
+        # Rows interleaved with the new ones only exist for out-of-order inserts (imports, replays)
+        between = connection.execute(
+            base.where(ActivityLog.timestamp >= first_ts, ActivityLog.timestamp <= last_ts)
+            .order_by(ActivityLog.timestamp, ActivityLog.id)
+        ).all()
+        following = connection.execute(
+            base.where(ActivityLog.timestamp > last_ts)
+            .order_by(ActivityLog.timestamp, ActivityLog.id).limit(1)
+        ).first()
+
+        old_chain = [_existing_point(r) for r in ([previous] if previous else []) + between + ([following] if following else [])]
+        new_chain = sorted(old_chain + new_points)
+        for start, end in zip(old_chain, old_chain[1:]):
+            _add_span(deltas, project_id, start, end[0], sign=-1)
+        for start, end in zip(new_chain, new_chain[1:]):
+            _add_span(deltas, project_id, start, end[0])
+
+    _upsert(connection, deltas)
+    return deltas
+
+
+def _boundary_timestamp(connection, project_id, condition, per_project, across_projects):
+    # e.g. per_project=max, across_projects=min: the earliest of each project's latest log matching
+    # condition. Correlated per project so it is an index seek on (project_id, timestamp) each.
+    per_project_ts = select(per_project(ActivityLog.timestamp)).where(
+        ActivityLog.project_id == Project.id, condition
+    ).correlate(Project).scalar_subquery()
+    query = select(across_projects(per_project_ts)).select_from(Project)
+    if project_id is not None:
+        query = query.where(Project.id == project_id)
+    return connection.execute(query).scalar()
+
+
+def rebuild_daily_usage(connection, project_id: int = None, first_day: datetime.date = None,
+                        last_day: datetime.date = None, batch_size: int = REBUILD_BATCH_SIZE):
+    """
+    Recomputes the rollup from activity_logs, for one project or all of them and for
+    the inclusive day range [first_day, last_day] (open-ended when None). Rows are
+    streamed, so memory stays bounded regardless of history size. Returns the number
+    of log rows read.
+    """
+    delete = DailyAppUsage.__table__.delete()
+    logs = select(ActivityLog.project_id, *_LOG_COLUMNS)
+    if project_id is not None:
+        delete = delete.where(DailyAppUsage.project_id == project_id)
+        logs = logs.where(ActivityLog.project_id == project_id)
+    if first_day is not None:
+        delete = delete.where(DailyAppUsage.day >= first_day)
+        # Start from each project's last log before the range; its span may reach into first_day
+        range_start = datetime.datetime.combine(first_day, datetime.time.min)
+        earliest_needed = _boundary_timestamp(connection, project_id, ActivityLog.timestamp < range_start, func.max, func.min)
+        logs = logs.where(ActivityLog.timestamp >= (earliest_needed or range_start))
+    if last_day is not None:
+        delete = delete.where(DailyAppUsage.day <= last_day)
+        # ...and stop after each project's first log past the range, which closes its last span
+        range_end = datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min)
+        latest_needed = _boundary_timestamp(connection, project_id, ActivityLog.timestamp >= range_end, func.min, func.max)
+        logs = logs.where(ActivityLog.timestamp <= latest_needed) if latest_needed else logs.where(ActivityLog.timestamp < range_end)
+    else:
+        range_end = None
+    connection.execute(delete)
+
+    logs = logs.order_by(ActivityLog.project_id, ActivityLog.timestamp, ActivityLog.id)
+    result = connection.execution_options(stream_results=True).execute(logs)
+
+    deltas = {}
+    previous_by_project = {}
+    rows_read = 0
+    for rows in result.partitions(batch_size):
+        for row in rows:
+            rows_read += 1
+            project = row.project_id
+            point = _existing_point(row)
+            previous = previous_by_project.get(project)
+            if previous is not None and (range_end is None or previous[0] < range_end):
+                _add_span(deltas, project, previous, point[0], first_day=first_day, last_day=last_day)
+            previous_by_project[project] = point
+        if len(deltas) >= batch_size:
+            _upsert(connection, deltas)
+            deltas = {}
+    _upsert(connection, deltas)
+    return rows_read
+
+
+def _project_filters(column, project_ids, include_archived: bool):
+    filters = []
+    if project_ids is not None:
+        filters.append(column.in_(list(project_ids)))
+    if not include_archived:
+        filters.append(column.in_(select(Project.id).where(Project.is_archived == False)))
+    return filters
+
+
+def query_app_usage(connection, first_day: datetime.date, end_day: datetime.date, project_ids=None,
+                    include_archived: bool = True):
+    """
+    Returns [(project_id, application_name, seconds)] for the days in [first_day, end_day):
+    closed spans from the rollup plus each project's still-open newest log, which is
+    counted up to the end of the range (and at most MAX_SPAN_SECONDS, see capped_end()).
+    """
+    range_start = datetime.datetime.combine(first_day, datetime.time.min)
+    range_end = datetime.datetime.combine(end_day, datetime.time.min)
+
+    totals = {}
+    closed = select(
+        DailyAppUsage.project_id, DailyAppUsage.application_name, func.sum(DailyAppUsage.total_seconds)
+    ).where(
+        DailyAppUsage.day >= first_day,
+        DailyAppUsage.day < end_day,
+        *_project_filters(DailyAppUsage.project_id, project_ids, include_archived)
+    ).group_by(DailyAppUsage.project_id, DailyAppUsage.application_name)
+    for project_id, app_name, seconds in connection.execute(closed):
+        totals[(project_id, app_name)] = seconds
+
+    newest_log_id = select(ActivityLog.id).where(
+        ActivityLog.project_id == Project.id
+    ).order_by(ActivityLog.timestamp.desc(), ActivityLog.id.desc()).limit(1).correlate(Project).scalar_subquery()
+    open_logs = select(ActivityLog.project_id, ActivityLog.application_name, ActivityLog.timestamp).where(
+        ActivityLog.id.in_(select(newest_log_id).where(*_project_filters(Project.id, project_ids, include_archived))),
+        ActivityLog.timestamp < range_end
+    )
+    for project_id, app_name, timestamp in connection.execute(open_logs):
+        seconds = (capped_end(timestamp, range_end) - max(timestamp, range_start)).total_seconds()
+        if seconds > 0:
+            totals[(project_id, app_name)] = totals.get((project_id, app_name), 0) + seconds
+
+    return [(project_id, app_name, seconds) for (project_id, app_name), seconds in totals.items() if seconds > 0]
@@ -0,0 +1,109 @@
+import datetime
+
+from sqlalchemy import Table, Column, Integer, Float, MetaData, select
+from sqlalchemy.sql import text
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import ActivitySpan
+
+# R*Tree over activity span intervals, kept in step with activity_spans by triggers. A
+# B-tree on start or end time can only bound one side of an overlap test, so old ranges
+# walk every later span; the R*Tree bounds both sides (and the project) at once. R*Tree
+# coordinates are 32-bit floats rounded outwards, so the index is a superset filter and
+# the exact comparison on activity_spans still decides.
+
+INTERVAL_TABLE = "activity_span_intervals"
+INTERVAL_BATCH_SIZE = 5000 # Spans copied into the index per backfill batch
+OPEN_END = 1e11 # Epoch seconds standing in for the end of a still-open span
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# Not part of Base.metadata: create_all() must not create it as an ordinary table
+span_intervals = Table(
+    INTERVAL_TABLE, MetaData(),
+    Column("id", Integer, primary_key=True), # activity_spans.log_id
+    Column("start_at", Float),
+    Column("end_at", Float),
+    Column("project_lo", Float), # The project as a degenerate [project_id, project_id] dimension
+    Column("project_hi", Float),
+)
+
+
+def _seconds_sql(column: str) -> str:
+    return f"(julianday({column}) - 2440587.5) * 86400.0"
+
+
+def _row_sql(prefix: str) -> str:
+    return (f"{prefix}log_id, {_seconds_sql(prefix + 'start_time')}, "
+            f"coalesce({_seconds_sql(prefix + 'end_time')}, {OPEN_END}), {prefix}project_id, {prefix}project_id")
+
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {INTERVAL_TABLE} USING rtree(id, start_at, end_at, project_lo, project_hi)",
+    f"""CREATE TRIGGER IF NOT EXISTS activity_spans_interval_insert AFTER INSERT ON activity_spans BEGIN
+        INSERT OR REPLACE INTO {INTERVAL_TABLE} VALUES ({_row_sql('NEW.')});
+    END""",
+    # Upserts that leave a span as it was (most of a rebuilt chain) skip the index
+    f"""CREATE TRIGGER IF NOT EXISTS activity_spans_interval_update AFTER UPDATE OF start_time, end_time, project_id
+        ON activity_spans WHEN NEW.start_time IS NOT OLD.start_time OR NEW.end_time IS NOT OLD.end_time
+            OR NEW.project_id IS NOT OLD.project_id BEGIN
+        DELETE FROM {INTERVAL_TABLE} WHERE id = OLD.log_id;
+        INSERT OR REPLACE INTO {INTERVAL_TABLE} VALUES ({_row_sql('NEW.')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS activity_spans_interval_delete AFTER DELETE ON activity_spans BEGIN
+        DELETE FROM {INTERVAL_TABLE} WHERE id = OLD.log_id;
+    END""",
+]
+
+
+def epoch_seconds(value: datetime.datetime) -> float:
+    return (value - _EPOCH).total_seconds()
+
+
+def create(connection) -> bool:
+    """Creates the index and its triggers if missing. False when SQLite was built without R*Tree."""
+    try:
+        connection.execute(text(_DDL[0]))
+    except OperationalError as e:
+        print(f"R*Tree is not available in this SQLite build ({e}); span range queries use the B-tree indexes.")
+        return False
+    for statement in _DDL[1:]:
+        connection.execute(text(statement))
+    return True
+
+
+def exists(connection) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": INTERVAL_TABLE}
+    ).first() is not None
+
+
+def rebuild(connection, batch_size: int = INTERVAL_BATCH_SIZE):
+    """Copies every span into the index in log_id batches, yielding after each one."""
+    after = 0
+    while True:
+        last = connection.execute(text(
+            "SELECT max(log_id) FROM (SELECT log_id FROM activity_spans WHERE log_id > :after ORDER BY log_id LIMIT :limit)"
+        ), {"after": after, "limit": batch_size}).scalar()
+        if last is None:
+            break
+        connection.execute(text(
+            f"INSERT OR REPLACE INTO {INTERVAL_TABLE} SELECT {_row_sql('')} FROM activity_spans "
+            "WHERE log_id > :after AND log_id <= :last"
+        ), {"after": after, "last": last})
+        after = last
+        yield
+
+
+def candidates(start_seconds, end_seconds, project_id=None):
+    """log_ids whose index box touches [start_seconds, end_seconds] (and the project)."""
+    query = select(span_intervals.c.id).where(span_intervals.c.start_at <= end_seconds,
+                                              span_intervals.c.end_at >= start_seconds)
+    if project_id is not None:
+        query = query.where(span_intervals.c.project_lo <= project_id, span_intervals.c.project_hi >= project_id)
+    return query
+
+
+def overlap_filter(start: datetime.datetime, end: datetime.datetime, project_id: int = None):
+    """Filters narrowing an activity_spans query to index candidates for [start, end)."""
+    return (ActivitySpan.log_id.in_(candidates(epoch_seconds(start), epoch_seconds(end), project_id)),)
@@ -0,0 +1,148 @@
+import datetime
+
+from sqlalchemy import select, func, tuple_, literal, or_, case, type_coerce, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.database.models import ActivityLog, ActivitySpan, AppName, Project, DatabaseSetting
+from src.database.rollup import capped_end, MAX_SPAN_SECONDS, SPAN_CAP_SETTING
+
+# activity_spans holds the interval implied by each activity log: from its timestamp to the
+# next log of the same project (ordered by timestamp, then id) or MAX_SPAN_SECONDS later,
+# whichever comes first (rollup.capped_end(), which also covers spans older than the
+# cap); the same spans the daily rollup sums. Spans are rewritten for the stretch of a
+# project's chain that new logs touch, in the transaction that inserts them, so range
+# queries are a plain indexed SUM.
+
+SPAN_BATCH_SIZE = 5000 # Logs read and spans upserted per batch
+
+_LOG_COLUMNS = (ActivityLog.id, ActivityLog.project_id, ActivityLog.goal_id, ActivityLog.app_name_id,
+                ActivityLog.window_title_id, ActivityLog.timestamp)
+_UPDATED_COLUMNS = ("goal_id", "app_name_id", "window_title_id", "start_time", "end_time")
+
+
+def _span(row, end_time):
+    # end_time is the next log; None leaves the span open
+    return {"log_id": row.id, "project_id": row.project_id, "goal_id": row.goal_id, "app_name_id": row.app_name_id,
+            "window_title_id": row.window_title_id, "start_time": row.timestamp,
+            "end_time": capped_end(row.timestamp, end_time) if end_time is not None else None}
+
+
+def open_span_end(default):
+    """
+    SQL end of a span: its end_time, or for an open span default capped like
+    rollup.capped_end() does, with the cutover read from database_settings.
+    """
+    cap_since = select(DatabaseSetting.value).where(DatabaseSetting.key == SPAN_CAP_SETTING).scalar_subquery()
+    cap = func.strftime("%Y-%m-%d %H:%M:%f000", ActivitySpan.start_time, f"+{MAX_SPAN_SECONDS} seconds")
+    capped = case(
+        (cap_since.is_(None), default),
+        (ActivitySpan.start_time < cap_since, func.min(default, cap_since)),
+        else_=func.min(default, cap))
+    return func.coalesce(ActivitySpan.end_time, type_coerce(capped, DateTime))
+
+
+def _upsert(connection, rows):
+    if not rows:
+        return
+    stmt = sqlite_insert(ActivitySpan.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=["log_id"], set_={c: stmt.excluded[c] for c in _UPDATED_COLUMNS})
+    connection.execute(stmt, rows)
+
+
+def _after(row):
+    return tuple_(ActivityLog.timestamp, ActivityLog.id) > tuple_(literal(row.timestamp, DateTime), literal(row.id))
+
+
+def rebuild_chain(connection, project_id: int, start: datetime.datetime = None, stop: datetime.datetime = None,
+                  batch_size: int = SPAN_BATCH_SIZE):
+    """
+    Rewrites the spans of one project's logs with timestamps in [start, stop] (open-ended
+    when None), yielding the number of spans written after each batch. Logs at stop keep
+    their stored span, since the log that ends it lies past the range.
+    """
+    base = select(*_LOG_COLUMNS).where(ActivityLog.project_id == project_id)
+    if start is not None:
+        base = base.where(ActivityLog.timestamp >= start)
+    if stop is not None:
+        base = base.where(ActivityLog.timestamp <= stop)
+    base = base.order_by(ActivityLog.timestamp, ActivityLog.id).limit(batch_size)
+
+    carry = None # Last log read; its span ends at the next log, which the next batch supplies
+    while True:
+        rows = connection.execute(base.where(_after(carry)) if carry is not None else base).all()
+        if not rows:
+            break
+        chain = ([carry] if carry is not None else []) + rows
+        spans = [_span(current, following.timestamp) for current, following in zip(chain, chain[1:])]
+        _upsert(connection, spans)
+        carry = rows[-1]
+        yield len(spans)
+        if len(rows) < batch_size:
+            break
+
+    if carry is not None and stop is None:
+        # Normally the project's newest log, left open; re-checked in case a log was added meanwhile
+        following = connection.execute(
+            select(ActivityLog.timestamp).where(ActivityLog.project_id == project_id, _after(carry))
+            .order_by(ActivityLog.timestamp, ActivityLog.id).limit(1)
+        ).scalar()
+        _upsert(connection, [_span(carry, following)])
+        yield 1
+
+
+def affected_range(connection, project_id: int, first_ts: datetime.datetime, last_ts: datetime.datetime):
+    """(start, stop) for rebuild_chain after logs in [first_ts, last_ts] were added to a project."""
+    previous = connection.execute(select(func.max(ActivityLog.timestamp)).where(
+        ActivityLog.project_id == project_id, ActivityLog.timestamp < first_ts)).scalar()
+    following = connection.execute(select(func.min(ActivityLog.timestamp)).where(
+        ActivityLog.project_id == project_id, ActivityLog.timestamp > last_ts)).scalar()
+    return previous or first_ts, following
+
+
+def apply_new_logs(connection, records):
+    """Updates spans after records (dicts with project_id and timestamp) were inserted, on the same transaction."""
+    bounds = {}
+    for record in records:
+        first, last = bounds.get(record["project_id"], (record["timestamp"], record["timestamp"]))
+        bounds[record["project_id"]] = (min(first, record["timestamp"]), max(last, record["timestamp"]))
+    for project_id, (first_ts, last_ts) in bounds.items():
+        start, stop = affected_range(connection, project_id, first_ts, last_ts)
+        for _ in rebuild_chain(connection, project_id, start, stop):
+            pass
+
+
+def rebuild_all(connection, project_id: int = None, batch_size: int = SPAN_BATCH_SIZE):
+    """Rewrites every span (of one project, or all), yielding after each batch."""
+    if project_id is not None:
+        project_ids = [project_id]
+    else:
+        project_ids = connection.execute(select(Project.id).order_by(Project.id)).scalars().all()
+    for pid in project_ids:
+        yield from rebuild_chain(connection, pid, batch_size=batch_size)
+
+
+def overlapping(start: datetime.datetime, end: datetime.datetime):
+    """Filters for spans that overlap [start, end); open spans count as lasting until end."""
+    return (
+        ActivitySpan.start_time < end,
+        or_(ActivitySpan.end_time > start, ActivitySpan.end_time == None),
+    )
+
+
+def app_seconds_query(start: datetime.datetime, end: datetime.datetime, filters=(), by_project: bool = False):
+    """
+    Seconds per app (and per project with by_project) within [start, end): each
+    overlapping span clipped to the range, with open spans lasting until end (at most
+    MAX_SPAN_SECONDS).
+    """
+    start_value, end_value = literal(start, DateTime), literal(end, DateTime)
+    span_end = func.min(open_span_end(end_value), end_value)
+    span_start = func.max(ActivitySpan.start_time, start_value)
+    # julianday() arithmetic carries sub-millisecond float noise, so round each span to ms
+    seconds = func.round((func.julianday(span_end) - func.julianday(span_start)) * 86400.0, 3)
+    # Group on the interned id and resolve each app name once
+    group_columns = (ActivitySpan.project_id, ActivitySpan.app_name_id) if by_project else (ActivitySpan.app_name_id,)
+    output_columns = (ActivitySpan.project_id, AppName.value) if by_project else (AppName.value,)
+    return select(*output_columns, func.sum(seconds)).select_from(ActivitySpan).outerjoin(
+        AppName, AppName.id == ActivitySpan.app_name_id
+    ).where(*overlapping(start, end), *filters, seconds > 0).group_by(*group_columns)
@@ -0,0 +1,81 @@
+import os
+
+from sqlalchemy import event
+
+# Production defaults applied to every SQLite connection the app opens. WAL lets the UI
+# read while the tracker writes; synchronous=NORMAL only fsyncs at WAL checkpoints, which
+# is still crash-safe for the application (a power loss can drop the last commits).
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000, # ms to wait for a lock before raising "database is locked"
+    "cache_size": -32000, # Negative means KiB, so ~32 MB of page cache per connection
+    "mmap_size": 268435456, # 256 MB of the file memory-mapped for reads
+    "temp_store": "MEMORY",
+}
+
+# Overrides as "name=value" pairs, e.g. TRACKER_SQLITE_PRAGMAS="synchronous=FULL,mmap_size=0"
+PRAGMAS_ENV_VAR = "TRACKER_SQLITE_PRAGMAS"
+
+# PRAGMAs that only report numbers; mapped back to names when printing the profile
+_ENUM_NAMES = {
+    "synchronous": {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"},
+    "temp_store": {0: "DEFAULT", 1: "FILE", 2: "MEMORY"},
+}
+
+
+def _parse_env_overrides(value: str):
+    overrides = {}
+    for pair in filter(None, (p.strip() for p in value.split(","))):
+        name, sep, setting = pair.partition("=")
+        if not sep:
+            print(f"Ignoring malformed SQLite PRAGMA override '{pair}' (expected name=value).")
+            continue
+        overrides[name.strip().lower()] = setting.strip()
+    return overrides
+
+
+def resolve_pragmas(overrides: dict = None):
+    """Defaults, then the environment variable, then explicit overrides. A value of None removes a PRAGMA."""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    pragmas.update(_parse_env_overrides(os.environ.get(PRAGMAS_ENV_VAR, "")))
+    pragmas.update(overrides or {})
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def apply_profile(engine, pragmas: dict, skip=()):
+    """Runs the PRAGMAs on every new DBAPI connection of the engine. Names in skip are left alone."""
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items() if name not in skip]
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def begin_immediate(connection):
+    """
+    Opens the write transaction on connection now, taking SQLite's write lock, so reads
+    that decide what to write see the table as it is when the write commits. pysqlite
+    defers BEGIN to the first INSERT/UPDATE and runs reads before it outside any
+    transaction. If it already began one, a write has run and the lock is held.
+    """
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def effective_pragmas(connection, names):
+    """Reads back the values SQLite actually uses, e.g. journal_mode can silently stay 'delete'."""
+    values = {}
+    for name in names:
+        value = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        values[name] = _ENUM_NAMES.get(name, {}).get(value, value)
+    return values
+
+
+def describe(values: dict) -> str:
+    return ", ".join(f"{name}={value}" for name, value in values.items())
@@ -0,0 +1,169 @@
+"""
+Synthetic activity histories for benchmarking and load testing.
+
+    python -m src.database.synthetic --rows 1000000 --db /tmp/tracker_1m.db
+
+Histories look like real tracking: work happens within working hours on weekdays,
+app and window title popularity follow a Zipf distribution (a few apps dominate),
+the time between logged switches is exponentially distributed, and the active goal
+only changes now and then.
+"""
+import argparse
+import datetime
+import itertools
+import os
+import random
+import sys
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.database import database_handler
+
+DATASET_SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+DEFAULT_PROFILE = {
+    "projects": 6,
+    "goals_per_project": 8,
+    "apps": 40, # Distinct application names
+    "titles_per_app": 300, # Distinct window titles per application
+    "zipf_exponent": 1.1, # Skew of app/title popularity; 0 makes every app equally likely
+    "mean_switch_seconds": 45.0, # Mean time between logged app/title changes
+    "goal_switch_probability": 0.01, # Chance per log that the user moves to another goal
+    "context_probability": 0.3, # Share of logs with a URL/document context
+    "workday_hours": (9, 18),
+    "weekends": False,
+    "seed": 0,
+}
+
+_APP_WORDS = ["Code", "Chrome", "Slack", "Terminal", "Mail", "Figma", "Notion", "Zoom", "Excel", "Word",
+              "Safari", "Firefox", "Xcode", "Spotify", "Finder", "Calendar", "Preview", "Notes", "Docker", "Postman"]
+
+
+def _zipf_weights(count: int, exponent: float):
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def _app_names(count: int):
+    return [_APP_WORDS[i % len(_APP_WORDS)] + ("" if i < len(_APP_WORDS) else f" {i // len(_APP_WORDS) + 1}")
+            for i in range(count)]
+
+
+def _next_work_time(timestamp: datetime.datetime, profile):
+    """Moves timestamp forward to the next moment inside working hours."""
+    start_hour, end_hour = profile["workday_hours"]
+    while True:
+        is_workday = profile["weekends"] or timestamp.weekday() < 5
+        if is_workday and start_hour <= timestamp.hour < end_hour:
+            return timestamp
+        if is_workday and timestamp.hour < start_hour:
+            timestamp = timestamp.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+        else:
+            timestamp = (timestamp + datetime.timedelta(days=1)).replace(hour=start_hour, minute=0, second=0, microsecond=0)
+
+
+def estimate_start(rows: int, end: datetime.datetime, profile):
+    """A start time from which rows logs at the profile's pace roughly end at end."""
+    start_hour, end_hour = profile["workday_hours"]
+    workday_seconds = (end_hour - start_hour) * 3600
+    work_days = rows * profile["mean_switch_seconds"] / workday_seconds
+    calendar_days = work_days * (1 if profile["weekends"] else 7 / 5)
+    return end - datetime.timedelta(days=calendar_days + 1)
+
+
+def generate_activity(goals, rows: int, start: datetime.datetime, profile=None):
+    """
+    Yields rows activity records, oldest first, spread over the (goal_id, project_id)
+    pairs in goals. The same profile and seed always produce the same history.
+    """
+    profile = dict(DEFAULT_PROFILE, **(profile or {}))
+    rng = random.Random(profile["seed"])
+    apps = _app_names(profile["apps"])
+    app_indexes = range(len(apps))
+    title_indexes = range(profile["titles_per_app"])
+    # Cumulative weights, so each draw is a binary search rather than a pass over the weights
+    app_weights = list(itertools.accumulate(_zipf_weights(len(apps), profile["zipf_exponent"])))
+    title_weights = list(itertools.accumulate(_zipf_weights(len(title_indexes), profile["zipf_exponent"])))
+    goals = list(goals)
+
+    timestamp = _next_work_time(start, profile)
+    goal_id, project_id = rng.choice(goals)
+    for _ in range(rows):
+        if rng.random() < profile["goal_switch_probability"]:
+            goal_id, project_id = rng.choice(goals)
+        app_index = rng.choices(app_indexes, cum_weights=app_weights)[0]
+        title_index = rng.choices(title_indexes, cum_weights=title_weights)[0]
+        context = None
+        if rng.random() < profile["context_probability"]:
+            context = f"https://example.com/{apps[app_index].lower().replace(' ', '-')}/{title_index % 97}"
+        yield {
+            "timestamp": timestamp,
+            "goal_id": goal_id,
+            "project_id": project_id,
+            "application_name": apps[app_index],
+            "window_title": f"{apps[app_index]} - document {title_index}",
+            "detailed_context": context,
+        }
+        gap = max(1.0, rng.expovariate(1.0 / profile["mean_switch_seconds"]))
+        timestamp = _next_work_time(timestamp + datetime.timedelta(seconds=gap), profile)
+
+
+def populate(rows: int, profile=None, end: datetime.datetime = None):
+    """
+    Creates the profile's projects and goals in the current database (see init_db) and
+    bulk loads rows synthetic logs ending around end (default: now). Returns the bulk
+    insert summary.
+    """
+    profile = dict(DEFAULT_PROFILE, **(profile or {}))
+    goals = []
+    for p in range(profile["projects"]):
+        project = database_handler.add_project(f"Synthetic project {p + 1}")
+        if project is None:
+            return None
+        for g in range(profile["goals_per_project"]):
+            goal = database_handler.add_goal(f"Synthetic goal {p + 1}.{g + 1}", project.id)
+            if goal is not None:
+                goals.append((goal.id, project.id))
+    end = end or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    start = estimate_start(rows, end, profile)
+    return database_handler.bulk_insert_activity(generate_activity(goals, rows, start, profile))
+
+
+def _parse_rows(value: str) -> int:
+    if value.lower() in DATASET_SIZES:
+        return DATASET_SIZES[value.lower()]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid row count '{value}'. Use a number or one of {', '.join(DATASET_SIZES)}.")
+
+
+def add_profile_arguments(parser):
+    parser.add_argument("--rows", type=_parse_rows, default=DATASET_SIZES["100k"], help="Rows to generate, or 100k/1m/10m")
+    parser.add_argument("--projects", type=int, default=DEFAULT_PROFILE["projects"])
+    parser.add_argument("--goals-per-project", type=int, default=DEFAULT_PROFILE["goals_per_project"])
+    parser.add_argument("--apps", type=int, default=DEFAULT_PROFILE["apps"])
+    parser.add_argument("--titles-per-app", type=int, default=DEFAULT_PROFILE["titles_per_app"])
+    parser.add_argument("--zipf-exponent", type=float, default=DEFAULT_PROFILE["zipf_exponent"])
+    parser.add_argument("--mean-switch-seconds", type=float, default=DEFAULT_PROFILE["mean_switch_seconds"])
+    parser.add_argument("--goal-switch-probability", type=float, default=DEFAULT_PROFILE["goal_switch_probability"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_PROFILE["seed"])
+
+
+def profile_from_args(args):
+    return {name: getattr(args, name) for name in DEFAULT_PROFILE if hasattr(args, name)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Productivity Tracker activity history")
+    parser.add_argument("--db", required=True, help="Database file to create or extend")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    database_handler.init_db(database_path=args.db)
+    summary = populate(args.rows, profile_from_args(args))
+    database_handler.shutdown_activity_writer()
+    return 0 if summary and "error" not in summary else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
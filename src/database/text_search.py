@@ -0,0 +1,196 @@
+import datetime
+import re
+
+from sqlalchemy import Table, Column, Integer, Text, MetaData, select, or_, and_, literal_column
+from sqlalchemy.sql import text
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import ActivityLog, ActivitySpan, AppName, WindowTitle, DetailedContext
+from src.database import fast_reads, rollup
+
+# FTS5 indexes over the interned window titles and detailed contexts. Each distinct
+# string is indexed once however often it was logged; a search resolves the matching
+# string ids first, then finds their logs through the (string id, timestamp) indexes
+# on activity_logs. Both FTS tables are external-content tables over the string tables
+# and are filled by insert triggers (interned strings are never updated or deleted).
+
+FTS_TABLES = {
+    "window_titles_fts": "window_titles",
+    "detailed_contexts_fts": "detailed_contexts",
+}
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+# Not part of Base.metadata: create_all() must not create them as ordinary tables
+window_titles_fts = Table("window_titles_fts", MetaData(), Column("rowid", Integer), Column("value", Text))
+detailed_contexts_fts = Table("detailed_contexts_fts", MetaData(), Column("rowid", Integer), Column("value", Text))
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _ddl(fts_table: str, content_table: str):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"value, content='{content_table}', content_rowid='id', tokenize='{TOKENIZER}')",
+        f"""CREATE TRIGGER IF NOT EXISTS {content_table}_fts_insert AFTER INSERT ON {content_table} BEGIN
+            INSERT INTO {fts_table} (rowid, value) VALUES (NEW.id, NEW.value);
+        END""",
+    ]
+
+
+def create(connection) -> bool:
+    """Creates the FTS tables and their triggers if missing. False when SQLite was built without FTS5."""
+    for fts_table, content_table in FTS_TABLES.items():
+        statements = _ddl(fts_table, content_table)
+        try:
+            connection.execute(text(statements[0]))
+        except OperationalError as e:
+            print(f"FTS5 is not available in this SQLite build ({e}); activity search scans the string tables.")
+            return False
+        for statement in statements[1:]:
+            connection.execute(text(statement))
+    return True
+
+
+def exists(connection) -> bool:
+    found = connection.execute(text(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ('window_titles_fts', 'detailed_contexts_fts')"
+    )).scalar()
+    return found == len(FTS_TABLES)
+
+
+def rebuild(connection):
+    """Re-reads every string from the content tables into the FTS indexes, yielding after each table."""
+    for fts_table in FTS_TABLES:
+        connection.execute(text(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')"))
+        yield
+
+
+def parse_terms(query: str):
+    """
+    Splits a search into terms: whitespace-separated words, or "quoted phrases". A
+    trailing * makes a term a prefix search. Every term must match.
+    """
+    terms = []
+    for phrase, word in _TERM.findall(query or ""):
+        term = (phrase or word).strip()
+        if term and term != "*":
+            terms.append(term)
+    return terms
+
+
+def match_expression(terms) -> str:
+    """FTS5 MATCH text for terms, each quoted so punctuation like ABC-123 is searched literally."""
+    parts = []
+    for term in terms:
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        parts.append(f'"{term}"' + ("*" if prefix else ""))
+    return " AND ".join(parts)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.rstrip("*").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def matching_ids(terms, indexed: bool):
+    """(window title ids, detailed context ids) selects for strings matching every term."""
+    if indexed:
+        expression = match_expression(terms)
+        return tuple(
+            select(fts.c.rowid).where(literal_column(fts.name).op("MATCH")(expression))
+            for fts in (window_titles_fts, detailed_contexts_fts)
+        )
+    # Without the FTS index, a substring scan of the (much smaller) string tables
+    return tuple(
+        select(table.id).where(and_(*(table.value.like(_like_pattern(term), escape="\\") for term in terms)))
+        for table in (WindowTitle, DetailedContext)
+    )
+
+
+def log_filter(terms, indexed: bool):
+    """Filter for activity_logs whose window title or detailed context matches every term."""
+    title_ids, context_ids = matching_ids(terms, indexed)
+    return or_(ActivityLog.window_title_id.in_(title_ids), ActivityLog.detailed_context_id.in_(context_ids))
+
+
+def _clip_and_summarize(rows, start, end, now):
+    spans = []
+    summary = {"total_seconds": 0.0, "by_app": {}, "by_goal": {}, "by_day": {}}
+    for row in rows:
+        span_start = max(row.start_time, start) if start is not None else row.start_time
+        span_end = min(row.end_time or rollup.capped_end(row.start_time, now), end)
+        if span_end <= span_start:
+            continue
+        spans.append(row._replace(start_time=span_start, end_time=span_end))
+        seconds = (span_end - span_start).total_seconds()
+        summary["total_seconds"] += seconds
+        summary["by_app"][row.application_name] = summary["by_app"].get(row.application_name, 0) + seconds
+        summary["by_goal"][row.goal_id] = summary["by_goal"].get(row.goal_id, 0) + seconds
+        # Split at midnight (UTC, like the daily rollup) so each day gets its own share
+        day_start = span_start
+        while day_start < span_end:
+            next_day = datetime.datetime.combine(day_start.date() + datetime.timedelta(days=1), datetime.time.min)
+            day_end = min(next_day, span_end)
+            day = day_start.date()
+            summary["by_day"][day] = summary["by_day"].get(day, 0) + (day_end - day_start).total_seconds()
+            day_start = day_end
+    spans.sort(key=lambda span: (span.start_time, span.log_id))
+    return spans, summary
+
+
+def search(connection, query: str, start: datetime.datetime, end: datetime.datetime, now: datetime.datetime,
+           project_id: int = None, indexed: bool = False, spans_indexed: bool = False):
+    """
+    Spans whose log matches query and that overlap [start, end) (no lower bound when start
+    is None), clipped to the range with open spans ending at now (or MAX_SPAN_SECONDS
+    after their start), plus their durations in seconds by app, goal and day.
+    indexed/spans_indexed: the FTS and interval indexes are ready to use.
+    """
+    terms = parse_terms(query)
+    result = {"query": query, "spans": [], "total_seconds": 0.0, "by_app": {}, "by_goal": {}, "by_day": {}}
+    if not terms:
+        return result
+    match = log_filter(terms, indexed)
+    # A span starts at its log. Its end is looked up per log rather than joined: over
+    # attached archive months both tables are UNION ALL views, and SQLite cannot push a
+    # join condition into a compound view (it would scan every archived span per log)
+    span = ActivitySpan.log_id == ActivityLog.id
+    stmt = select(
+        ActivityLog.id, ActivityLog.timestamp, select(ActivitySpan.end_time).where(span).scalar_subquery(),
+        AppName.value, WindowTitle.value, ActivityLog.goal_id, ActivityLog.project_id
+    ).select_from(ActivityLog).outerjoin(
+        AppName, AppName.id == ActivityLog.app_name_id
+    ).outerjoin(
+        WindowTitle, WindowTitle.id == ActivityLog.window_title_id
+    ).where(match, ActivityLog.timestamp < end, select(ActivitySpan.log_id).where(span).exists())
+    if start is not None:
+        stmt = stmt.where(ActivityLog.timestamp >= start)
+    if project_id is not None:
+        stmt = stmt.where(ActivityLog.project_id == project_id)
+    rows = [fast_reads.SpanRecord(*row) for row in connection.execute(stmt)]
+
+    if start is not None:
+        # Spans that began before start but were still going then: at most one per project
+        running = {span.log_id: span for span in fast_reads.span_records_at(connection, start, project_id, spans_indexed)
+                   if span.start_time < start}
+        if running:
+            matching = connection.execute(select(ActivityLog.id).where(ActivityLog.id.in_(list(running)), match)).scalars()
+            rows.extend(running[log_id] for log_id in matching)
+
+    result["spans"], summary = _clip_and_summarize(rows, start, end, now)
+    result.update(summary)
+    return result
+
+
+def merge(query: str, results):
+    """Combines search() results from separate partitions (hot and archived months) into one."""
+    merged = {"query": query, "spans": [], "total_seconds": 0.0, "by_app": {}, "by_goal": {}, "by_day": {}}
+    for result in results:
+        merged["spans"].extend(result["spans"])
+        merged["total_seconds"] += result["total_seconds"]
+        for breakdown in ("by_app", "by_goal", "by_day"):
+            for key, seconds in result[breakdown].items():
+                merged[breakdown][key] = merged[breakdown].get(key, 0) + seconds
+    merged["spans"].sort(key=lambda span: (span.start_time, span.log_id))
+    return merged
@@ -8,6 +8,11 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir) # This assumes main.py is in src/
 sys.path.insert(0, project_root)
 
+from src.tracker import context_helper
+if context_helper.HELPER_FLAG in sys.argv: # The bundled app re-launched as the AppleScript helper
+    context_helper.main([])
+    sys.exit(0)
+
 from src.ui.main_window import App
 from src.database.database_handler import init_db #, get_active_goal, set_active_goal # Keep other imports if they were there
 # from src.tracker.app_tracker import get_active_application_info # Assuming this was commented out or not present before minimal test
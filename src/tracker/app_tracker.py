@@ -1,8 +1,11 @@
 from AppKit import NSWorkspace, NSRunningApplication
 from Quartz import CGWindowListCopyWindowInfo, kCGWindowListOptionOnScreenOnly, kCGNullWindowID, kCGWindowName
+from Quartz import CGEventSourceSecondsSinceLastEventType, kCGEventSourceStateCombinedSessionState, kCGAnyInputEventType
 import time
 import subprocess
 import shlex # For safely formatting commands
+from src.tracker.context_cache import ContextCache
+from src.tracker.context_helper import ContextHelper
 
 # Bundle Identifiers for common applications
 BUNDLE_ID_SAFARI = "com.apple.Safari"
@@ -14,8 +17,32 @@ BUNDLE_ID_PREVIEW = "com.apple.Preview"
 BUNDLE_ID_VSCODE = "com.microsoft.VSCode"
 # Add more as needed: Keynote, Pages, Numbers, Word, Excel, PowerPoint, etc.
 
+# Apps whose URL or document path is looked up (see _fetch_detailed_context)
+CONTEXT_BUNDLE_IDS = {BUNDLE_ID_SAFARI, BUNDLE_ID_CHROME, BUNDLE_ID_EDGE, BUNDLE_ID_FIREFOX, BUNDLE_ID_VSCODE,
+                      BUNDLE_ID_TEXTEDIT, BUNDLE_ID_PREVIEW}
+
+# Context lookups reused per (bundle id, window title); see src/tracker/context_cache.py
+context_cache = ContextCache()
+
+# Runs AppleScript in a long-lived helper process; see src/tracker/context_helper.py
+context_helper = ContextHelper()
+
 def run_applescript(script: str):
     """Executes an AppleScript string and returns its output or None on error."""
+    if not context_helper.broken:
+        result = context_helper.run(script)
+        if not context_helper.broken:
+            return result
+    return _run_osascript_process(script) # The helper cannot be started here, or keeps dying
+
+def shutdown_context_helper():
+    context_helper.stop()
+
+def get_context_helper_stats():
+    return context_helper.stats()
+
+def _run_osascript_process(script: str):
+    """One osascript process per call; only used when the context helper is unavailable."""
     try:
         # Using osascript -e for direct execution
         # Ensure script is properly escaped if it contains complex quotes, though shlex helps.
@@ -101,6 +128,37 @@ def get_active_window_title():
         # print(f"Error getting window title: {e}") # Can be noisy
         return None
 
+def _fetch_detailed_context(bundle_id: str, app_name: str):
+    """Looks up the URL or document path of the front window (one AppleScript run, usually)."""
+    detailed_context = None
+    if bundle_id == BUNDLE_ID_SAFARI:
+        detailed_context = get_safari_url()
+    elif bundle_id == BUNDLE_ID_CHROME:
+        detailed_context = get_chrome_url()
+    elif bundle_id == BUNDLE_ID_EDGE:
+        detailed_context = get_edge_url()
+    elif bundle_id == BUNDLE_ID_FIREFOX:
+        detailed_context = get_firefox_url() # Placeholder, likely returns None
+    elif bundle_id == BUNDLE_ID_VSCODE:
+        detailed_context = get_vscode_document_path()
+        if not detailed_context: # Fallback for VSCode if specific editor path fails
+             detailed_context = get_document_path_generic(app_name)
+    elif bundle_id in [BUNDLE_ID_TEXTEDIT, BUNDLE_ID_PREVIEW]:
+        # For Preview and TextEdit, and potentially other simple document apps
+        detailed_context = get_document_path_generic(app_name)
+    # Add more app-specific handlers here if needed (and to CONTEXT_BUNDLE_IDS)
+    # e.g., for Microsoft Office, Adobe suite, etc., if standard AppleScript works.
+    return detailed_context
+
+def set_context_cache_ttl(seconds: float):
+    """How long a looked-up URL/document path is reused while the window title stays the same (0 disables)."""
+    context_cache.ttl = seconds
+    context_cache.invalidate()
+
+def get_context_cache_stats():
+    """Hit/miss counters of the context cache, e.g. {'hits': 580, 'misses': 20, 'hit_rate': 0.97, ...}."""
+    return context_cache.stats()
+
 def get_active_application_info():
     """
     Gets information about the currently active application on macOS,
@@ -114,25 +172,10 @@ def get_active_application_info():
         bundle_id = active_app_ns.bundleIdentifier()
         window_title = get_active_window_title() or "N/A"
         detailed_context = None # URL or document path
+        if bundle_id in CONTEXT_BUNDLE_IDS:
+            detailed_context = context_cache.get(bundle_id, window_title,
+                                                 lambda: _fetch_detailed_context(bundle_id, app_name))
 
-        if bundle_id == BUNDLE_ID_SAFARI:
-            detailed_context = get_safari_url()
-        elif bundle_id == BUNDLE_ID_CHROME:
-            detailed_context = get_chrome_url()
-        elif bundle_id == BUNDLE_ID_EDGE:
-            detailed_context = get_edge_url()
-        elif bundle_id == BUNDLE_ID_FIREFOX:
-            detailed_context = get_firefox_url() # Placeholder, likely returns None
-        elif bundle_id == BUNDLE_ID_VSCODE:
-            detailed_context = get_vscode_document_path()
-            if not detailed_context: # Fallback for VSCode if specific editor path fails
-                 detailed_context = get_document_path_generic(app_name)
-        elif bundle_id in [BUNDLE_ID_TEXTEDIT, BUNDLE_ID_PREVIEW]:
-            # For Preview and TextEdit, and potentially other simple document apps
-            detailed_context = get_document_path_generic(app_name)
-        # Add more app-specific handlers here if needed
-        # e.g., for Microsoft Office, Adobe suite, etc., if standard AppleScript works.
-        
         return {
             "name": app_name,
             "bundle_identifier": bundle_id,
@@ -141,6 +184,10 @@ def get_active_application_info():
         }
     return None
 
+def get_idle_seconds():
+    """Seconds since the last keyboard, mouse or trackpad input in the user's session."""
+    return CGEventSourceSecondsSinceLastEventType(kCGEventSourceStateCombinedSessionState, kCGAnyInputEventType)
+
 def get_running_applications_info():
     """
     Gets information about all currently running applications on macOS.
@@ -169,6 +216,7 @@ if __name__ == "__main__":
                 print(f"Active App: {active_app_info['name']} ({active_app_info['bundle_identifier']})\n  Window: {active_app_info['window_title']}\n  Context: {active_app_info['detailed_context']}")
             else:
                 print("No active application found.")
+            print(f"Context cache: {get_context_cache_stats()}")
             print("---")
             time.sleep(5)
     except KeyboardInterrupt:
@@ -0,0 +1,168 @@
+import datetime
+import re
+
+# Sits between get_active_application_info() and the activity logger. A changed app/title
+# only becomes a log entry once it has been stable for the settle time; switches shorter
+# than that are folded into the surrounding span. Per-app rules strip the parts of window
+# titles that change constantly (timers, unread counters, playback positions) so they do
+# not count as switches at all.
+#
+# An unchanged window is logged again every heartbeat, so goal time keeps being credited
+# while the user stays put and the database can tell a gap (no logs for longer than
+# rollup.MAX_SPAN_SECONDS) from a long stretch in one window. A heartbeat is only logged
+# once there has been input after it was due, so it never lands after the moment the
+# user walked away. end() logs a marker (the idle app) at once, stamped with that
+# moment, closing the current span when tracking stops or the user is away.
+
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_HEARTBEAT_SECONDS = 5 * 60 # Must stay below rollup.MAX_SPAN_SECONDS
+
+_UNREAD_PREFIX = r"^\(\d+\+?\)\s*" # "(3) Inbox", as shown by browsers and mail clients
+
+# App name (case-insensitive) -> rule. "strip": regexes removed from the title before
+# comparing; "ignore_title"/"ignore_context": ignore that field entirely for the app.
+DEFAULT_APP_RULES = {
+    "*": {"strip": [_UNREAD_PREFIX]},
+    "Terminal": {"strip": [r"\d+[×x]\d+", r"\b\d{1,2}:\d{2}(:\d{2})?\b", r"[—-]\s*$"]},
+    "iTerm2": {"strip": [r"\d+[×x]\d+", r"\b\d{1,2}:\d{2}(:\d{2})?\b", r"\(\d+\)"]},
+    "Slack": {"strip": [r"^[*!]\s*", r"\s*[-|]\s*\d+ new items?", r"\(\d+\)"]},
+    "Microsoft Teams": {"strip": [r"\(\d+\)"]},
+    "Discord": {"strip": [r"^\(\d+\)\s*", r"^•\s*"]},
+    "Mail": {"strip": [r"\(\d+ (unread|messages?)\)", r"\d+ (unread|messages?)"]},
+    "QuickTime Player": {"strip": [r"\b\d{1,2}:\d{2}(:\d{2})?\b"]},
+    "VLC": {"strip": [r"\b\d{1,2}:\d{2}(:\d{2})?\b"]},
+    "IINA": {"strip": [r"\b\d{1,2}:\d{2}(:\d{2})?\b"]},
+    "Spotify": {"ignore_title": True}, # Title is the current track
+    "Music": {"ignore_title": True},
+    "Clock": {"ignore_title": True},
+}
+
+
+def _utcnow():
+    # Naive UTC, like the timestamps in activity_logs
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _compile_rules(rules):
+    compiled = {}
+    for app, rule in rules.items():
+        compiled[app.lower()] = {
+            "strip": [re.compile(pattern) for pattern in rule.get("strip", ())],
+            "ignore_title": rule.get("ignore_title", False),
+            "ignore_context": rule.get("ignore_context", False),
+        }
+    return compiled
+
+
+class ActivityCoalescer:
+    """
+    observe() takes one tracker sample per tick and returns the samples that should be
+    logged now, stamped with the time their span actually started. A sample differing
+    from the last logged one becomes a candidate; it is logged once it has lasted
+    settle_seconds, and dropped (its time stays with the previous span) if the window
+    changes again before that. Goal changes and the first sample are logged at once, and
+    the logged sample is logged again once it has lasted heartbeat_seconds (0 disables),
+    stamped when it was due, as soon as a sample shows input after that (idle_seconds:
+    seconds since the last input, as passed to end()).
+    """
+
+    def __init__(self, settle_seconds: float = DEFAULT_SETTLE_SECONDS, rules: dict = None, clock=_utcnow,
+                 heartbeat_seconds: float = DEFAULT_HEARTBEAT_SECONDS):
+        self.settle = datetime.timedelta(seconds=max(0.0, settle_seconds))
+        self.heartbeat = datetime.timedelta(seconds=max(0.0, heartbeat_seconds or 0))
+        self.rules = _compile_rules(dict(DEFAULT_APP_RULES, **(rules or {})))
+        self.clock = clock
+        self._logged_key = None
+        self._logged_at = None # Timestamp of the last logged sample
+        self._candidate = None # (key, first seen at, sample)
+        self.observed_count = 0
+        self.logged_count = 0
+        self.merged_count = 0 # Candidates dropped because they did not last the settle time
+        self.heartbeat_count = 0
+
+    def normalize_title(self, app_name: str, window_title: str) -> str:
+        rule = self.rules.get((app_name or "").lower())
+        if rule and rule["ignore_title"]:
+            return ""
+        title = window_title or ""
+        for current in (self.rules.get("*"), rule):
+            for pattern in (current or {}).get("strip", ()):
+                title = pattern.sub("", title)
+        return " ".join(title.split())
+
+    def _key(self, sample):
+        app_name = sample.get("app_name")
+        rule = self.rules.get((app_name or "").lower())
+        context = None if rule and rule["ignore_context"] else sample.get("detailed_context")
+        if app_name in ("None", "N/A"):
+            app_name = "N/A" # Both mean nothing is in front
+        return (sample.get("goal_id"), app_name, self.normalize_title(app_name, sample.get("window_title")), context)
+
+    def _log(self, key, sample, started_at):
+        self._logged_key = key
+        self._logged_at = started_at
+        self._candidate = None
+        self.logged_count += 1
+        return [dict(sample, timestamp=started_at)]
+
+    def observe(self, goal_id, project_id, app_name: str, window_title: str, detailed_context: str = None, now=None,
+                idle_seconds: float = 0.0):
+        """Returns a list (usually empty) of samples to log, each with a timestamp key."""
+        now = now or self.clock()
+        last_input = now - datetime.timedelta(seconds=max(0.0, idle_seconds))
+        self.observed_count += 1
+        sample = {"goal_id": goal_id, "project_id": project_id, "app_name": app_name,
+                  "window_title": window_title, "detailed_context": detailed_context}
+        key = self._key(sample)
+
+        if key == self._logged_key:
+            if self._candidate is not None: # Flapped back before the candidate settled
+                self.merged_count += 1
+                self._candidate = None
+            due = self._logged_at + self.heartbeat
+            if self.heartbeat and last_input > due:
+                self.heartbeat_count += 1
+                return self._log(key, sample, due)
+            return []
+        if self._logged_key is None or key[0] != self._logged_key[0] or not self.settle:
+            return self._log(key, sample, now)
+
+        if self._candidate is not None and self._candidate[0] == key:
+            _, since, first_sample = self._candidate
+            if now - since >= self.settle:
+                return self._log(key, first_sample, since)
+            return []
+        if self._candidate is not None:
+            self.merged_count += 1
+        self._candidate = (key, now, sample)
+        return []
+
+    def end(self, goal_id, project_id, app_name: str, idle_seconds: float = 0.0, now=None):
+        """
+        Logs a marker sample for app_name (the idle app) at once, stamped idle_seconds ago
+        but not before the last logged sample (heartbeats never come after the last
+        input), unless the marker is already the last logged sample. A pending candidate
+        is dropped. Returns a list like observe().
+        """
+        now = now or self.clock()
+        sample = {"goal_id": goal_id, "project_id": project_id, "app_name": app_name,
+                  "window_title": "", "detailed_context": None}
+        key = self._key(sample)
+        if key == self._logged_key:
+            return []
+        if self._candidate is not None:
+            self.merged_count += 1
+        started_at = now - datetime.timedelta(seconds=max(0.0, idle_seconds))
+        if self._logged_at is not None:
+            started_at = max(started_at, self._logged_at)
+        return self._log(key, sample, started_at)
+
+    def reset(self):
+        """Forgets the last logged sample, so the next observation is logged at once."""
+        self._logged_key = None
+        self._logged_at = None
+        self._candidate = None
+
+    def stats(self):
+        return {"observed": self.observed_count, "logged": self.logged_count, "merged": self.merged_count,
+                "heartbeats": self.heartbeat_count}
@@ -0,0 +1,66 @@
+import collections
+import time
+
+# Remembers the URL / document path that get_active_application_info() fetched for a
+# window. Fetching it runs an AppleScript per tick, but it only
+# changes when the window's title does (a new page or document retitles the window), so
+# the result is reused for the same (bundle id, window title) until the TTL expires.
+# The TTL bounds how long a change that keeps the title (e.g. two pages with the same
+# title in one tab) can go unnoticed.
+
+DEFAULT_CONTEXT_TTL = 30.0 # seconds
+DEFAULT_MAX_ENTRIES = 256 # Windows remembered, so switching back to one is still a hit
+
+_MISSING = object()
+
+
+class ContextCache:
+    """
+    get(bundle_id, window_title, fetch) returns the cached context for the window, or
+    calls fetch() and caches its result (None included, so apps that refuse the lookup
+    are not asked every tick either). Without a window title (no screen recording
+    permission) changes cannot be detected, so fetch() is always called.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_CONTEXT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.clock = clock
+        self._entries = collections.OrderedDict() # (bundle id, title) -> (fetched at, context), oldest first
+        self.hits = 0
+        self.misses = 0 # Not cached, or cached for longer than the TTL
+        self.uncacheable = 0 # Fetched without a window title to key on
+
+    def get(self, bundle_id: str, window_title: str, fetch):
+        if not window_title or window_title == "N/A" or not self.ttl or self.ttl <= 0:
+            self.uncacheable += 1
+            return fetch()
+        key = (bundle_id, window_title)
+        now = self.clock()
+        fetched_at, context = self._entries.get(key, (None, _MISSING))
+        if context is not _MISSING and now - fetched_at < self.ttl:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return context
+        self.misses += 1
+        context = fetch()
+        self._entries[key] = (now, context)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return context
+
+    def invalidate(self, bundle_id: str = None):
+        """Forgets every entry, or those of one app."""
+        if bundle_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == bundle_id]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "uncacheable": self.uncacheable,
+            "hit_rate": self.hits / lookups if lookups else 0.0, "entries": len(self._entries), "ttl": self.ttl,
+        }
@@ -0,0 +1,230 @@
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# A long-lived helper process that runs the tracker's AppleScript context queries, so a
+# lookup costs one line written to a pipe instead of an osascript process spawn.
+#
+# Protocol: one JSON object per line in each direction. The tracker sends
+# {"id": n, "script": "..."}; the helper answers {"id": n, "result": str or null,
+# "error": str or null}, in order. Requests have a deadline on the tracker's side: a
+# helper that misses one (an app not answering its Apple Events) is killed, and the
+# next request starts a fresh one, as it does when the helper died.
+#
+# The helper is this file run as a script. On macOS it runs scripts in-process through
+# NSAppleScript (from pyobjc, already a dependency), compiling each distinct script
+# once; elsewhere, or if that import fails, it falls back to osascript. With --echo it
+# is a stand-in that answers every script with its own text, for exercising the
+# transport on machines without AppleScript.
+
+DEFAULT_REQUEST_TIMEOUT = 2.0 # seconds, like the osascript timeout it replaces
+RESTART_BACKOFF = 1.0 # Minimum seconds between helper starts, so a crashing helper cannot spin
+MAX_DEAD_STARTS = 3 # Helpers in a row that exit before answering anything; then the helper counts as broken
+HELPER_FLAG = "--context-helper" # Runs the helper from a frozen app's executable (see src/main.py)
+
+
+# --- Helper side ---
+
+def _osascript(script: str):
+    process = subprocess.run(["osascript", "-e", script], capture_output=True, text=True, timeout=DEFAULT_REQUEST_TIMEOUT)
+    if process.returncode == 0:
+        return process.stdout.strip() or None, None
+    return None, process.stderr.strip() or f"osascript exited with {process.returncode}"
+
+
+def _apple_script_runner():
+    try:
+        from Foundation import NSAppleScript
+    except ImportError:
+        return _osascript
+    compiled = {}
+
+    def run(script: str):
+        apple_script = compiled.get(script)
+        if apple_script is None:
+            apple_script = compiled[script] = NSAppleScript.alloc().initWithSource_(script)
+        result, error = apple_script.executeAndReturnError_(None)
+        if result is None:
+            return None, str(error.get("NSAppleScriptErrorMessage", error)) if error else "AppleScript failed"
+        return result.stringValue(), None
+    return run
+
+
+def serve(stdin=None, stdout=None, run_script=None):
+    """Answers requests from stdin until it is closed."""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    run_script = run_script or _apple_script_runner()
+    for line in stdin:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request["id"]
+            result, error = run_script(request["script"])
+        except Exception as e: # Never let one bad request end the helper
+            result, error = None, f"{type(e).__name__}: {e}"
+        stdout.write(json.dumps({"id": request_id, "result": result, "error": error}) + "\n")
+        stdout.flush()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    serve(run_script=(lambda script: (script, None)) if "--echo" in argv else None)
+
+
+# --- Tracker side ---
+
+def default_command():
+    if getattr(sys, "frozen", False): # PyInstaller bundle: the app executable runs the helper
+        return [sys.executable, HELPER_FLAG]
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+class ContextHelper:
+    """
+    Client for the helper process. run(script) returns the script's output, or None on
+    error or when the deadline passes. Safe to call from several threads; requests are
+    answered one at a time. Counters: requests, errors, timeouts, starts. broken is set
+    when the helper cannot be started at all, or exits before answering MAX_DEAD_STARTS
+    times in a row (a bad interpreter or a broken bundle); callers can fall back to
+    osascript.
+    """
+
+    def __init__(self, command=None, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        self.command = command or default_command()
+        self.timeout = timeout
+        self._process = None
+        self._lock = threading.Lock() # Serializes requests and restarts
+        self._ids = itertools.count(1)
+        self._responses = {} # id -> response, filled by the reader thread
+        self._response_ready = threading.Condition()
+        self._last_start = None
+        self._answered = False # The current helper has answered a request
+        self._dead_starts = 0
+        self.broken = False
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.starts = 0
+
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self) -> bool:
+        if self._last_start is not None and time.monotonic() - self._last_start < RESTART_BACKOFF:
+            return False
+        self._last_start = time.monotonic()
+        try:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        except OSError as e:
+            print(f"Could not start the context helper: {e}")
+            self.broken = True
+            return False
+        self._process = process
+        self._answered = False
+        self.starts += 1
+        threading.Thread(target=self._read, args=(process,), name="ContextHelperReader", daemon=True).start()
+        return True
+
+    def _read(self, process):
+        try:
+            for line in process.stdout:
+                try:
+                    response = json.loads(line)
+                except ValueError:
+                    continue
+                with self._response_ready:
+                    self._responses[response.get("id")] = response
+                    self._response_ready.notify_all()
+        except (OSError, ValueError):
+            pass
+        finally:
+            process.stdout.close()
+        with self._response_ready: # Wake a waiting request: its helper is gone
+            self._response_ready.notify_all()
+
+    def _exited(self):
+        # The current helper is gone; counts it if it never answered
+        if self._answered:
+            return
+        self._dead_starts += 1
+        if self._dead_starts >= MAX_DEAD_STARTS and not self.broken:
+            print(f"The context helper exited {self._dead_starts} times in a row before answering; not restarting it.")
+            self.broken = True
+
+    def _kill(self):
+        process, self._process = self._process, None
+        with self._response_ready:
+            self._responses.clear() # Late answers to abandoned requests
+        if process is None:
+            return
+        try:
+            process.kill()
+            process.wait(1)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        try:
+            process.stdin.close() # stdout is closed by its reader thread
+        except OSError:
+            pass
+
+    def run(self, script: str, timeout: float = None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self.requests += 1
+            if not self.is_running():
+                if self._process is not None:
+                    self._exited()
+                self._kill()
+                if self.broken or not self._start():
+                    self.errors += 1
+                    return None
+            request_id = next(self._ids)
+            process = self._process
+            try:
+                process.stdin.write(json.dumps({"id": request_id, "script": script}) + "\n")
+                process.stdin.flush()
+            except (OSError, ValueError): # Broken pipe: the helper just died
+                self.errors += 1
+                self._exited()
+                self._kill()
+                return None
+            with self._response_ready:
+                while request_id not in self._responses:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or process.poll() is not None:
+                        break
+                    self._response_ready.wait(remaining)
+                response = self._responses.pop(request_id, None)
+            if response is None:
+                if process.poll() is None:
+                    self.timeouts += 1 # Stuck on this script; the next request gets a new helper
+                else:
+                    self.errors += 1
+                    self._exited()
+                self._kill()
+                return None
+            self._answered = True
+            self._dead_starts = 0
+            if response.get("error"):
+                self.errors += 1
+            return response.get("result")
+
+    def stop(self):
+        with self._lock:
+            self._kill()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors, "timeouts": self.timeouts, "starts": self.starts,
+                "running": self.is_running(), "broken": self.broken}
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,16 @@ from datetime import date as dt_date, timedelta, datetime as dt_datetime # For s
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.dates as mdates # For formatting time on axis
-from src.tracker.app_tracker import get_active_application_info
+from src.tracker.app_tracker import get_active_application_info, get_idle_seconds, get_context_cache_stats, shutdown_context_helper
+from src.tracker.coalescer import ActivityCoalescer
 from src.llm.llm_handler import get_llm_handler
 from src.database.database_handler import (
-    init_db, add_project, get_all_projects, get_project_by_id,
-    add_goal, get_goals_for_project, set_active_goal, get_active_goal, complete_goal, Goal, get_goal_by_id,
-    add_activity_log, get_aggregated_activity_by_app, get_activity_logs_for_day, update_goal_time # Import new function
+    init_db, replay_activity_journal, add_project, get_project_by_id,
+    add_goal, set_active_goal, get_active_goal, complete_goal, Goal, get_goal_by_id,
+    enqueue_activity, shutdown_activity_writer, dump_query_stats, start_backup_job, request_backup, get_backup_status, shutdown_backup_job, get_aggregated_activity_by_app, get_aggregated_activity_by_project,
+    get_project_records, get_goal_records_for_project, get_goal_records_for_active_projects, get_activity_spans_for_day # Lightweight reads
 )
+from src.database.rollup import IDLE_APP_NAME # Logged when tracking stops or the user is away
 from src.utils.screenshot_utils import capture_active_window_to_temp_file # Import for screenshot
 import threading
 import time
@@ -107,6 +110,7 @@ class App(ctk.CTk):
 
         try:
             init_db()
+            replay_activity_journal() # Records a crashed session queued but never committed
             print("Database initialized successfully from App.")
         except Exception as e:
             messagebox.showerror("Database Error", f"Database initialization failed: {e}\nApplication might not work correctly.")
@@ -131,6 +135,14 @@ class App(ctk.CTk):
         self.analyze_window_button = ctk.CTkButton(self.top_frame, text="Analyze Window Content (Screenshot)", command=lambda: self.analyze_window_content_action_mtmd())
         self.analyze_window_button.pack(pady=5)
 
+        # Database backups (online snapshots, see src/database/backup.py)
+        self.backup_frame = ctk.CTkFrame(self.top_frame, fg_color="transparent")
+        self.backup_frame.pack(pady=(0, self.PAD_Y/2))
+        self.backup_button = ctk.CTkButton(self.backup_frame, text="Back Up Now", width=110, command=self.backup_now_action)
+        self.backup_button.pack(side="left", padx=self.PAD_X/2)
+        self.backup_status_label = ctk.CTkLabel(self.backup_frame, text="Backup: ...", font=ctk.CTkFont(size=11))
+        self.backup_status_label.pack(side="left", padx=self.PAD_X/2)
+
         # --- Tab View ---
         # TabView will now hold Dashboard, Goals, and Feedback sections.
         # It should expand to fill most of the window.
@@ -390,10 +402,9 @@ class App(ctk.CTk):
         self.last_window_title_for_ui = ""
         self.last_detailed_context_for_ui = "N/A"
         
-        self.last_logged_app_name = ""
-        self.last_logged_window_title = ""
-        self.last_logged_detailed_context = ""
-        self.last_logged_goal_id = None
+        # Debounces tracker samples before they are logged (see src/tracker/coalescer.py)
+        self.activity_coalescer = ActivityCoalescer()
+        self.IDLE_THRESHOLD_SECONDS = 5 * 60 # No input for this long ends the current activity span
         
         self.current_feedback_frequency_seconds = self.feedback_frequency_map[self.feedback_frequency_var.get()]
         self.current_feedback_type = self.feedback_type_var.get()
@@ -407,6 +418,8 @@ class App(ctk.CTk):
         # self.app_tracker_thread = threading.Thread(target=self.update_active_app_display_and_log_activity, daemon=True) # REMOVED
         # self.app_tracker_thread.start() # REMOVED
         self.after(1000, self.update_active_app_display_and_log_activity) # ADDED - Start the loop in the main thread
+        start_backup_job() # Scheduled snapshots run on their own thread
+        self.after(2000, self.refresh_backup_status)
 
         self.llm_thread = None # Will be initialized after LLM handler is ready
         self.initialize_llm_handler_and_loop()
@@ -458,10 +471,6 @@ class App(ctk.CTk):
                                            corner_radius=self.CORNER_RADIUS)
         self.dismiss_button.pack(side="right", padx=self.PAD_X)
 
-        # Add time tracking variables
-        self.last_time_update = None
-        self.current_goal_start_time = None
-
     def set_viz_date_to_today(self):
         today_str = dt_date.today().strftime("%Y-%m-%d")
         self.viz_date_entry.delete(0, ctk.END)
@@ -499,7 +508,7 @@ class App(ctk.CTk):
     def populate_goals_tab_project_filter(self, selected_project_name_for_filter = None):
         """Populates the project filter combobox on the Goals tab."""
         print("Populating Goals tab project filter...")
-        projects = get_all_projects() # Assuming this returns Project objects
+        projects = get_project_records() # Lightweight (id, name, is_archived) records
         project_names = ["All Projects"]
         if projects:
             project_names.extend([p.name for p in projects])
@@ -526,7 +535,7 @@ class App(ctk.CTk):
 
         print(f"Refreshing Goals Tab: Project Filter='{selected_project_name_filter}', Status Filter='{selected_status_filter}'")
 
-        all_db_projects = get_all_projects(include_archived=True) # Get all projects for goal association
+        all_db_projects = get_project_records(include_archived=True) # Get all projects for goal association
         project_id_to_name_map = {p.id: p.name for p in all_db_projects}
         
         target_project_id = None
@@ -549,16 +558,12 @@ class App(ctk.CTk):
         goals_to_display = []
         if target_project_id:
             # Fetch goals only for the specific project
-            project_goals = get_goals_for_project(target_project_id, include_completed=True)
+            project_goals = get_goal_records_for_project(target_project_id, include_completed=True)
             if project_goals:
                 goals_to_display.extend(project_goals)
         else:
-            # Fetch goals for all projects
-            for p in all_db_projects:
-                if not p.is_archived: # Typically, don't show goals from archived projects unless specified
-                    project_goals = get_goals_for_project(p.id, include_completed=True)
-                    if project_goals:
-                        goals_to_display.extend(project_goals)
+            # Fetch goals for all projects in one query. Typically, don't show goals from archived projects unless specified
+            goals_to_display.extend(get_goal_records_for_active_projects())
         
         # Now filter by status
         filtered_goals = []
@@ -682,7 +687,7 @@ class App(ctk.CTk):
     def load_projects(self):
         """Loads projects for the Dashboard's project selector."""
         print("Loading projects for Dashboard selector...")
-        projects = get_all_projects()
+        projects = get_project_records()
         self.projects_map.clear() # name -> id map for dashboard
         project_names_for_dashboard_selector = []
         if projects:
@@ -730,10 +735,6 @@ class App(ctk.CTk):
         print(f"Attempting to set global active goal ID: {goal_id}")
         updated_goal = set_active_goal(goal_id)
         if updated_goal:
-            # Reset time tracking for the new active goal
-            self.current_goal_start_time = dt_datetime.now()
-            self.last_time_update = dt_datetime.now()
-            
             self.load_and_display_globally_active_goal()
             if self.current_project_id and self.current_project_id == updated_goal.project_id:
                 self.load_goals_for_project(self.current_project_id)
@@ -802,7 +803,7 @@ class App(ctk.CTk):
             ctk.CTkLabel(self.goals_list_frame, text=f"Project '{project.name}' is archived.\nNo goals shown here.").pack(pady=5)
             return
 
-        goals = get_goals_for_project(project_id, include_completed=True)
+        goals = get_goal_records_for_project(project_id, include_completed=True)
         if not goals:
             ctk.CTkLabel(self.goals_list_frame, text="No goals yet for this project.").pack(pady=5)
             return
@@ -914,22 +915,15 @@ class App(ctk.CTk):
             self.globally_active_goal_project_id = active_goal_obj.project_id 
             self.active_goal_display_label.configure(text=f"Active Goal for Feedback: {active_goal_obj.text}")
             print(f"Loaded globally active goal: '{active_goal_obj.text}' (Project ID: {self.globally_active_goal_project_id})")
-            
-            if self.last_logged_goal_id != self.globally_active_goal_id:
-                self.last_logged_app_name = ""
-                self.last_logged_window_title = ""
-                self.last_logged_detailed_context = ""
-                self.last_logged_goal_id = self.globally_active_goal_id
+            # A different goal is logged on the next tick without waiting for the settle time
         else:
+            self._end_activity_span() # Nothing is tracked from here on
             self.globally_active_goal_id = None
             self.globally_active_goal_text = "None"
             self.globally_active_goal_project_id = None
             self.active_goal_display_label.configure(text="Active Goal for Feedback: None")
             print("No globally active goal found.")
-            self.last_logged_app_name = ""
-            self.last_logged_window_title = ""
-            self.last_logged_detailed_context = ""
-            self.last_logged_goal_id = None
+            self.activity_coalescer.reset()
         
         # After loading active goal, all goal lists should refresh to reflect new status
         if hasattr(self, 'goals_list_frame') and self.current_project_id: # If dashboard is initialized
@@ -942,16 +936,7 @@ class App(ctk.CTk):
             self.after(1000, self.update_active_app_display_and_log_activity)
             return
 
-        # Update time tracking for active goal
-        current_time = dt_datetime.now()
-        if self.globally_active_goal_id and self.current_goal_start_time:
-            if self.last_time_update:
-                minutes_elapsed = (current_time - self.last_time_update).total_seconds() / 60
-                if minutes_elapsed >= 1:  # Only update if at least 1 minute has passed
-                    update_goal_time(self.globally_active_goal_id, int(minutes_elapsed))
-                    self.last_time_update = current_time
-            else:
-                self.last_time_update = current_time
+        # Goal time is credited from the logged activity spans by the database writer (see goal_time.py)
 
         active_info = get_active_application_info()
 
@@ -985,45 +970,47 @@ class App(ctk.CTk):
         # --- Activity Logging Logic ---
         goal_id_to_log = self.globally_active_goal_id
         
-        # Determine if a log should occur
-        should_log = False
         if goal_id_to_log is not None:
-            if (app_name != self.last_logged_app_name or
-                window_title != self.last_logged_window_title or
-                detailed_context != self.last_logged_detailed_context or
-                goal_id_to_log != self.last_logged_goal_id):
-                
-                if not (app_name in ["None", "N/A"] and self.last_logged_app_name in ["None", "N/A"]):
-                    should_log = True
-        
-        if should_log:
             project_id_to_log = self.globally_active_goal_project_id
 
-            if goal_id_to_log and project_id_to_log is None:
+            if project_id_to_log is None:
                 active_goal_obj = get_goal_by_id(goal_id_to_log)
                 if active_goal_obj:
                     project_id_to_log = active_goal_obj.project_id
             
-            if goal_id_to_log and project_id_to_log:
-                add_activity_log(
-                    goal_id=goal_id_to_log,
-                    project_id=project_id_to_log,
-                    app_name=app_name,
-                    window_title=window_title,
-                    detailed_context=detailed_context
-                )
-                print(f"Logging activity: App: {app_name}, Win: {window_title}, Ctx: {detailed_context} for Goal ID {goal_id_to_log} (Project ID: {project_id_to_log})")
-            else:
-                print(f"Skipping log: App: {app_name}, Win: {window_title}. Active Goal ID: {goal_id_to_log}, Project ID for Goal: {project_id_to_log} (might be missing).")
-
-            self.last_logged_app_name = app_name
-            self.last_logged_window_title = window_title
-            self.last_logged_detailed_context = detailed_context
-            self.last_logged_goal_id = goal_id_to_log
+            if project_id_to_log:
+                idle_seconds = get_idle_seconds()
+                if idle_seconds >= self.IDLE_THRESHOLD_SECONDS:
+                    # Away from the machine: the current span ends at the last input
+                    samples = self.activity_coalescer.end(goal_id_to_log, project_id_to_log, IDLE_APP_NAME, idle_seconds)
+                else:
+                    # Only switches that outlast the settle time come out, stamped with when they began
+                    samples = self.activity_coalescer.observe(goal_id_to_log, project_id_to_log, app_name, window_title,
+                                                             detailed_context, idle_seconds=idle_seconds)
+                self._log_activity_samples(samples)
         
         # Reschedule this method to run again
         self.after(1000, self.update_active_app_display_and_log_activity)
 
+    def _log_activity_samples(self, samples):
+        for sample in samples:
+            # Queued for the background writer so the tick never waits on a commit
+            enqueue_activity(
+                goal_id=sample["goal_id"],
+                project_id=sample["project_id"],
+                app_name=sample["app_name"],
+                window_title=sample["window_title"],
+                detailed_context=sample["detailed_context"],
+                timestamp=sample["timestamp"]
+            )
+            print(f"Logging activity: App: {sample['app_name']}, Win: {sample['window_title']}, Ctx: {sample['detailed_context']} for Goal ID {sample['goal_id']} (Project ID: {sample['project_id']})")
+
+    def _end_activity_span(self):
+        # Logs the idle marker for the active goal, so the span in progress is credited up to now and no further
+        if self.globally_active_goal_id is not None and self.globally_active_goal_project_id:
+            self._log_activity_samples(self.activity_coalescer.end(
+                self.globally_active_goal_id, self.globally_active_goal_project_id, IDLE_APP_NAME))
+
     def llm_interaction_loop(self):
         # Initial status update
         try:
@@ -1266,16 +1253,41 @@ class App(ctk.CTk):
                 except OSError as e_del_outer:
                     print(f"Error deleting temp screenshot on outer error {screenshot_path}: {e_del_outer}")
 
+    def backup_now_action(self):
+        request_backup()
+        self.backup_status_label.configure(text="Backup: starting...")
+
+    def refresh_backup_status(self):
+        status = get_backup_status()
+        if status["state"] == "running":
+            percent = 100 * status["pages_copied"] / status["page_count"] if status["page_count"] else 0
+            text = f"Backup: running ({percent:.0f}%)"
+        elif status["state"] == "failed":
+            text = f"Backup: failed - {str(status['last_error'])[:60]}"
+        elif status["snapshots"]:
+            text = f"Backup: last {os.path.basename(status['snapshots'][-1])}"
+        else:
+            text = "Backup: none yet"
+        self.backup_status_label.configure(text=text)
+        if self.tracking_active:
+            self.after(2000, self.refresh_backup_status)
+
     def on_closing(self):
         print("Application closing...")
         self.tracking_active = False
         # Give threads a moment to finish their current loop iteration
         if hasattr(self, 'llm_thread') and self.llm_thread.is_alive():
             self.llm_thread.join(timeout=2.0)
+        shutdown_backup_job() # Cancels a snapshot in progress; its partial file is removed
+        self._end_activity_span() # The time until the next launch is not tracked
+        shutdown_activity_writer() # Commit any activity still buffered in memory
+        dump_query_stats() # Inspect with: python -m src.database.manage query-stats
+        print(f"Context lookup cache: {get_context_cache_stats()}")
+        shutdown_context_helper()
         self.destroy()
 
     def populate_viz_project_selector(self):
-        projects = get_all_projects()
+        projects = get_project_records()
         # Ensure "All Projects" is always an option
         project_names = ["All Projects"] + [p.name for p in projects if not p.is_archived] 
         # self.projects_map_viz = {p.name: p.id for p in projects if not p.is_archived} # Store IDs too
@@ -1343,7 +1355,7 @@ class App(ctk.CTk):
             # Need to get project_id from project_name. Assuming projects_map is populated.
             # For simplicity, re-fetch all projects to create a temporary map if projects_map_viz is not robustly maintained.
             # A better approach would be to ensure self.projects_map_viz is always up-to-date.
-            projects = get_all_projects()
+            projects = get_project_records()
             temp_projects_map = {p.name: p.id for p in projects}
             project_id_to_viz = temp_projects_map.get(selected_project_name)
             if not project_id_to_viz:
@@ -1362,9 +1374,10 @@ class App(ctk.CTk):
                 self.canvas.draw()
                 return
 
-            logs = get_activity_logs_for_day(target_date=target_date, project_id=project_id_to_viz)
+            # Each span has an explicit start and end, already clipped to the day
+            spans = get_activity_spans_for_day(target_date=target_date, project_id=project_id_to_viz)
 
-            if not logs:
+            if not spans:
                 self.ax.set_title(f"No activity logged for {target_date.strftime('%Y-%m-%d')}", color=text_color)
                 self.ax.set_xlabel("Time of Day", color=text_color)
                 self.ax.set_yticks([]) # No apps to show
@@ -1377,42 +1390,16 @@ class App(ctk.CTk):
                 self.canvas.draw()
                 return
 
-            # Process logs for timeline view
             app_activity_blocks = []
-            for i in range(len(logs)):
-                current_log = logs[i]
-                start_time = current_log.timestamp
-                # Determine end time
-                if i < len(logs) - 1:
-                    end_time = logs[i+1].timestamp
-                else:
-                    # For the last log, assume it lasts until the next log would have been, or a fixed small duration.
-                    # For a daily timeline, it could extend to the end of its logged minute, or a default duration if too short.
-                    # A simple way: extend to end of the day, or if too long, cap it.
-                    # For now, let's assume activity duration is until the next log. The last log's duration isn't explicitly defined by this model.
-                    # A better approach: Each log represents a *change* of activity. So current log is active until next log.
-                    # End of day for the last activity for that day.
-                    end_time = dt_datetime.combine(target_date, dt_datetime.max.time())
-                    # Cap duration if next log is on a different day (should not happen with get_activity_logs_for_day)
-                    if end_time.date() > target_date:
-                         end_time = dt_datetime.combine(target_date, dt_datetime.max.time())
-                
-                # If current_log and next log are too close, they might represent the same continuous activity block that was just re-logged.
-                # For a simple timeline, each distinct log entry is a block. Refinements can merge these later.
-                duration_seconds = (end_time - start_time).total_seconds()
-                if duration_seconds <= 0 and i < len(logs) -1 : # if not the last log
-                    # if a log has 0 duration and it's not the last one, likely it's a quick switch.
-                    # give it a minimum visual duration, e.g. 1 minute, so it's visible
-                    end_time = start_time + timedelta(seconds=60)
-                elif duration_seconds <=0 and i == len(logs) -1: # last log of the day with zero/negative duration from EOD calc
-                    end_time = start_time + timedelta(seconds=60) # give it min 1 min duration
-
-
+            for span in spans:
+                end_time = span.end_time
+                if end_time <= span.start_time:
+                    end_time = span.start_time + timedelta(seconds=60) # Give zero-length spans a visible width
                 app_activity_blocks.append({
-                    "app": current_log.application_name,
-                    "start": start_time,
+                    "app": span.application_name,
+                    "start": span.start_time,
                     "end": end_time,
-                    "title": current_log.window_title
+                    "title": span.window_title
                 })
 
             # Create the timeline plot (Gantt-like)
@@ -1464,21 +1451,14 @@ class App(ctk.CTk):
                 messagebox.showwarning("Project Error", f"Project '{selected_project_name}' not found for aggregated view. Showing for all projects.")
             
             # Convert date objects to datetime objects for the database function call
+            # get_aggregated expects inclusive start, exclusive end. Keeping both on midnight lets
+            # it answer from the daily usage rollup instead of rescanning the raw activity log.
             start_datetime_param = dt_datetime.combine(start_date_param, dt_datetime.min.time())
-            end_datetime_param = dt_datetime.combine(end_date_param, dt_datetime.min.time()) # end_date is exclusive in some queries, or inclusive for others. get_aggregated expects inclusive start, exclusive end.
-                                                                                          # For simplicity let's use end of selected day.
-            end_datetime_param = dt_datetime.combine(today, dt_datetime.max.time()) # ensure it covers the entirety of the last day included in the period.
+            end_datetime_param = dt_datetime.combine(end_date_param, dt_datetime.min.time())
 
             if selected_project_name == "All Projects":
-                # Aggregate across all projects
-                all_projects_data = get_all_projects()
-                aggregated_data = {}
-                for p in all_projects_data:
-                    if not p.is_archived:
-                        project_data = get_aggregated_activity_by_app(p.id, start_datetime_param, end_datetime_param)
-                        for app, duration in project_data.items():
-                            aggregated_data[app] = aggregated_data.get(app, 0) + duration
-                app_durations = aggregated_data
+                # Aggregate across all non-archived projects in a single query
+                app_durations = get_aggregated_activity_by_project(start_datetime_param, end_datetime_param)["by_app"]
                 title += " (All Projects)"
             elif project_id_to_viz:
                 app_durations = get_aggregated_activity_by_app(project_id_to_viz, start_datetime_param, end_datetime_param)